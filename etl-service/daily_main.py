@@ -8,6 +8,7 @@ from src.daily.daily_market_cap import DailyMcapManager, DailyMcapFxConverter
 from src.daily.daily_forex import DailyForexManager
 from src.historical.historical_forex_full import FullForexManager
 from src.historical.etl_summary import ETLSummaryManager
+from src.historical.quarterly_snapshot import QuarterlySnapshotManager
 from src.benchmarks.benchmarks import BenchmarkManager, BenchmarkFxConverter
 from src.utils.utils import get_logger
 
@@ -37,6 +38,9 @@ async def run_etl_job():
         mcap_fx_converter = DailyMcapFxConverter() # Convert Market Cap to EUR and USD
         await mcap_fx_converter.run_daily_fx_conversion()
 
+        quarterly_snapshot_manager = QuarterlySnapshotManager() # Refresh the latest quarter-end market cap snapshots
+        await quarterly_snapshot_manager.run_update()
+
         benchmark_manager = BenchmarkManager() # Get and store benchmark data
         await benchmark_manager.run()
 
@@ -9,6 +9,7 @@ from src.historical.stock_info_update import VolAvgManager, RelevanceManager
 from src.historical.indexer import IndexManager
 from src.benchmarks.benchmarks import BenchmarkManager, BenchmarkFxConverter
 from src.historical.etl_summary import ETLSummaryManager
+from src.historical.quarterly_snapshot import QuarterlySnapshotManager
 from src.metrics.stock_metrics import MetricsManager, PercentileCalculator
 from src.utils.utils import get_logger, ensure_schemas_exist
 import time
@@ -54,6 +55,9 @@ async def main():
         mcap_fx_converter = HistoricalMcapFxConverter()  # Convert market cap to EUR and USD
         await mcap_fx_converter.run_conversion()
 
+        quarterly_snapshot_manager = QuarterlySnapshotManager() # Rebuild the quarter-end market cap snapshots
+        await quarterly_snapshot_manager.run_update(full_refresh=True)
+
         metrics_manager = MetricsManager() # Get and store financial metrics data
         await metrics_manager.save_financial_metrics()
 
@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from io import StringIO
 from ..utils.utils import get_postgres_connection, get_database_url, get_logger
+from ..utils.partitions import ensure_year_partitions
 from ..utils.models import MarketCapValidator, McapFxValidator
 from typing import Dict, List, Optional
 from ..historical.historical_market_cap import HistoricalMcapFxConverter
@@ -49,6 +50,11 @@ class DailyMcapManager:
         logger.info("######################### Step 5 - DailyMcapManager initialized")
         try:
             logger.info("Starting daily market cap update...")
+
+            # Make sure the yearly partitions exist before inserting (no-op for an unpartitioned table)
+            with self.engine.connect() as conn:
+                ensure_year_partitions(conn, "raw.historical_market_cap")
+                conn.commit()
             
             # Get all symbols from database
             symbols_with_currency = await self.get_symbols_from_db()
@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from sqlalchemy import create_engine, text
 from ..utils.utils import get_postgres_connection, get_database_url, get_logger
+from ..utils.partitions import ensure_year_partitions
 from ..utils.models import PriceVolumeValidator, PriceVolumeFxValidator
 from ..historical.historical_price_volume import HistoricalPriceVolumeFxConverter
 
@@ -205,6 +206,11 @@ class DailyPriceVolumeManager:
         print("\n")
         logger.info("######################### Step 3 - DailyPriceVolumeManager initialized")
         try:
+            # Make sure the yearly partitions exist before inserting (no-op for an unpartitioned table)
+            with self.engine.connect() as conn:
+                ensure_year_partitions(conn, "raw.historical_price_volume")
+                conn.commit()
+
             # Get missing dates
             missing_dates = await self.get_missing_dates()
             
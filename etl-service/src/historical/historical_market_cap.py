@@ -8,6 +8,7 @@ from io import StringIO
 from sqlalchemy import create_engine, text
 from datetime import datetime, timedelta
 from ..utils.utils import get_postgres_connection, get_database_url, get_logger
+from ..utils.partitions import migrate_to_year_partitions, ensure_year_partitions
 from ..utils.models import MarketCapValidator, McapFxValidator
 from typing import Dict, List, Optional
 from collections import defaultdict
@@ -46,13 +47,14 @@ class HistoricalMcapManager:
                 
                 if result:
                     logger.info("Historical market cap table exists, clearing all data...")
-                    conn.execute(text("DELETE FROM raw.historical_market_cap"))
+                    migrate_to_year_partitions(conn, "raw.historical_market_cap", copy_rows=False)
+                    conn.execute(text("TRUNCATE raw.historical_market_cap"))  # drops the partitions' files instead of deleting row by row
                     conn.commit()
                     logger.info("All data cleared from raw.historical_market_cap table")
                 else:
                     logger.info("Creating historical market cap table in raw schema...")
 
-                # Create main table
+                # Create main table, partitioned by year of date
                 conn.execute(text("""
                     CREATE TABLE IF NOT EXISTS raw.historical_market_cap (
                         date DATE,
@@ -62,8 +64,9 @@ class HistoricalMcapManager:
                         year INT,
                         quarter VARCHAR(2),
                         last_quarter_date BOOLEAN
-                    )
+                    ) PARTITION BY RANGE (date)
                 """))
+                ensure_year_partitions(conn, "raw.historical_market_cap")
                 #,
                 #PRIMARY KEY (date, symbol)
                 # Create staging table
@@ -373,6 +376,7 @@ SET
     created_at = NOW()
 FROM mcap_eur_usd_merge merged
 WHERE 
+    hmc.date >= :d_start AND hmc.date < :d_next AND
     hmc.symbol = merged.symbol AND
     hmc.date = merged.date AND
     hmc.currency = merged.currency;
@@ -432,58 +436,7 @@ WHERE
             batch_num = 1
             while d_start < d_end:
                 d_next = d_start + batch_size
-                sql = text("""
-                WITH forex_eur AS (
-                    SELECT *
-                    FROM clean.historical_forex_full 
-                    WHERE ccy_left = 'EUR'
-                ),
-                forex_usd AS (
-                    SELECT *
-                    FROM clean.historical_forex_full 
-                    WHERE ccy_left = 'USD'
-                ),
-                mcap_eur_merge AS (
-                    SELECT 
-                        hmc.symbol,
-                        hmc.date,
-                        hmc.currency,
-                        hmc.market_cap,
-                        CASE 
-                            WHEN hmc.market_cap = 0 OR hmc.market_cap IS NULL OR fe.price IS NULL OR fe.price < 1e-6 THEN 0
-                            ELSE ROUND((hmc.market_cap / fe.price)::numeric, 0)
-                        END AS market_cap_eur
-                    FROM raw.historical_market_cap hmc
-                    LEFT JOIN forex_eur fe
-                    ON hmc.date = fe.date AND hmc.currency = fe.ccy_right
-                    WHERE hmc.date >= :d_start AND hmc.date < :d_next
-                ),
-                mcap_eur_usd_merge AS (
-                    SELECT 
-                        mem.symbol,
-                        mem.date,
-                        mem.currency,
-                        mem.market_cap_eur,
-                        CASE 
-                            WHEN mem.market_cap = 0 OR mem.market_cap IS NULL OR fu.price IS NULL OR fu.price < 1e-6 THEN 0
-                            ELSE ROUND((mem.market_cap / fu.price)::numeric, 0)
-                        END AS market_cap_usd
-                    FROM mcap_eur_merge mem
-                    LEFT JOIN forex_usd fu
-                    ON mem.date = fu.date AND mem.currency = fu.ccy_right
-                    WHERE mem.date >= :d_start AND mem.date < :d_next
-                )
-                UPDATE raw.historical_market_cap hmc
-                SET 
-                    market_cap_eur = merged.market_cap_eur,
-                    market_cap_usd = merged.market_cap_usd,
-                    created_at = NOW()
-                FROM mcap_eur_usd_merge merged
-                WHERE 
-                    hmc.symbol = merged.symbol AND
-                    hmc.date = merged.date AND
-                    hmc.currency = merged.currency;
-                                """)
+                sql = self._get_fx_conversion_sql()
                 with self.engine.connect() as conn:
                     conn.execute(sql, {"d_start": d_start, "d_next": d_next})
                     conn.commit()
@@ -8,6 +8,7 @@ from io import StringIO
 from sqlalchemy import create_engine, text
 from datetime import datetime, timedelta
 from ..utils.utils import get_postgres_connection, get_database_url, get_logger
+from ..utils.partitions import migrate_to_year_partitions, ensure_year_partitions
 from ..utils.models import PriceVolumeValidator, PriceVolumeFxValidator
 from typing import Dict, List, Optional
 from collections import defaultdict
@@ -44,12 +45,14 @@ class HistoricalPriceVolumeManager:
                 
                 if result:
                     logger.info("Historical price volume table exists, clearing all data...")
-                    conn.execute(text("DELETE FROM raw.historical_price_volume"))
+                    migrate_to_year_partitions(conn, "raw.historical_price_volume", copy_rows=False)
+                    conn.execute(text("TRUNCATE raw.historical_price_volume"))  # drops the partitions' files instead of deleting row by row
                     conn.commit()
                     logger.info("All data cleared from raw.historical_price_volume table")
                 else:
                     logger.info("Creating historical price volume table in raw schema...")
 
+                # Partitioned by year of date: reloads truncate whole partitions and date filters prune partitions
                 conn.execute(text("""
                     CREATE TABLE IF NOT EXISTS raw.historical_price_volume (
                         date DATE,
@@ -60,8 +63,9 @@ class HistoricalPriceVolumeManager:
                         year INT,
                         quarter VARCHAR(2),
                         last_quarter_date BOOLEAN
-                    )
+                    ) PARTITION BY RANGE (date)
                 """))
+                ensure_year_partitions(conn, "raw.historical_price_volume")
                 #,
                 #PRIMARY KEY (date, symbol)
                 conn.execute(text("""
@@ -390,6 +394,7 @@ class HistoricalPriceVolumeFxConverter:
             created_at = NOW()
         FROM price_vol_eur_usd_merge merged
         WHERE 
+            hpv.date >= :d_start AND hpv.date < :d_next AND
             hpv.symbol = merged.symbol AND
             hpv.date = merged.date AND
             hpv.currency = merged.currency;
@@ -1,7 +1,9 @@
 
+import re
 import asyncio
 from sqlalchemy import create_engine, text
 from ..utils.utils import get_database_url, get_logger
+from ..utils.partitions import is_partitioned
 
 # Get logger
 logger = get_logger(__name__)
@@ -67,7 +69,7 @@ class IndexManager:
                     # Use connection with autocommit isolation level for CONCURRENTLY indexes
                     with self.engine.connect() as conn:
                         conn.execution_options(isolation_level="AUTOCOMMIT")
-                        conn.execute(text(sql))
+                        conn.execute(text(self._statement(conn, sql)))
                     logger.info(f"Successfully created index: {index_name}")
                     successful_indexes += 1
                     
@@ -94,7 +96,7 @@ class IndexManager:
             # Use connection with autocommit isolation level for CONCURRENTLY indexes
             with self.engine.connect() as conn:
                 conn.execution_options(isolation_level="AUTOCOMMIT")
-                conn.execute(text(self.indexes[index_name]))
+                conn.execute(text(self._statement(conn, self.indexes[index_name])))
             logger.info(f"Successfully created index: {index_name}")
             return True
             
@@ -102,6 +104,17 @@ class IndexManager:
             logger.error(f"Error creating index {index_name}: {str(e)}")
             return False
     
+    def _statement(self, conn, sql: str) -> str:
+        """
+        The index statement to run on the current table. Partitioned parents don't support
+        CONCURRENTLY, so their index is built without it (on every yearly partition); indexes of
+        other tables keep being built concurrently, without blocking writes.
+        """
+        table = re.search(r"\bON\s+([\w.]+)", sql).group(1)
+        if is_partitioned(conn, table):
+            return sql.replace("CREATE INDEX CONCURRENTLY", "CREATE INDEX")
+        return sql
+
     def get_index_sql(self, index_name: str) -> str:
         """Get the SQL statement for a specific index."""
         return self.indexes.get(index_name, "")
@@ -0,0 +1,75 @@
+import asyncio
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+from ..utils.utils import get_database_url, get_logger
+from ..utils.partitions import migrate_to_year_partitions
+from .indexer import IndexManager
+
+# Get logger
+logger = get_logger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+class PartitionMigrationManager:
+    """
+    One-off migration of raw.historical_price_volume and raw.historical_market_cap from single
+    heap tables to tables partitioned by year of date. Each table is migrated in its own
+    transaction; tables that are already partitioned are left alone, so the migration can be rerun.
+    """
+    def __init__(self):
+        """Initialize the PartitionMigrationManager with database connection."""
+        self.database_url = get_database_url()
+        self.engine = create_engine(self.database_url)
+
+        # Indexes the ETL managers create on each table (dropped together with the old tables)
+        self.table_indexes = {
+            "raw.historical_price_volume": [
+                """
+                CREATE INDEX IF NOT EXISTS idx_hpv_symbol_date_currency
+                ON raw.historical_price_volume (symbol, date, currency);
+                """,
+            ],
+            "raw.historical_market_cap": [
+                """
+                CREATE INDEX IF NOT EXISTS idx_hmc_symbol_date_currency
+                ON raw.historical_market_cap (symbol, date, currency);
+                """,
+                """
+                CREATE INDEX IF NOT EXISTS idx_historical_market_cap_symbol_date_desc
+                ON raw.historical_market_cap (symbol, date DESC);
+                """,
+            ],
+        }
+
+    async def run_migration(self):
+        """Main method to migrate both tables and recreate their indexes."""
+
+        print("\n")
+        logger.info("######################### PartitionMigrationManager initialized")
+
+        try:
+            for table, indexes in self.table_indexes.items():
+                with self.engine.begin() as conn:
+                    migrated = migrate_to_year_partitions(conn, table)
+                if not migrated:
+                    logger.info(f"{table} is already partitioned (or missing), skipping")
+                    continue
+                with self.engine.begin() as conn:
+                    for sql in indexes:
+                        conn.execute(text(sql))
+                    conn.execute(text(f"ANALYZE {table}"))
+                logger.info(f"Recreated indexes on {table}")
+
+            # Partial indexes used by the stock-service queries
+            await IndexManager().create_all_indexes()
+            logger.info("Partition migration completed successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Error in partition migration: {str(e)}")
+            raise
+
+
+if __name__ == "__main__":
+    partition_migration_manager = PartitionMigrationManager()
+    asyncio.run(partition_migration_manager.run_migration())
@@ -0,0 +1,192 @@
+import asyncio
+from sqlalchemy import create_engine, text
+from dotenv import load_dotenv
+from ..utils.utils import get_database_url, get_logger
+
+# Get logger
+logger = get_logger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+class QuarterlySnapshotManager:
+    """
+    Maintains clean.quarterly_mcap_snapshot: one row per symbol and quarter-end with the market caps
+    (local, EUR, USD), the quarter the snapshot selects constituents for (next_year, next_quarter)
+    and the stock info dimensions used by the index filters (country, sector, industry).
+    The stock-service ranks constituents on this table instead of deriving it from
+    raw.historical_market_cap and raw.stock_info on every request.
+    """
+    def __init__(self):
+        """Initialize the QuarterlySnapshotManager with database connection."""
+        self.database_url = get_database_url()
+        self.engine = create_engine(self.database_url)
+
+        # Indexes for the common filter shapes of the index selection
+        self.indexes = {
+            "idx_qms_year_quarter_mcap": """
+                CREATE INDEX IF NOT EXISTS idx_qms_year_quarter_mcap
+                ON clean.quarterly_mcap_snapshot (year, quarter, market_cap_eur DESC);
+            """,
+            "idx_qms_country_year_quarter": """
+                CREATE INDEX IF NOT EXISTS idx_qms_country_year_quarter
+                ON clean.quarterly_mcap_snapshot (country, year, quarter);
+            """,
+            "idx_qms_sector_year_quarter": """
+                CREATE INDEX IF NOT EXISTS idx_qms_sector_year_quarter
+                ON clean.quarterly_mcap_snapshot (sector, year, quarter);
+            """,
+            "idx_qms_industry_year_quarter": """
+                CREATE INDEX IF NOT EXISTS idx_qms_industry_year_quarter
+                ON clean.quarterly_mcap_snapshot (industry, year, quarter);
+            """,
+        }
+
+    def create_snapshot_table(self):
+        """Create the quarterly_mcap_snapshot table and its indexes if they don't exist."""
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("CREATE SCHEMA IF NOT EXISTS clean"))
+                conn.execute(text("""
+                    CREATE TABLE IF NOT EXISTS clean.quarterly_mcap_snapshot (
+                        symbol VARCHAR(100),
+                        year INT,
+                        quarter VARCHAR(2),
+                        date DATE,
+                        next_year INT,
+                        next_quarter VARCHAR(2),
+                        currency VARCHAR(10),
+                        market_cap NUMERIC(30, 0),
+                        market_cap_eur NUMERIC(30, 0),
+                        market_cap_usd NUMERIC(30, 0),
+                        country VARCHAR(100),
+                        sector VARCHAR(100),
+                        industry VARCHAR(100),
+                        PRIMARY KEY (symbol, year, quarter)
+                    )
+                """))
+                for index_name, sql in self.indexes.items():
+                    conn.execute(text(sql))
+                conn.commit()
+                logger.info("Quarterly market cap snapshot table created/verified in clean schema")
+        except Exception as e:
+            logger.error(f"Error creating quarterly market cap snapshot table: {str(e)}")
+            raise
+
+    def get_refresh_start(self):
+        """
+        First (year, quarter) to rebuild: the latest stored quarter (its quarter-end and FX values can still
+        change) or an earlier quarter with missing EUR/USD market caps. None when the table is empty.
+        """
+        with self.engine.connect() as conn:
+            row = conn.execute(text("""
+                SELECT year, quarter
+                FROM clean.quarterly_mcap_snapshot
+                WHERE (year, quarter) = (SELECT year, quarter FROM clean.quarterly_mcap_snapshot ORDER BY year DESC, quarter DESC LIMIT 1)
+                   OR market_cap_eur IS NULL
+                   OR market_cap_usd IS NULL
+                ORDER BY year, quarter
+                LIMIT 1
+            """)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def refresh_dimensions(self, conn):
+        """
+        Bring country, sector and industry of the quarters before the refresh start up to date with
+        raw.stock_info, and drop the rows of symbols no longer in it, so every quarter filters on the
+        same dimensions a full rebuild would copy. Returns the number of rows updated and deleted.
+        """
+        updated = conn.execute(text("""
+            UPDATE clean.quarterly_mcap_snapshot qms
+            SET country = si.country, sector = si.sector, industry = si.industry
+            FROM raw.stock_info si
+            WHERE qms.symbol = si.symbol
+            AND (qms.country, qms.sector, qms.industry) IS DISTINCT FROM (si.country, si.sector, si.industry)
+        """)).rowcount
+        deleted = conn.execute(text("""
+            DELETE FROM clean.quarterly_mcap_snapshot qms
+            WHERE NOT EXISTS (SELECT FROM raw.stock_info si WHERE si.symbol = qms.symbol)
+        """)).rowcount
+        return updated, deleted
+
+    def refresh_snapshot(self, full_refresh: bool = False):
+        """
+        Rebuild the snapshot rows from the refresh start onwards (all rows on a full refresh or an empty table).
+        The dimensions of the older quarters are refreshed in the same transaction (see refresh_dimensions).
+        """
+        refresh_start = None if full_refresh else self.get_refresh_start()
+        if refresh_start:
+            logger.info(f"Refreshing quarterly market cap snapshot from {refresh_start[0]} {refresh_start[1]}")
+            snapshot_condition = "WHERE (year, quarter) >= (:year, :quarter)"
+            source_condition = "AND (hmc.year, hmc.quarter) >= (:year, :quarter)"
+            params = {"year": refresh_start[0], "quarter": refresh_start[1]}
+        else:
+            logger.info("Rebuilding the full quarterly market cap snapshot")
+            snapshot_condition = ""
+            source_condition = ""
+            params = {}
+
+        with self.engine.connect() as conn:
+            deleted = conn.execute(text(f"DELETE FROM clean.quarterly_mcap_snapshot {snapshot_condition}"), params).rowcount
+            inserted = conn.execute(text(f"""
+                INSERT INTO clean.quarterly_mcap_snapshot (
+                    symbol, year, quarter, date, next_year, next_quarter, currency,
+                    market_cap, market_cap_eur, market_cap_usd, country, sector, industry
+                )
+                SELECT DISTINCT ON (hmc.symbol, hmc.year, hmc.quarter)
+                    hmc.symbol,
+                    hmc.year,
+                    hmc.quarter,
+                    hmc.date,
+                    CASE
+                        WHEN EXTRACT(QUARTER FROM hmc.date)::INT = 4 THEN EXTRACT(YEAR FROM hmc.date)::INT + 1
+                        ELSE EXTRACT(YEAR FROM hmc.date)::INT
+                    END AS next_year,
+                    'Q' || (
+                        CASE
+                            WHEN EXTRACT(QUARTER FROM hmc.date)::INT = 4 THEN 1
+                            ELSE EXTRACT(QUARTER FROM hmc.date)::INT + 1
+                        END
+                    ) AS next_quarter,
+                    hmc.currency,
+                    hmc.market_cap,
+                    hmc.market_cap_eur,
+                    hmc.market_cap_usd,
+                    si.country,
+                    si.sector,
+                    si.industry
+                FROM raw.historical_market_cap hmc
+                INNER JOIN raw.stock_info si ON hmc.symbol = si.symbol
+                WHERE hmc.last_quarter_date = TRUE
+                {source_condition}
+                ORDER BY hmc.symbol, hmc.year, hmc.quarter, hmc.date DESC
+            """), params).rowcount
+            if refresh_start:
+                updated, removed = self.refresh_dimensions(conn)
+                logger.info(f"Quarterly market cap snapshot dimensions refreshed: {updated} rows updated, "
+                            f"{removed} rows of symbols no longer in raw.stock_info removed")
+            conn.commit()
+        logger.info(f"Quarterly market cap snapshot refreshed: {deleted} rows replaced by {inserted} rows")
+
+    async def run_update(self, full_refresh: bool = False):
+        """Main method to create (if needed) and refresh the quarterly market cap snapshot."""
+
+        print("\n")
+        logger.info("######################### Step 6.1 (10.1) - QuarterlySnapshotManager initialized")
+
+        try:
+            self.create_snapshot_table()
+            self.refresh_snapshot(full_refresh=full_refresh)
+            with self.engine.connect() as conn:
+                conn.execute(text("ANALYZE clean.quarterly_mcap_snapshot"))
+                conn.commit()
+            logger.info("Quarterly market cap snapshot process completed successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Error in quarterly market cap snapshot process: {str(e)}")
+            raise
+
+
+if __name__ == "__main__":
+    quarterly_snapshot_manager = QuarterlySnapshotManager()
+    asyncio.run(quarterly_snapshot_manager.run_update(full_refresh=True))
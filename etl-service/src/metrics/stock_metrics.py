@@ -505,6 +505,7 @@ class PercentileCalculator:
     DATABASE_URL = get_database_url()
     engine: Engine = create_engine(DATABASE_URL)
     target_table = "clean.financial_metrics_perc"
+    kpi_buckets_table = "clean.kpi_buckets"
     staging_schema = "stage"
     BATCH_SIZE = 4
 
@@ -556,6 +557,30 @@ class PercentileCalculator:
             .collect()
         )
 
+    def write_kpi_buckets(self, kpi_buckets: list):
+        """
+        Replace clean.kpi_buckets, the catalogue of (kpi_name, kpi_value) buckets present in the
+        percentile table. The stock-service field maker reads it instead of scanning
+        clean.financial_metrics_perc once per KPI.
+        """
+        catalogue = pl.concat(kpi_buckets) if kpi_buckets else pl.DataFrame({"kpi_name": [], "kpi_value": [], "kpi_perc": []})
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {self.kpi_buckets_table}"))
+            conn.execute(text(f"""
+                CREATE TABLE {self.kpi_buckets_table} (
+                    kpi_name TEXT,
+                    kpi_value TEXT,
+                    kpi_perc INTEGER,
+                    PRIMARY KEY (kpi_name, kpi_value)
+                )
+            """))
+            if catalogue.height > 0:
+                conn.execute(
+                    text(f"INSERT INTO {self.kpi_buckets_table} (kpi_name, kpi_value, kpi_perc) VALUES (:kpi_name, :kpi_value, :kpi_perc)"),
+                    catalogue.to_dicts()
+                )
+        logger.info(f"Wrote {catalogue.height} KPI buckets to {self.kpi_buckets_table}")
+
     def run_percentile_calculation(self):
         print("\n")
         logger.info("######################### Step 12 - PercentileCalculator initialized")
@@ -594,6 +619,9 @@ class PercentileCalculator:
         )
         pg_conn.commit()
 
+        # Buckets each metric's rows fall into, for the KPI catalogue
+        kpi_buckets = []
+
         # Process metrics in batches
         for i in range(0, len(self.metrics), self.BATCH_SIZE):
             batch = self.metrics[i:i + self.BATCH_SIZE]
@@ -604,6 +632,9 @@ class PercentileCalculator:
                 df_m = self.bucketize_metric(df_raw, m)
                 if df_m.height > 0:
                     batch_df = batch_df.join(df_m, on=["symbol", "date"], how="left")
+                    kpi_buckets.append(
+                        df_m.select([pl.lit(m).alias("kpi_name"), pl.col(f"{m}_bound").alias("kpi_value"), pl.col(f"{m}_perc").alias("kpi_perc")]).unique()
+                    )
 
             pdf = batch_df.to_pandas()
             pdf["date"] = pd.to_datetime(pdf["date"]).dt.date
@@ -655,6 +686,8 @@ class PercentileCalculator:
         pg_conn.close()
         logger.info("All batches merged in Financial Metrics Table.")
 
+        self.write_kpi_buckets(kpi_buckets)
+
         logger.info("Running VACUUM FULL ANALYZE on Financial Metrics Table")
         raw_conn = psycopg2.connect(self.DATABASE_URL.replace("postgresql+psycopg2", "postgresql"))
         raw_conn.set_session(autocommit=True)
@@ -0,0 +1,124 @@
+from datetime import datetime
+from sqlalchemy import text
+from .utils import get_logger
+
+# Get logger
+logger = get_logger(__name__)
+
+PARTITION_START_YEAR = 2013  # historical data starts on 2013-12-01
+
+
+def _split(table: str):
+    schema, name = table.split(".")
+    return schema, name
+
+
+def partition_name(table: str, year: int) -> str:
+    """Name of the yearly partition of a table, e.g. raw.historical_price_volume_2024."""
+    return f"{table}_{year}"
+
+
+def table_exists(conn, table: str) -> bool:
+    schema, name = _split(table)
+    return conn.execute(text("""
+        SELECT EXISTS (
+            SELECT FROM information_schema.tables
+            WHERE table_schema = :schema
+            AND table_name = :name
+        )
+    """), {"schema": schema, "name": name}).scalar()
+
+
+def is_partitioned(conn, table: str) -> bool:
+    """True if the table is a declaratively partitioned (parent) table."""
+    schema, name = _split(table)
+    return bool(conn.execute(text("""
+        SELECT EXISTS (
+            SELECT FROM pg_partitioned_table pt
+            JOIN pg_class c ON c.oid = pt.partrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema
+            AND c.relname = :name
+        )
+    """), {"schema": schema, "name": name}).scalar())
+
+
+def default_partition_name(table: str) -> str:
+    """Name of the DEFAULT partition of a table, e.g. raw.historical_price_volume_default."""
+    return f"{table}_default"
+
+
+def ensure_year_partitions(conn, table: str, first_year: int = PARTITION_START_YEAR, last_year: int = None) -> None:
+    """
+    Create the missing yearly date-range partitions of a partitioned table, up to and including
+    next year by default, plus a DEFAULT partition, so a load never fails on a row whose date falls
+    outside the provisioned years. Rows that landed in the DEFAULT partition are moved into a yearly
+    partition when it is created (Postgres refuses to create it while the DEFAULT partition holds
+    rows of its range).
+    Does nothing for a table that is not partitioned (not migrated yet).
+    """
+    if not is_partitioned(conn, table):
+        return
+    default_partition = default_partition_name(table)
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {default_partition} PARTITION OF {table} DEFAULT"))
+
+    # Years that already have rows in the DEFAULT partition get their partition too
+    default_years = conn.execute(text(f"""
+        SELECT DISTINCT EXTRACT(YEAR FROM date)::INT FROM {default_partition} WHERE date IS NOT NULL
+    """)).scalars().all()
+    last_year = last_year or datetime.now().year + 1
+    for year in sorted(set(range(first_year, last_year + 1)) | set(default_years)):
+        if table_exists(conn, partition_name(table, year)):
+            continue
+        bounds = f"date >= '{year}-01-01' AND date < '{year + 1}-01-01'"
+        if year in default_years:
+            conn.execute(text(f"""
+                CREATE TEMP TABLE default_rows AS
+                WITH moved AS (DELETE FROM {default_partition} WHERE {bounds} RETURNING *)
+                SELECT * FROM moved
+            """))
+        conn.execute(text(f"""
+            CREATE TABLE {partition_name(table, year)}
+            PARTITION OF {table}
+            FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')
+        """))
+        if year in default_years:
+            moved = conn.execute(text(f"INSERT INTO {table} SELECT * FROM default_rows")).rowcount
+            conn.execute(text("DROP TABLE default_rows"))
+            logger.info(f"Moved {moved} rows of {year} from {default_partition} into {partition_name(table, year)}")
+
+
+def migrate_to_year_partitions(conn, table: str, copy_rows: bool = True) -> bool:
+    """
+    Convert an existing heap table into a table partitioned by year of its date column.
+
+    The old table is renamed, a partitioned table with the same columns and defaults takes its
+    name, the rows are copied into the yearly partitions and the old table (with its indexes) is
+    dropped. Runs in the caller's transaction, so a failure leaves the old table in place.
+    Indexes have to be recreated on the new table afterwards. A reload that clears the table anyway
+    passes copy_rows=False. Returns False if there was nothing to migrate.
+    """
+    if not table_exists(conn, table) or is_partitioned(conn, table):
+        return False
+
+    schema, name = _split(table)
+    legacy_table = f"{table}_unpartitioned"
+    logger.info(f"Migrating {table} to yearly partitions...")
+
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {name}_unpartitioned"))
+    conn.execute(text(f"""
+        CREATE TABLE {table} (LIKE {legacy_table} INCLUDING DEFAULTS)
+        PARTITION BY RANGE (date)
+    """))
+    first_year = conn.execute(text(f"SELECT EXTRACT(YEAR FROM MIN(date))::INT FROM {legacy_table}")).scalar()
+    last_year = conn.execute(text(f"SELECT EXTRACT(YEAR FROM MAX(date))::INT FROM {legacy_table}")).scalar()
+    ensure_year_partitions(
+        conn,
+        table,
+        first_year=min(first_year or PARTITION_START_YEAR, PARTITION_START_YEAR),
+        last_year=max(last_year or 0, datetime.now().year + 1),
+    )
+    copied = conn.execute(text(f"INSERT INTO {table} SELECT * FROM {legacy_table}")).rowcount if copy_rows else 0
+    conn.execute(text(f"DROP TABLE {legacy_table}"))
+    logger.info(f"Migrated {copied} rows of {table} into yearly partitions")
+    return True
@@ -0,0 +1,207 @@
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import polars as pl
+from datetime import date
+from typing import Dict, List, Optional
+from src.index_maker.index_maker import make_index, make_constituent_weights, trim_index, calculate_risk_return
+from src.utils.stage_timing import peak_rss_mb
+from src.utils.fields_payload import CompanyDimension
+
+
+START_DATE = date(2014, 1, 1)
+TRADING_DAYS_PER_YEAR = 252
+UNIVERSE_FACTOR = 1.25  # symbols competing for the constituent slots, so constituents change between periods
+CURRENCIES = ["USD", "EUR", "GBP", "JPY"]
+
+# Every rebalance period is identified by a number that changes when a new period starts
+PERIOD_KEYS = {
+    "monthly": lambda days: days.astype("datetime64[M]").astype(np.int64),
+    "quarterly": lambda days: days.astype("datetime64[M]").astype(np.int64) // 3,
+    "yearly": lambda days: days.astype("datetime64[Y]").astype(np.int64),
+}
+
+DEFAULT_SCENARIOS = [
+    {"symbols": symbols, "years": 12, "rebalance": "quarterly", "weight": weight}
+    for symbols in (100, 1000, 5000)
+    for weight in ("cap", "equal")
+]
+
+
+def synthetic_index_rows(symbols: int = 100,
+                         years: int = 12,
+                         rebalance: str = "quarterly",
+                         seed: int = 7) -> pl.DataFrame:
+    """
+    Deterministic rows in the schema make_query returns: one row per trading day and constituent.
+
+    A universe of symbols * UNIVERSE_FACTOR stocks follows random walks (prices and market caps
+    in their local currency, converted with random FX walks). On the last day of every rebalance
+    period (flagged by last_quarter_date) the `symbols` largest by EUR market cap are selected and
+    held through the next period with that day's market caps, like the quarter-end snapshot.
+    About 1% of the rows are dropped, like days filtered out by the volume threshold.
+    """
+    if rebalance not in PERIOD_KEYS:
+        raise ValueError(f"Invalid rebalance frequency: {rebalance}. Must be one of {', '.join(PERIOD_KEYS)}.")
+    rng = np.random.default_rng(seed)
+
+    ########### CALENDAR
+    calendar = np.arange(np.datetime64(START_DATE), np.datetime64(START_DATE) + int(years * 366), dtype="datetime64[D]")
+    days = calendar[np.is_busday(calendar)][:years * TRADING_DAYS_PER_YEAR]
+    period_keys = PERIOD_KEYS[rebalance](days)
+    period_ends = np.flatnonzero(np.r_[period_keys[1:] != period_keys[:-1], True])
+    period_starts = np.r_[0, period_ends[:-1] + 1]
+
+    ########### UNIVERSE
+    universe = int(symbols * UNIVERSE_FACTOR)
+    names = pl.Series([f"SYN{i:05d}" for i in range(universe)])
+    currency_ids = rng.integers(0, len(CURRENCIES), universe)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.015, (len(days), universe)), axis=0))
+    shares = rng.lognormal(18, 1.5, universe)
+    # Local currency -> EUR/USD rates per day (EUR and USD themselves are fixed at the cross rate)
+    eur_rates = np.exp(np.cumsum(rng.normal(0, 0.004, (len(days), len(CURRENCIES))), axis=0)) * np.array([0.9, 1.0, 1.15, 0.0065])
+    usd_rates = eur_rates / 0.9
+
+    ########### SELECTION
+    # The first period is selected on its first day, every later one on the last day of the period before
+    selection_days = np.r_[0, period_ends[:-1]]
+    day_idx, symbol_idx, selection_idx, rank = [], [], [], []
+    for start, end, selection_day in zip(period_starts, period_ends, selection_days):
+        mcaps_eur = prices[selection_day] * shares * eur_rates[selection_day, currency_ids]
+        constituents = np.argsort(-mcaps_eur, kind="stable")[:symbols]
+        # int32 row indices keep the 5,000 constituent scenarios (~15M rows) affordable
+        period_days = np.arange(start, end + 1, dtype=np.int32)
+        constituents = constituents.astype(np.int32)
+        day_idx.append(np.repeat(period_days, len(constituents)))
+        symbol_idx.append(np.tile(constituents, len(period_days)))
+        selection_idx.append(np.full(len(period_days) * len(constituents), selection_day, dtype=np.int32))
+        rank.append(np.tile(np.arange(1, len(constituents) + 1, dtype=np.int32), len(period_days)))
+    day_idx, symbol_idx, selection_idx, rank = (np.concatenate(a) for a in (day_idx, symbol_idx, selection_idx, rank))
+    kept = rng.random(len(day_idx)) >= 0.01
+    day_idx, symbol_idx, selection_idx, rank = day_idx[kept], symbol_idx[kept], selection_idx[kept], rank[kept]
+
+    ########### ROWS
+    row_currency = currency_ids[symbol_idx]
+    close = prices[day_idx, symbol_idx]
+    market_cap = prices[selection_idx, symbol_idx] * shares[symbol_idx]
+    row_days = days[day_idx]
+    months = row_days.astype("datetime64[M]").astype(np.int64)
+    return pl.DataFrame({
+        "date": pl.Series(row_days).cast(pl.Date),
+        "symbol": names.gather(symbol_idx),
+        "currency": pl.Series(CURRENCIES).gather(row_currency),
+        "year": pl.Series(months // 12 + 1970, dtype=pl.Int32),
+        "quarter": pl.Series(["Q1", "Q2", "Q3", "Q4"]).gather(months % 12 // 3),
+        "last_quarter_date": np.isin(day_idx, period_ends),
+        "close": close,
+        "close_eur": close * eur_rates[day_idx, row_currency],
+        "close_usd": close * usd_rates[day_idx, row_currency],
+        "market_cap": market_cap,
+        "market_cap_eur": market_cap * eur_rates[selection_idx, row_currency],
+        "market_cap_usd": market_cap * usd_rates[selection_idx, row_currency],
+        "asset_turnover_perc": rng.choice([1.0, 10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0, 90.0, 99.0, 100.0], len(day_idx)),
+        "mcap_rank": pl.Series(rank, dtype=pl.Int32),
+    })
+
+
+def synthetic_companies(df: pl.DataFrame) -> CompanyDimension:
+    """companies.csv stand-in for make_constituent_weights"""
+    symbols = df.get_column("symbol").unique().sort()
+    return CompanyDimension(pl.DataFrame({"company_name": "Company " + symbols, "symbol": symbols, "country": "US"}))
+
+
+def _best_of(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def run_scenario(scenario: Dict, repeats: int = 3) -> List[Dict]:
+    """Time the engine functions on one synthetic data set (best of `repeats`)"""
+    start = time.perf_counter()
+    df = synthetic_index_rows(scenario["symbols"], scenario["years"], scenario["rebalance"])
+    companies = synthetic_companies(df)
+    generated = time.perf_counter() - start
+    dates = df.get_column("date").unique().sort()
+    start_date = dates[len(dates) // 3]
+    currency = scenario.get("currency", "EUR")
+    weight = scenario["weight"]
+
+    index_df, make_index_seconds = _best_of(lambda: make_index(df, currency, weight), repeats)
+    steps = [
+        ("make_index", lambda: index_df, make_index_seconds),
+        ("make_constituent_weights", lambda: make_constituent_weights(df, currency, weight, companies), None),
+        ("trim_index", lambda: trim_index(index_df, 1000, start_date), None),
+        ("calculate_risk_return", lambda: calculate_risk_return(index_df, start_date), None),
+    ]
+
+    rows = []
+    base = {**scenario, "rows": df.height, "data_mb": round(df.estimated_size("mb"), 1), "generate_s": round(generated, 2)}
+    for function, fn, seconds in steps:
+        if seconds is None:
+            _, seconds = _best_of(fn, repeats)
+        rows.append({**base, "function": function, "seconds": round(seconds, 4), "peak_rss_mb": peak_rss_mb()})
+    return rows
+
+
+def run_benchmark(scenarios: List[Dict] = DEFAULT_SCENARIOS,
+                  repeats: int = 3,
+                  baseline: Optional[pl.DataFrame] = None) -> pl.DataFrame:
+    """
+    Run every scenario in a fresh process, so its peak memory (the process high-water mark after
+    each function) isn't inflated by the scenarios before it. With a baseline (a previous result),
+    the seconds are compared per scenario and function.
+    """
+    rows = []
+    context = multiprocessing.get_context("spawn")
+    for scenario in scenarios:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                rows.extend(pool.submit(run_scenario, scenario, repeats).result())
+            except BrokenProcessPool:
+                # Most likely killed for running out of memory
+                print(f"❌ Scenario {scenario} did not finish")
+    result = pl.DataFrame(rows)
+
+    if baseline is not None:
+        keys = ["symbols", "years", "rebalance", "weight", "function"]
+        result = (
+            result.join(baseline.select(keys + [pl.col("seconds").alias("baseline_seconds")]), on=keys, how="left")
+            .with_columns((pl.col("baseline_seconds") / pl.col("seconds")).round(2).alias("speedup"))
+        )
+    return result
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Time the index engine on synthetic make_query rows")
+    parser.add_argument("--symbols", type=int, nargs="+", help="Constituents per period (default: 100 1000 5000)")
+    parser.add_argument("--years", type=int, default=12)
+    parser.add_argument("--rebalance", choices=list(PERIOD_KEYS), default="quarterly")
+    parser.add_argument("--weight", choices=["cap", "equal"], nargs="+", default=["cap", "equal"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--save", help="Write the results to this CSV (e.g. as the baseline of a later run)")
+    parser.add_argument("--baseline", help="CSV of an earlier run to compare against")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    scenarios = [
+        {"symbols": symbols, "years": args.years, "rebalance": args.rebalance, "weight": weight}
+        for symbols in (args.symbols or [100, 1000, 5000])
+        for weight in args.weight
+    ]
+    baseline = pl.read_csv(args.baseline) if args.baseline else None
+    result = run_benchmark(scenarios, args.repeats, baseline)
+    with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=200):
+        print(result)
+    if args.save:
+        result.write_csv(args.save)
+        print(f"✅ Results written to {args.save}")
@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import logging
+import polars as pl
+from typing import Any, Dict, List
+from src.index_maker.index_maker import create_custom_index, data_window
+from src.index_maker.market_panel import MarketPanel, get_market_panel, selected_kpis, DEFAULT_KPIS
+
+
+INDEX_BATCH_MAX_SIZE = int(os.getenv("INDEX_BATCH_MAX_SIZE", "50"))
+
+logger = logging.getLogger(__name__)
+
+
+class SharedSelection:
+    """
+    Market panel selections shared by the variants of a batch.
+    Variants that only differ in weight, currency or start amount select the same rows,
+    so each distinct selection is computed once and reused.
+    """
+
+    def __init__(self, panel: MarketPanel):
+        self.panel = panel
+        self._rows: Dict[str, pl.DataFrame] = {}
+        self.hits = 0
+
+    @property
+    def distinct(self) -> int:
+        return len(self._rows)
+
+    def select(self, **selection) -> pl.DataFrame:
+        key = json.dumps(selection, sort_keys=True, default=str)
+        rows = self._rows.get(key)
+        if rows is None:
+            rows = self._rows[key] = self.panel.select(**selection)
+        else:
+            self.hits += 1
+        return rows
+
+
+def load_batch_panel(configurations: List[Dict[str, Any]]) -> MarketPanel:
+    """
+    The resident market panel, or a panel loaded once for the union of the variants' windows,
+    with only the KPI columns their filters use
+    """
+    panel = get_market_panel()
+    if panel is not None:
+        return panel
+
+    windows = []
+    for config in configurations:
+        try:
+            windows.append(data_window(config["start_date"], config["end_date"]))
+        except ValueError:
+            pass  # the variant reports its invalid dates itself
+    starts = [start for start, _ in windows]
+    ends = [end for _, end in windows]
+    start_date = None if None in starts else min(starts)
+    end_date = None if None in ends else max(ends)
+    # A variant without KPI values selects on the default KPIs
+    kpi_columns = set()
+    for config in configurations:
+        kpi_columns.update(selected_kpis(config.get("kpis")) or DEFAULT_KPIS)
+    logger.info("Loading a market panel for the batch window %s to %s (%s KPIs)", start_date, end_date, len(kpi_columns))
+    return MarketPanel.load(start_date=start_date, end_date=end_date, kpi_columns=sorted(kpi_columns))
+
+
+def create_custom_indexes(configurations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Build several index variants from one data load.
+
+    Every configuration holds the keyword arguments of create_custom_index. The variants
+    select their rows from one shared panel and are built one after the other, so a batch
+    takes one index worker like any other build; a failing variant is reported in its own
+    entry instead of failing the batch.
+    """
+    start = time.time()
+    shared = SharedSelection(load_batch_panel(configurations))
+
+    results = []
+    for config in configurations:
+        try:
+            results.append({"success": True, "result": create_custom_index(**config, data_source=shared.select)})
+        except Exception as e:
+            results.append({"success": False, "error": str(e)})
+
+    logger.info("Built %s index variants in %.2f seconds (%s distinct selections, %s reused)",
+                len(configurations), time.time() - start, shared.distinct, shared.hits)
+    return results
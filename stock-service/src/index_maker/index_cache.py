@@ -0,0 +1,197 @@
+import os
+import gzip
+import asyncio
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from src.utils.utils import get_etl_version
+from src.index_maker.market_panel import get_market_panel
+
+
+INDEX_CACHE_MAX_MB = int(os.getenv("INDEX_CACHE_MAX_MB", "256"))
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR")  # optional on-disk tier
+INDEX_CACHE_ETL_CHECK_MINUTES = int(os.getenv("INDEX_CACHE_ETL_CHECK_MINUTES", "5"))
+
+LIST_FIELDS = ["selectedCountries", "selectedSectors", "selectedIndustries", "selectedStocks"]
+
+logger = logging.getLogger(__name__)
+
+
+def index_request_key(request: Dict[str, Any]) -> str:
+    """
+    Canonical hash of an index creation request.
+    List order doesn't matter and KPIs without selected values are dropped,
+    so requests that build the same index share the same key.
+    """
+    canonical = dict(request)
+    for field in LIST_FIELDS:
+        canonical[field] = sorted(set(canonical.get(field) or []))
+    canonical["selectedKPIs"] = {
+        kpi: sorted(set(values))
+        for kpi, values in (canonical.get("selectedKPIs") or {}).items()
+        if values
+    }
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IndexResultCache:
+    """
+    LRU cache of create_custom_index results, bounded by the size of the serialized results.
+
+    Results are stored as JSON bytes in memory and, if `disk_dir` is set, also as gzipped
+    files so they survive restarts and memory evictions. Every entry belongs to the ETL
+    version it was computed from; when the ETL version changes all entries are dropped, and
+    results of builds that started from another version are not stored.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.etl_version = None
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _version_tag(self) -> str:
+        return hashlib.sha256(str(self.etl_version).encode("utf-8")).hexdigest()[:12]
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{self._version_tag()}_{key}.json.gz")
+
+    def _put_memory(self, key: str, payload: bytes):
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key))
+        if len(payload) > self.max_bytes:
+            return
+        self._entries[key] = payload
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(payload)
+
+            if self.disk_dir:
+                path = self._disk_path(key)
+                if os.path.exists(path):
+                    try:
+                        with gzip.open(path, "rb") as f:
+                            payload = f.read()
+                        self._put_memory(key, payload)
+                        self.disk_hits += 1
+                        return json.loads(payload)
+                    except Exception as e:
+                        logger.warning("Could not read cached index %s: %s", path, e)
+
+            self.misses += 1
+            return None
+
+    async def get_many(self, keys: Dict[Hashable, str]) -> Dict[Hashable, Optional[Dict]]:
+        """
+        Look up several keys (e.g. the key of every currency of a request) on a worker thread:
+        reading a disk entry and decoding a large result would otherwise block the event loop
+        """
+        return await asyncio.to_thread(lambda: {name: self.get(key) for name, key in keys.items()})
+
+    def put(self, key: str, result: Dict, etl_version):
+        """
+        Store the result of a build that read the data of `etl_version` (see data_etl_version,
+        taken when the build started). It is dropped if that isn't the current version.
+        """
+        self.put_payload(key, json.dumps(result, separators=(",", ":"), default=str).encode("utf-8"), etl_version)
+
+    def put_payload(self, key: str, payload: bytes, etl_version):
+        """Store a result that is already serialized (compact JSON, as `put` writes it)"""
+        with self._lock:
+            if etl_version != self.etl_version:
+                self.stale_puts += 1
+                logger.info("Index %s was built from ETL version %s, not cached", key[:12], etl_version)
+                return
+            self._put_memory(key, payload)
+            if self.disk_dir:
+                path = self._disk_path(key)
+                tmp_path = f"{path}.tmp"
+                try:
+                    with gzip.open(tmp_path, "wb") as f:
+                        f.write(payload)
+                    os.replace(tmp_path, path)
+                except Exception as e:
+                    logger.warning("Could not write cached index %s: %s", path, e)
+
+    def sync_etl_version(self, etl_version):
+        """Drop every entry if the ETL has published a new version of the data"""
+        with self._lock:
+            if etl_version == self.etl_version:
+                return
+            had_version = self.etl_version is not None
+            self.etl_version = etl_version
+            self._entries.clear()
+            self._bytes = 0
+            if had_version:
+                self.invalidations += 1
+            if self.disk_dir:
+                current_tag = self._version_tag()
+                for name in os.listdir(self.disk_dir):
+                    if name.endswith(".json.gz") and not name.startswith(current_tag):
+                        try:
+                            os.remove(os.path.join(self.disk_dir, name))
+                        except OSError:
+                            pass
+            print(f"🧹 Index cache reset for ETL version {etl_version}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_dir": self.disk_dir,
+                "etl_version": str(self.etl_version) if self.etl_version is not None else None,
+            }
+
+
+index_cache = IndexResultCache(max_bytes=INDEX_CACHE_MAX_MB * 1024 * 1024, disk_dir=INDEX_CACHE_DIR)
+
+
+def data_etl_version():
+    """
+    ETL version of the data a build started now reads: the market panel's while it is loaded
+    (it may still hold the previous version after the cache was reset), otherwise the cache's
+    """
+    panel = get_market_panel()
+    return panel.etl_version if panel is not None else index_cache.etl_version
+
+
+def refresh_index_cache():
+    """Invalidate the index cache when raw.etl_summary.created_at has advanced"""
+    try:
+        index_cache.sync_etl_version(get_etl_version())
+    except Exception as e:
+        print(f"❌ Error checking ETL version for index cache: {e}")
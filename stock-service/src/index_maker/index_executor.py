@@ -0,0 +1,216 @@
+import os
+import asyncio
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from src.index_maker.market_panel import market_panel_files, use_market_panel
+from src.utils.stage_timing import RequestTimings, Stage, stage_histograms
+
+
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "2"))
+INDEX_QUEUE_SIZE = int(os.getenv("INDEX_QUEUE_SIZE", "8"))
+
+WORKER_LOG_FORMAT = "%(asctime)s %(levelname)s %(processName)s %(name)s: %(message)s"
+
+logger = logging.getLogger(__name__)
+
+
+class IndexQueueFullError(Exception):
+    """Raised when every worker is busy and the waiting queue is full"""
+
+
+def _init_worker(log_level: int):
+    logging.basicConfig(level=log_level, format=WORKER_LOG_FORMAT)
+
+
+def _run_build(fn: Callable, args: tuple, kwargs: dict, panel_files: Optional[Dict[str, Any]], events) -> Tuple[Any, List[Stage]]:
+    """
+    Runs in a worker process: open the market panel the build was submitted with (memory-mapped,
+    once per panel generation), then run the build and return its result with the stages it timed.
+    Stage and progress events go to the `events` queue, if any.
+    """
+    use_market_panel(panel_files)
+    timings = RequestTimings(listener=events.put if events is not None else None)
+    with timings.activate():
+        result = fn(*args, **kwargs)
+    return result, timings.stages
+
+
+class IndexBuildExecutor:
+    """
+    Runs index builds on a bounded pool of worker processes so they don't block the event loop.
+
+    The builds are CPU-bound (Polars, NumPy and the rebalance loop), so they run in processes
+    rather than threads, which would take turns on the GIL. Every build gets the current market
+    panel's files and opens them memory-mapped (see SharedMarketPanel), so the workers share one
+    copy of the panel through the page cache instead of each loading its own.
+
+    At most `workers` builds run at the same time and at most `queue_size` more wait for a
+    free worker; further submissions are rejected with IndexQueueFullError. A worker that dies
+    (e.g. killed for running out of memory) fails its build and the pool is started again.
+
+    Builds submitted with submit_shared are coalesced: concurrent submissions with the same key
+    await one build instead of each running its own.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._context = multiprocessing.get_context("spawn")
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.restarts = 0
+        # Shared builds in flight by key (only touched from the event loop)
+        self._shared: Dict[str, asyncio.Future] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Started on first use, so importing the module doesn't spawn processes
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=self._context,
+                    initializer=_init_worker,
+                    initargs=(logging.getLogger().getEffectiveLevel(),),
+                )
+            return self._pool
+
+    def _restart_pool(self, broken: ProcessPoolExecutor):
+        with self._lock:
+            if self._pool is not broken:
+                return  # another build has restarted it already
+            self._pool = None
+            self.restarts += 1
+        logger.warning("An index worker process died, restarting the index worker pool")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _event_queue(self):
+        """A queue the worker processes can put events into (served by a manager process)"""
+        with self._lock:
+            if self._manager is None:
+                self._manager = self._context.Manager()
+            return self._manager.Queue()
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    async def submit(self,
+                     fn: Callable,
+                     *args,
+                     listener: Optional[Callable[[Dict[str, Any]], None]] = None,
+                     **kwargs) -> Tuple[Any, List[Stage]]:
+        """
+        Run `fn(*args, **kwargs)` in a worker process and await its result and the stages it timed
+        (`fn` and its arguments must be picklable, e.g. a module-level function). The stages feed the
+        /metrics histograms here. A `listener` is called with the build's stage and progress events
+        on a thread of this process.
+        """
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise IndexQueueFullError(
+                    f"Index build queue is full ({self.workers} running, {self.queue_size} waiting)"
+                )
+            self._pending += 1
+
+        try:
+            events = self._event_queue() if listener is not None else None
+            pool = self._get_pool()
+            # The slot is released when the build finishes, even if the client has gone away
+            future = pool.submit(_run_build, fn, args, kwargs, market_panel_files(), events)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+
+        relay = None
+        if events is not None:
+            # The build's events are relayed until the end marker, put once the build is done
+            relay = threading.Thread(target=self._relay_events, args=(events, listener), name="index-build-events", daemon=True)
+            relay.start()
+            future.add_done_callback(lambda _: events.put(None))
+
+        try:
+            result, stages = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            self._restart_pool(pool)
+            raise
+        finally:
+            # Every event of the build reaches the listener before the build's result is returned
+            if relay is not None:
+                await asyncio.to_thread(relay.join)
+        for stage in stages:
+            stage_histograms.observe(stage)
+        return result, stages
+
+    @staticmethod
+    def _relay_events(events, listener: Callable[[Dict[str, Any]], None]):
+        while (event := events.get()) is not None:
+            listener(event)
+
+    async def submit_shared(self, key: str, build: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await `build()` (e.g. a coroutine submitting the build and caching its result), unless a build
+        with the same key (e.g. a canonical request hash) is in flight: then await that build's result
+        instead. A caller that goes away doesn't cancel the build for the others.
+        """
+        shared = self._shared.get(key)
+        if shared is None:
+            shared = asyncio.ensure_future(build())
+            self._shared[key] = shared
+            shared.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return await asyncio.shield(shared)
+
+    def _forget(self, key: str, build: asyncio.Future):
+        if self._shared.get(key) is build:
+            del self._shared[key]
+        # Retrieve the error, so a build every caller stopped waiting for isn't logged as unhandled
+        if not build.cancelled():
+            build.exception()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            # The pool doesn't report which submitted builds have started: the first `workers` are running
+            running = min(self._pending, self.workers)
+            return {
+                "workers": self.workers,
+                "running": running,
+                "queued": self._pending - running,
+                "max_queued": self.queue_size,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "restarts": self.restarts,
+                "shared_in_flight": len(self._shared),
+                "coalesced": self.coalesced,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+            manager, self._manager = self._manager, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+
+index_executor = IndexBuildExecutor(workers=INDEX_WORKERS, queue_size=INDEX_QUEUE_SIZE)
@@ -1,8 +1,17 @@
+import os
 import time
+import logging
+import numpy as np
 import polars as pl
 from datetime import datetime, date
-from typing import Union, Dict
-from src.utils.utils import run_query, run_query_to_polars_simple, run_query_debug, run_query_to_polars_simple1, run_query_to_polars_simple2
+from typing import Callable, Union, Dict, List, Optional, Tuple
+from src.utils.utils import run_query_to_polars
+from src.index_maker.rebalance import IndexPanel, rebalance_index, rebalance_index_with_state
+from src.index_maker.market_panel import get_market_panel, selected_kpis, DEFAULT_KPIS
+from src.index_maker.index_series import index_series_store, index_series_key
+from src.utils.analytics import to_date, rebase_series, trailing_returns, return_and_downside_risk
+from src.utils.stage_timing import timed_stage, report_progress
+from src.utils.fields_payload import fields_payloads, CompanyDimension
 pl.Config.set_tbl_rows(-1)
 pl.Config.set_tbl_cols(-1) 
 pl.Config.set_tbl_rows(None)
@@ -30,28 +39,93 @@ pl.Config.set_tbl_cols(None)
 
 
 
+RISK_LOOKBACK_DAYS = 380  # calendar days covering the 250 trading days calculate_risk_return looks back
+RISK_MIN_DAYS = 5 * 250  # calendar days calculate_risk_return needs to report a risk/return (zeros below)
+REBALANCE_PROGRESS_STEPS = 20  # progress reports per rebalance loop (for streamed index builds)
+STORED_SERIES_TOLERANCE = 1e-9  # relative difference up to which recomputed index values match the stored ones
+# DEBUG prints the intermediate frames of every index build (slow and verbose on large indexes)
+INDEX_LOG_LEVEL = getattr(logging, os.getenv("INDEX_LOG_LEVEL", "INFO").upper(), logging.INFO)
+# Polars engine for the index plans: "auto", "in-memory" or "streaming"
+INDEX_POLARS_ENGINE = os.getenv("INDEX_POLARS_ENGINE", "auto")
+
+# Build diagnostics of the src.index_maker modules are logged at INDEX_LOG_LEVEL
+logging.getLogger("src.index_maker").setLevel(INDEX_LOG_LEVEL)
+logger = logging.getLogger(__name__)
+
+
+def debug_dump(title: str, frame) -> None:
+    """Print an intermediate result, only when INDEX_LOG_LEVEL is DEBUG"""
+    if INDEX_LOG_LEVEL <= logging.DEBUG:
+        print(f"\n{title}:")
+        print(frame)
+
+
+def risk_on_full_history(index_start_date: Union[date, str, None],
+                         index_end_date: Union[date, str, None]) -> bool:
+    """
+    Whether the risk/return of the window comes from the full index history, as it did before the
+    window was pushed into the data load: for windows without a start date, or shorter than
+    RISK_MIN_DAYS (which would get zeros on their own)
+    """
+    index_start_date = to_date(index_start_date)
+    index_end_date = to_date(index_end_date) or date.today()
+    return index_start_date is None or (index_end_date - index_start_date).days < RISK_MIN_DAYS
+
+
+def data_window(index_start_date: Union[date, str, None],
+                index_end_date: Union[date, str, None]) -> Tuple[Optional[date], Optional[date]]:
+    """
+    Date range of the rows needed to build the index between the given dates.
+
+    The range starts at the beginning of the quarter before (index_start_date - RISK_LOOKBACK_DAYS):
+    that quarter's last day is a rebalance date, so the index is rebalanced from scratch before the
+    lookback starts and the (rebased) values inside the window are the same as with the full history.
+    Windows whose risk/return comes from the full history (see risk_on_full_history) need all rows:
+    (None, None).
+    """
+    if risk_on_full_history(index_start_date, index_end_date):
+        return None, None
+    index_start_date = to_date(index_start_date)
+    index_end_date = to_date(index_end_date)
+
+    lookback_start = date.fromordinal(index_start_date.toordinal() - RISK_LOOKBACK_DAYS)
+    quarter_start_month = 3 * ((lookback_start.month - 1) // 3) + 1
+    if quarter_start_month == 1:
+        fetch_start = date(lookback_start.year - 1, 10, 1)
+    else:
+        fetch_start = date(lookback_start.year, quarter_start_month - 3, 1)
+    return fetch_start, index_end_date
+
+########################################################
+########################################################
+########################################################
+
 def make_query(max_constituents, 
                selected_countries, 
                selected_sectors, 
                selected_industries, 
                selected_stocks,
-               kpis):
-    
+               kpis,
+               start_date: Optional[date] = None,
+               end_date: Optional[date] = None):
+
+    kpis = selected_kpis(kpis)
+
     if len(selected_countries) > 0:
         countries = "(" + ", ".join(f"'{c}'" for c in selected_countries) + ")"
-        countries_condition = f"AND country IN {countries}"
+        countries_condition = f"AND qms.country IN {countries}"
     else:
         countries_condition = ""
 
     if len(selected_sectors) > 0:
         sectors = "(" + ", ".join(f"'{s}'" for s in selected_sectors) + ")"
-        sectors_condition = f"AND sector IN {sectors}"
+        sectors_condition = f"AND qms.sector IN {sectors}"
     else:
         sectors_condition = ""
 
     if len(selected_industries) > 0:
         industries = "(" + ", ".join(f"'{i}'" for i in selected_industries) + ")"
-        industries_condition = f"AND industry IN {industries}"
+        industries_condition = f"AND qms.industry IN {industries}"
     else:
         industries_condition = ""
 
@@ -69,70 +143,53 @@ def make_query(max_constituents,
 
     # If no KPIs provided, select everything basicaly
     if not kpis:
-        kpis = {
-            'asset_turnover_perc': ['1', '20', '30', '40', '50', '60', '70', '80', '90', '99', '100']
-        }
+        kpis = DEFAULT_KPIS
 
     kpi_filters = []
     for kpi, values in kpis.items():
-        if values:
-            quoted_values = [f"'{v}'" for v in values]
-            kpi_filters.append(f"AND {kpi} IN ({', '.join(quoted_values)})")
+        quoted_values = [f"'{v}'" for v in values]
+        kpi_filters.append(f"AND {kpi} IN ({', '.join(quoted_values)})")
+
+    # Only rank the quarters whose constituents are held inside the date window
+    mcap_window_conditions = []
+    price_window_conditions = []
+    if start_date:
+        mcap_window_conditions.append(f"AND qms.year >= {start_date.year - 1}")
+        price_window_conditions.append(f"AND p7.date >= '{start_date.isoformat()}'")
+    if end_date:
+        mcap_window_conditions.append(f"AND qms.year <= {end_date.year}")
+        price_window_conditions.append(f"AND p7.date <= '{end_date.isoformat()}'")
+    mcap_window_sql = "\n        ".join(mcap_window_conditions)
+    price_window_sql = "\n        ".join(price_window_conditions)
 
     kpi_sql = "\n".join(kpi_filters)
-    active_kpis = [kpi for kpi, values in kpis.items() if values]
-    kpi_cols        = ", ".join(active_kpis)
-    prep3_kpi_cols  = ", ".join(f"p3.{kpi}" for kpi in active_kpis)
+    active_kpis = list(kpis.keys())
+    prep2_kpi_cols = ", ".join(f"p2.{kpi}" for kpi in active_kpis)
     prep6_kpi_cols = ", ".join(f"CAST(p6.{kpi} AS FLOAT8) AS {kpi}" for kpi in active_kpis)
 
-    import time
-
     query = f"""
-    SET enable_mergejoin = off;
-    WITH prep1 AS (
-        SELECT symbol
-        FROM raw.stock_info 
-        WHERE 1=1
-        {countries_condition}
-        {industries_condition}
-        {sectors_condition}
-    ),
-    prep2 AS (
+    WITH prep2 AS (
         SELECT *
         FROM clean.financial_metrics_perc
         WHERE 1=1
         {kpi_sql}
         {stocks_condition}
     ),
-    prep3 AS (
-        SELECT 
-            p2.symbol, p2.date, p2.fiscal_year, p2.period, p2.reported_currency,
-            {kpi_cols}
-        FROM prep2 p2
-        INNER JOIN prep1 p1 ON p2.symbol = p1.symbol
-    ),
     prep4 AS (
-        SELECT 
-    hmc.*,
-    'Q' || (
-        CASE 
-            --WHEN EXTRACT(YEAR FROM hmc.date)::INT = 2013 THEN 4
-            WHEN EXTRACT(QUARTER FROM hmc.date)::INT = 4 THEN 1
-            ELSE EXTRACT(QUARTER FROM hmc.date)::INT + 1
-        END
-    ) AS next_quarter,
-    CASE 
-        --WHEN EXTRACT(YEAR FROM hmc.date)::INT = 2013 THEN 2013
-        WHEN EXTRACT(QUARTER FROM hmc.date)::INT = 4 THEN EXTRACT(YEAR FROM hmc.date)::INT + 1
-        ELSE EXTRACT(YEAR FROM hmc.date)::INT
-    END AS next_year,
-            {prep3_kpi_cols}
-        FROM raw.historical_market_cap hmc
-        INNER JOIN prep3 p3
-        ON hmc.symbol = p3.symbol
-        AND hmc.year = p3.fiscal_year
-        AND hmc.quarter = p3.period
-        WHERE hmc.last_quarter_date = TRUE
+        SELECT
+            qms.symbol, qms.year, qms.quarter, qms.next_year, qms.next_quarter,
+            qms.market_cap, qms.market_cap_eur, qms.market_cap_usd,
+            {prep2_kpi_cols}
+        FROM clean.quarterly_mcap_snapshot qms
+        INNER JOIN prep2 p2
+        ON qms.symbol = p2.symbol
+        AND qms.year = p2.fiscal_year
+        AND qms.quarter = p2.period
+        WHERE 1=1
+        {countries_condition}
+        {industries_condition}
+        {sectors_condition}
+        {mcap_window_sql}
     ),
     prep5 AS (
         SELECT 
@@ -171,23 +228,30 @@ def make_query(max_constituents,
         AND p7.year = p6.next_year
         AND p7.quarter = p6.next_quarter
         WHERE volume_eur > 100000
+        {price_window_sql}
     )
     SELECT *
     FROM prep8
     --WHERE (EXTRACT(DOW FROM date) = 1 OR last_quarter_date = TRUE)
     """
-    df = run_query_to_polars_simple(query)
-    print("df")
+    df = run_query_to_polars(query, settings={"enable_mergejoin": "off"})
     return df
 
 ########################################################
 ########################################################
 ########################################################
 
-def make_index(df: pl.DataFrame,
-               index_currency: str = "EUR",
-               weight: str = "cap"
-               ) -> pl.DataFrame:
+def index_panels(df: pl.DataFrame,
+                 index_currencies: List[str],
+                 weight: str = "cap"
+                 ) -> Tuple[pl.Series, List[str], Dict[str, IndexPanel], np.ndarray]:
+    """
+    Dates, symbols, one IndexPanel (long-format prices and rebalance weights) per currency and the
+    rebalance rows of the index rows. The dates, symbol ids and rebalance days are shared by all
+    currencies; only the price and market cap columns differ.
+    """
+    if weight not in ("cap", "equal"):
+        raise ValueError(f"Invalid weight parameter: {weight}. Must be 'cap' or 'equal'.")
 
     ########## SETUP
 
@@ -199,168 +263,107 @@ def make_index(df: pl.DataFrame,
     elif df.schema["date"] != pl.Date:
         df = df.with_columns(pl.col("date").cast(pl.Date))
 
-    price_col = "close_eur" if index_currency == "EUR" else "close_usd"
-    mcap_col = "market_cap_eur" if index_currency == "EUR" else "market_cap_usd"
-
-    ############ PRICES PIVOT
-    # Create prices_pivot: date as index, columns = symbols
-    prices_pivot = (
-        df.select(["date", "symbol", price_col])
-          .pivot(index="date", columns="symbol", values=price_col)
-          .sort("date")
-          .with_columns([
-              pl.all().exclude("date").forward_fill()
-          ])
-    )
-
-    ########### WEIGHTS PIVOT
-
-    if weight == "cap":
+    with timed_stage("panel") as stage:
+        ########### DAY AND SYMBOL IDS
+        # Days are positions in the sorted dates, symbol ids positions in the order the symbols first appear
+        dates = df.get_column("date").unique().sort()
+        days = dates.to_physical().to_numpy()
+        symbols = df.get_column("symbol").unique(maintain_order=True).to_list()
+        df = df.with_columns([
+            pl.Series("day", np.searchsorted(days, df.get_column("date").to_physical().to_numpy())),
+            pl.col("symbol").cast(pl.Enum(symbols)).to_physical().alias("symbol_id"),
+        ])
 
-        daily_mcap_df = (
-            df.select(["date", "symbol", mcap_col])
-              .filter(pl.col(mcap_col).is_not_null())
-              .unique(subset=["date", "symbol"])
+        ########### REBALANCE DATES
+        rebalance_dates = (
+            pl.concat([
+                df.select("date").sort("date").limit(1),
+                df.filter(pl.col("last_quarter_date") == True).select("date")
+            ])
+            .unique()
+            .sort("date")
         )
-
-        total_mcap_df = (
-            daily_mcap_df
-            .group_by("date")
-            .agg(pl.col(mcap_col).sum().alias("total_mcap"))
+        rebalance_idx = np.searchsorted(days, rebalance_dates.get_column("date").to_physical().to_numpy())
+        stage.rows = df.height
+
+    panels = {}
+    for index_currency in index_currencies:
+        price_col = "close_eur" if index_currency == "EUR" else "close_usd"
+        mcap_col = "market_cap_eur" if index_currency == "EUR" else "market_cap_usd"
+
+        with timed_stage("prices") as stage:
+            ########### PRICES
+            prices = df.select(["symbol_id", "day", price_col]).filter(pl.col(price_col).is_not_null())
+            stage.rows = prices.height
+
+        with timed_stage("weights") as stage:
+            ########### REBALANCE WEIGHTS
+            # Target weights are only used on the rebalance days
+            rebalance_rows = df.filter(pl.col("day").is_in(pl.Series(rebalance_idx)))
+
+            if weight == "cap":
+                weights_df = (
+                    rebalance_rows.select(["day", "symbol_id", mcap_col])
+                      .filter(pl.col(mcap_col).is_not_null())
+                      .unique(subset=["day", "symbol_id"])
+                      .with_columns([
+                          (pl.col(mcap_col) / pl.col(mcap_col).sum().over("day")).alias("weight")
+                      ])
+                )
+            else:
+                weights_df = (
+                    rebalance_rows.select(["day", "symbol_id"])
+                      .unique(subset=["day", "symbol_id"])
+                      .with_columns([
+                          (1.0 / pl.len().over("day")).alias("weight")
+                      ])
+                )
+            stage.rows = weights_df.height
+
+        panels[index_currency] = IndexPanel(
+            n_dates=len(dates),
+            n_symbols=len(symbols),
+            price_symbols=prices.get_column("symbol_id").to_numpy(),
+            price_days=prices.get_column("day").to_numpy(),
+            price_values=prices.get_column(price_col).to_numpy(),
+            weight_days=weights_df.get_column("day").to_numpy(),
+            weight_symbols=weights_df.get_column("symbol_id").to_numpy(),
+            weight_values=weights_df.get_column("weight").to_numpy(),
         )
+        logger.debug("Index panel %s: %s dates, %s symbols, %s prices, %s weights on %s rebalance days",
+                     index_currency, f"{len(dates):,}", f"{len(symbols):,}", f"{prices.height:,}",
+                     f"{weights_df.height:,}", f"{len(rebalance_idx):,}")
 
-        daily_weights_df = (
-            daily_mcap_df.join(total_mcap_df, on="date")
-                         .with_columns([
-                             (pl.col(mcap_col) / pl.col("total_mcap")).alias("weight")
-                         ])
-                         .select(["date", "symbol", "weight"])
-        )
-    elif weight == "equal":
+    return dates, symbols, panels, rebalance_idx
 
-        daily_weights_df = (
-            df.select(["date", "symbol"])
-              .unique(subset=["date", "symbol"])
-              .group_by("date")
-              .agg([
-                  pl.col("symbol").count().alias("stock_count")
-              ])
-              .join(
-                  df.select(["date", "symbol"]).unique(subset=["date", "symbol"]),
-                  on="date"
-              )
-              .with_columns([
-                  (1.0 / pl.col("stock_count")).alias("weight")
-              ])
-              .select(["date", "symbol", "weight"])
-        )
-    else:
-        raise ValueError(f"Invalid weight parameter: {weight}. Must be 'cap' or 'equal'.")
 
-    weights_pivot = (
-        daily_weights_df
-        .pivot(index="date", columns="symbol", values="weight")
-        .sort("date")
-        .with_columns([
-            pl.all().exclude("date").fill_null(0.0)
-        ])
-    )
+def index_panel(df: pl.DataFrame,
+                index_currency: str = "EUR",
+                weight: str = "cap"
+                ) -> Tuple[pl.Series, List[str], IndexPanel, np.ndarray]:
+    """Dates, symbols, long-format prices and rebalance weights (IndexPanel) and rebalance rows of the index rows"""
+    dates, symbols, panels, rebalance_idx = index_panels(df, [index_currency], weight)
+    return dates, symbols, panels[index_currency], rebalance_idx
 
-    # Ensure same columns & order
-    symbols = [col for col in prices_pivot.columns if col != "date"]
-    prices_pivot = prices_pivot.select(["date"] + symbols)
-    weights_pivot = weights_pivot.select(["date"] + symbols)
-
-    print("prices_pivot")
-    print(prices_pivot)
-    print("weights_pivot")
-    print(weights_pivot)
-
-    ########### REBALANCE DATES
-    rebalance_dates = (
-        pl.concat([
-            df.select("date").sort("date").limit(1),
-            df.filter(pl.col("last_quarter_date") == True).select("date")
-        ])
-        .unique()
-        .sort("date")
-    )
-    rebalance_dates_list = rebalance_dates["date"].to_list()
-
-    ########### SHARES DF
-
-    shares_chunks = []
-    current_index_value = 1000
-
-    for i, start_date in enumerate(rebalance_dates_list):
-        end_date = rebalance_dates_list[i + 1] if i + 1 < len(rebalance_dates_list) else None
-
-        # Filter date range
-        date_mask = pl.col("date") >= start_date
-        if end_date:
-            date_mask &= pl.col("date") < end_date
-
-        # Slice relevant date range
-        period_dates = prices_pivot.filter(date_mask).select("date")
-
-        # Get prices and weights at start_date
-        prices = prices_pivot.filter(pl.col("date") == start_date).select(symbols)
-        weights = weights_pivot.filter(pl.col("date") == start_date).select(symbols)
-
-        # Compute shares for this period using current index value
-        shares = [
-            (weights[s][0] * current_index_value / prices[s][0]) if prices[s][0] not in [None, 0.0] else 0.0
-            for s in symbols
-        ]
-
-        # Repeat shares for all dates in the period
-        repeated_shares = period_dates.with_columns([
-            pl.lit(share).alias(sym) for sym, share in zip(symbols, shares)
-        ])
-        shares_chunks.append(repeated_shares)
 
-        # Update index value using last available date in period
-        last_date = period_dates["date"][-1]
-        last_prices = prices_pivot.filter(pl.col("date") == last_date).select(symbols)
-
-        current_index_value = sum([
-            share * last_prices[s][0] if last_prices[s][0] is not None else 0.0
-            for s, share in zip(symbols, shares)
-        ])
-
-    shares_df = pl.concat(shares_chunks).sort("date")
-    print("shares_df")
-    print(shares_df)
+def make_index(df: pl.DataFrame,
+               index_currency: str = "EUR",
+               weight: str = "cap"
+               ) -> pl.DataFrame:
 
+    dates, _, panel, rebalance_idx = index_panel(df, index_currency, weight)
 
     ########### INDEX
-    values_df = (
-        shares_df
-        .join(prices_pivot, on="date", suffix="_price")
-        .with_columns([
-            (pl.col(sym) * pl.col(f"{sym}_price")).alias(sym)
-            for sym in symbols
-        ])
-        .select(["date"] + symbols)
-    )
+    index_values = rebalance_index(panel, rebalance_idx, start_value=1000)
 
-    # Final index = sum of all values per day
-    index_df = (
-        values_df
-        .with_columns([
-            pl.sum_horizontal(pl.all().exclude("date")).alias("index_value")
-        ])
-        .select(["date", "index_value"])
-    )
+    index_df = pl.DataFrame({
+        "date": dates,
+        "index_value": pl.Series(values=index_values, dtype=pl.Float64),
+    })
 
-    # Print index head and tail
-    #pl.Config.set_tbl_rows(10000)
-    print("\n📈 First 10 index values:")
-    print(index_df.head(100))
+    debug_dump("📈 First 10 index values", index_df.head(10))
+    debug_dump("📉 Last 10 index values", index_df.tail(10))
 
-    print("\n📉 Last 10 index values:")
-    print(index_df.tail(10))
-    
     return index_df
 
 ########################################################
@@ -368,81 +371,232 @@ def make_index(df: pl.DataFrame,
 ########################################################
 
 
-def make_constituent_weights(df: pl.DataFrame, index_currency: str = "EUR", weight: str = "cap") -> pl.DataFrame:
+def make_constituent_weights_by_currency(df: Union[pl.DataFrame, pl.LazyFrame],
+                                         index_currencies: List[str],
+                                         weight: str = "cap",
+                                         companies: Optional[CompanyDimension] = None) -> Dict[str, pl.DataFrame]:
+    """
+    Constituent weights per quarter for each currency, from one aggregation of the rows:
+    the constituents are the same in every currency, only the market caps differ.
+    """
+    if companies is None:
+        # Shared company dimension, reloaded only when field_maker rewrites the field files
+        companies = fields_payloads.refresh().dimension
+    mcap_cols = {c: "market_cap_eur" if c == "EUR" else "market_cap_usd" for c in index_currencies}
 
-    mcap_col = "market_cap_eur" if index_currency == "EUR" else "market_cap_usd"
-    companies_df = pl.read_csv("src/utils/fields/companies.csv")
-    
     if weight == "cap":
-        # Market cap weighted - current implementation
-        weights_df = (
-            df.select(["year", "quarter", "symbol", mcap_col])
+        # Market cap weighted: every symbol's largest market cap of the quarter over the quarter's total
+        weights = (
+            df.lazy()
               .group_by(["year", "quarter", "symbol"])
-              .agg([
-                  pl.col(mcap_col).max().alias("max_market_cap")
-              ])
-              .group_by(["year", "quarter"])
-              .agg([
-                  pl.col("max_market_cap").sum().alias("total_mcap")
-              ])
-              .join(
-                  df.select(["year", "quarter", "symbol", mcap_col])
-                    .group_by(["year", "quarter", "symbol"])
-                    .agg([
-                        pl.col(mcap_col).max().alias("max_market_cap")
-                    ]),
-                  on=["year", "quarter"]
-              )
+              .agg([pl.col(col).max().alias(f"max_{col}") for col in set(mcap_cols.values())])
               .with_columns([
-                  (pl.col("max_market_cap") / pl.col("total_mcap")).alias("weight")
+                  (pl.col(f"max_{col}") / pl.col(f"max_{col}").sum().over(["year", "quarter"])).alias(f"weight_{currency}")
+                  for currency, col in mcap_cols.items()
               ])
-              .filter(pl.col("weight") > 0)  # Only include companies with weight > 0
-              .join(
-                  companies_df.select(["symbol", "company_name", "country"]),
-                  on="symbol",
-                  how="left"
-              )
+        )
+    elif weight == "equal":
+        weights = (
+            df.lazy()
+              .select(["year", "quarter", "symbol"])
+              .unique()
               .with_columns([
-                  pl.col("company_name").fill_null(pl.col("symbol"))  # Use symbol as fallback if name not found
+                  (1.0 / pl.len().over(["year", "quarter"])).alias(f"weight_{currency}") for currency in mcap_cols
               ])
-              .select(["year", "quarter", "symbol", "company_name", "country", "weight"])
-              .sort(["year", "quarter", "weight"], descending=[True, True, True])
         )
-    elif weight == "equal":
+    else:
+        raise ValueError(f"Invalid weight parameter: {weight}. Must be 'cap' or 'equal'.")
+
+    weights = (
+        weights
+          .with_columns(companies.encode(pl.col("symbol")).alias("symbol_id"))
+          .join(
+              companies.table.lazy().select(["symbol_id", "company_name", "country"]),
+              on="symbol_id",
+              how="left"
+          )
+          .with_columns([
+              pl.col("company_name").cast(pl.Utf8).fill_null(pl.col("symbol")),  # Use symbol as fallback if name not found
+              pl.col("country").cast(pl.Utf8),
+          ])
+          .collect(engine=INDEX_POLARS_ENGINE)
+    )
 
+    weights_by_currency = {}
+    for currency in mcap_cols:
         weights_df = (
-            df.select(["year", "quarter", "symbol"])
-              .group_by(["year", "quarter", "symbol"])
-              .agg([
-                  pl.col("symbol").count().alias("dummy")  # Just to group by symbol
-              ])
-              .group_by(["year", "quarter"])
-              .agg([
-                  pl.col("symbol").count().alias("stock_count")
-              ])
-              .join(
-                  df.select(["year", "quarter", "symbol"]).unique(subset=["year", "quarter", "symbol"]),
-                  on=["year", "quarter"]
-              )
-              .with_columns([
-                  (1.0 / pl.col("stock_count")).alias("weight")
-              ])
-              .join(
-                  companies_df.select(["symbol", "company_name", "country"]),
-                  on="symbol",
-                  how="left"
-              )
-              .with_columns([
-                  pl.col("company_name").fill_null(pl.col("symbol"))  # Use symbol as fallback if name not found
-              ])
-              .select(["year", "quarter", "symbol", "company_name", "country", "weight"])
+            weights
+              .select(["year", "quarter", "symbol", "company_name", "country", pl.col(f"weight_{currency}").alias("weight")])
+              .filter(pl.col("weight") > 0)  # Only include companies with weight > 0
               .sort(["year", "quarter", "weight"], descending=[True, True, True])
         )
+        weights_by_currency[currency] = weights_df
+    return weights_by_currency
+
+
+def make_constituent_weights(df: Union[pl.DataFrame, pl.LazyFrame],
+                             index_currency: str = "EUR",
+                             weight: str = "cap",
+                             companies: Optional[CompanyDimension] = None) -> pl.DataFrame:
+    return make_constituent_weights_by_currency(df, [index_currency], weight, companies)[index_currency]
+
+
+########################################################
+########################################################
+########################################################
+########################################################
+
+def _quarter_order(year, quarter):
+    """Sortable number of a quarter (year * 10 + quarter), for expressions or plain values"""
+    if isinstance(quarter, pl.Expr):
+        return year.cast(pl.Int64) * 10 + quarter.str.slice(1).cast(pl.Int64)
+    return int(year) * 10 + int(quarter[1:])
+
+
+def make_index_series(load_rows: Callable[..., pl.DataFrame],
+                      series_keys: Dict[str, str],
+                      fetch_start: Optional[date],
+                      fetch_end: Optional[date],
+                      weight: str = "cap"
+                      ) -> Dict[str, Tuple[pl.DataFrame, pl.DataFrame]]:
+    """
+    Index values and constituent weights from fetch_start up to fetch_end, per currency.
+
+    `series_keys` maps every currency to its series key; all currencies are computed from one
+    `load_rows(start_date=..., end_date=...)` call, sharing the dates and rebalance days.
+    If the series of all currencies were persisted before (from the same rebalance), only the rows
+    since that rebalance are loaded: the series continue from the stored shares, and the days since
+    that rebalance (plus any new quarters) are recomputed. Persisted series outlive ETL runs, so the
+    stored days since the rebalance are checked against the recomputed ones; if they differ, or the
+    rebalance day is no longer in the data, the whole window is computed again. The results are
+    persisted again so the next request can extend them.
+    """
+    stored = {currency: index_series_store.load(key) for currency, key in series_keys.items()}
+    rebalance_dates = {s[2]["rebalance_date"] for s in stored.values() if s is not None}
+
+    result = None
+    # None: the stored series weren't checked, True/False: they (don't) match the current data
+    stored_match = None
+    if all(s is not None for s in stored.values()) and len(rebalance_dates) == 1:
+        rebalance_date = rebalance_dates.pop()
+        if fetch_end is None or fetch_end >= rebalance_date:
+            df = load_rows(start_date=rebalance_date, end_date=fetch_end)
+            logger.info("Extending index series %s from %s: %s rows",
+                        ", ".join(k[:12] for k in series_keys.values()), rebalance_date, f"{df.height:,}")
+            if df.filter(pl.col("date") == rebalance_date).is_empty():
+                logger.info("Rebalance day %s is no longer in the data, rebuilding the series", rebalance_date)
+                stored_match = False
+            else:
+                result = _index_series(df, series_keys, weight, stored, rebalance_date)
+                stored_match = result is not None
+                if not stored_match:
+                    logger.info("Stored index series differ from the data since %s, rebuilding the series", rebalance_date)
+
+    if result is None:
+        df = load_rows(start_date=fetch_start, end_date=fetch_end)
+        result = _index_series(df, series_keys, weight)
+
+    end_quarter = _quarter_order(fetch_end.year, f"Q{(fetch_end.month - 1) // 3 + 1}") if fetch_end else None
+    series_by_currency = {}
+    for currency, (series, weights_df, state) in result.items():
+        # A valid stored series that reaches further than this window is kept
+        previous = stored[currency]
+        if state is not None and (previous is None or stored_match is False or state["last_date"] >= previous[2]["last_date"]):
+            index_series_store.save(series_keys[currency], series, weights_df, state)
+        if end_quarter is not None:
+            weights_df = weights_df.filter(_quarter_order(pl.col("year"), pl.col("quarter")) <= end_quarter)
+        series_by_currency[currency] = (series, weights_df)
+    return series_by_currency
+
+
+def _index_series(df: pl.DataFrame,
+                  series_keys: Dict[str, str],
+                  weight: str,
+                  stored: Optional[Dict[str, Tuple[pl.DataFrame, pl.DataFrame, Dict]]] = None,
+                  rebalance_date: Optional[date] = None
+                  ) -> Optional[Dict[str, Tuple[pl.DataFrame, pl.DataFrame, Optional[Dict]]]]:
+    """
+    (Index series, constituent weights, state to persist) per currency, computed from the rows.
+    With a rebalance_date the rows start on that stored rebalance and the stored series are
+    continued; None is returned if the stored days since the rebalance don't match the rows.
+    """
+    dates, symbols, panels, rebalance_idx = index_panels(df, list(series_keys), weight)
+    if rebalance_date is not None:
+        # The first row is the stored rebalance: keep its shares instead of rebalancing again
+        rebalance_idx = rebalance_idx[(dates.gather(rebalance_idx) > rebalance_date).to_numpy()]
+        new_quarters = df.filter(pl.col("date") > rebalance_date).select(["year", "quarter"]).unique()
+        rows = df.lazy().join(new_quarters.lazy(), on=["year", "quarter"], how="semi")
     else:
-        raise ValueError(f"Invalid weight parameter: {weight}. Must be 'cap' or 'equal'.")
-    
-    return weights_df
+        rows = df
+
+    with timed_stage("constituents"):
+        new_weights = make_constituent_weights_by_currency(rows, list(series_keys), weight)
+
+    result = {}
+    for currency in series_keys:
+        start_shares = None
+        if rebalance_date is not None:
+            series, weights_df, stored_state = stored[currency]
+            start_shares = np.array([stored_state["shares"].get(sym, 0.0) for sym in symbols], dtype=np.float64)
+
+        def progress(done: int, total: int, currency: str = currency):
+            if done == total or done % max(1, total // REBALANCE_PROGRESS_STEPS) == 0:
+                report_progress("rebalance", done, total, currency=currency)
+
+        with timed_stage("rebalance") as stage:
+            index_values, last_rebalance, shares = rebalance_index_with_state(
+                panels[currency], rebalance_idx, start_value=1000, start_shares=start_shares, progress=progress
+            )
+            stage.rows = len(index_values)
+        computed = pl.DataFrame({
+            "date": dates,
+            "index_value": pl.Series(values=index_values, dtype=pl.Float64),
+        })
+
+        if rebalance_date is None:
+            series = computed
+            weights_df = new_weights[currency]
+        else:
+            if not _matches_stored(series.filter(pl.col("date") >= rebalance_date), computed):
+                return None
+            series = pl.concat([series.filter(pl.col("date") < rebalance_date), computed])
+            # The quarter ending on the stored rebalance date only has that day's rows here: keep its weights
+            weights_df = (
+                pl.concat([
+                    weights_df.join(new_quarters, on=["year", "quarter"], how="anti"),
+                    new_weights[currency].cast(weights_df.schema),
+                ])
+                .sort(["year", "quarter", "weight"], descending=[True, True, True])
+            )
 
+        # Without a rebalance in the new rows, the stored rebalance of this currency still holds
+        state = None
+        if last_rebalance >= 0:
+            state = {
+                "rebalance_date": dates[last_rebalance],
+                "shares": {sym: float(n) for sym, n in zip(symbols, shares) if n != 0.0},
+            }
+        elif rebalance_date is not None:
+            state = {"rebalance_date": stored_state["rebalance_date"], "shares": stored_state["shares"]}
+        if state is not None:
+            state["last_date"] = series.get_column("date").max()
+            state["index_value"] = float(series.get_column("index_value").tail(1)[0])
+        result[currency] = (series, weights_df, state)
+    return result
+
+
+def _matches_stored(stored: pl.DataFrame, computed: pl.DataFrame) -> bool:
+    """Whether the recomputed index values agree with the stored ones on every stored day they cover"""
+    stored = stored.filter(pl.col("date") <= computed.get_column("date").max())
+    joined = stored.join(computed, on="date", how="left", suffix="_computed")
+    if joined.get_column("index_value_computed").null_count() > 0:
+        return False  # a stored day is no longer in the data
+    return bool(np.allclose(
+        joined.get_column("index_value_computed").to_numpy(),
+        joined.get_column("index_value").to_numpy(),
+        rtol=STORED_SERIES_TOLERANCE,
+        atol=0.0,
+    ))
 
 ########################################################
 ########################################################
@@ -456,35 +610,10 @@ def trim_index(
     index_end_date: Union[date, str, None] = None,
     ) -> pl.DataFrame:
 
-    if isinstance(index_start_date, str):
-        index_start_date = datetime.strptime(index_start_date, "%Y-%m-%d").date()
-    if isinstance(index_end_date, str):
-        index_end_date = datetime.strptime(index_end_date, "%Y-%m-%d").date()
+    df = rebase_series(df, "index_value", index_start_amount, index_start_date, index_end_date)
 
-    df = df.filter(pl.col("date") >= index_start_date)
-    if index_end_date:
-        df = df.filter(pl.col("date") <= index_end_date)
-
-    df = df.sort("date")
-
-    index_vals = df.get_column("index_value").to_list()
-    returns = [1.0]
-    for i in range(1, len(index_vals)):
-        returns.append(index_vals[i] / index_vals[i - 1])
-
-    # Rebuild new index
-    new_index_vals = [float(index_start_amount)]
-    for r in returns[1:]:
-        new_index_vals.append(new_index_vals[-1] * r)
-
-    # Replace index_value column with new values (as Float64!)
-    df = df.with_columns([
-        pl.Series(name="index_value", values=new_index_vals, dtype=pl.Float64)
-    ]).select(["date", "index_value"])
-
-    # Print before returning
     print("Index values calculated at", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-    print(df)
+    debug_dump("index_df", df)
 
     return df
 
@@ -492,49 +621,45 @@ def trim_index(
 ########################################################
 ########################################################
 
-def calculate_risk_return(df: pl.DataFrame) -> Dict[str, float]:
+def calculate_risk_return(df: pl.DataFrame,
+                          index_start_date: Union[date, str, None] = None,
+                          index_end_date: Union[date, str, None] = None) -> Dict[str, float]:
+    """
+    Average 250-day return and downside risk of the index.
+    If a window is given, only returns ending inside it are used (the 250 days before
+    index_start_date serve as lookback). Windows shorter than RISK_MIN_DAYS (from index_start_date,
+    not counting the lookback) get zeros; create_custom_index passes no window for them, so they get
+    the full-history values (see risk_on_full_history).
+    """
+    index_start_date = to_date(index_start_date)
+    index_end_date = to_date(index_end_date)
+    if index_end_date:
+        df = df.filter(pl.col("date") <= index_end_date)
+
     if df.is_empty():
         return {"return": 0.0, "risk": 0.0}
         
     # Sort by date descending to get latest values first
     df = df.sort("date", descending=True)
+    dates = df.get_column("date")
+
+    # Check if the window spans at least 5 * 250 days (the lookback rows before it don't count)
+    window_start = max(dates.min(), index_start_date) if index_start_date else dates.min()
+    days_between = (dates.max() - window_start).days
     
-    # Get all values
-    values = df.get_column("index_value").to_list()
-    dates = df.get_column("date").to_list()
-    
-    # Check if we have at least 5 years of data
-    first_date = dates[-1]
-    last_date = dates[0]
-    days_between = (last_date - first_date).days
-    
-    if days_between < 5 * 250:
+    if days_between < RISK_MIN_DAYS:
         return {"return": 0.0, "risk": 0.0}
     
     # Calculate returns between t0 and t-250
-    returns = []
-    for i in range(len(values)):
-        if i + 250 >= len(values):
-            break
-        t0_val = values[i]
-        t250_val = values[i + 250]
-        ret = (t0_val / t250_val) - 1
-        returns.append(ret)
-    
-    # Calculate average return
-    avg_return = sum(returns) / len(returns) if returns else 0.0
-    
-    # Calculate risk (std dev of negative returns)
-    neg_returns = [r for r in returns if r < 0]
-    risk = 0.0
-    if neg_returns:
-        mean = sum(neg_returns) / len(neg_returns)
-        squared_diff = [(r - mean) ** 2 for r in neg_returns]
-        risk = (sum(squared_diff) / len(neg_returns)) ** 0.5
+    returns = trailing_returns(df.get_column("index_value").to_numpy())
+    if index_start_date:
+        returns = returns[(dates.head(len(returns)) >= index_start_date).to_numpy()]
+
+    avg_return, risk = return_and_downside_risk(returns)
         
     return {
-        "return": round(float(avg_return), 4),
-        "risk": round(float(risk), 4)
+        "return": round(avg_return, 4),
+        "risk": round(risk, 4)
     }
 
 ########################################################
@@ -544,7 +669,7 @@ def calculate_risk_return(df: pl.DataFrame) -> Dict[str, float]:
 ########################################################
 
 def create_custom_index(index_size,
-                        currency, 
+                        currency: Union[str, List[str]],
                         start_amount, 
                         start_date, 
                         end_date, 
@@ -553,70 +678,114 @@ def create_custom_index(index_size,
                         industries, 
                         kpis, 
                         stocks,
-                        weight):
+                        weight,
+                        data_source: Optional[Callable[..., pl.DataFrame]] = None,
+                        serialize: bool = True):
+    """
+    Build a custom index. With a list of currencies (e.g. ["EUR", "USD"]) every currency is computed
+    from the same rows, constituents and rebalance days, and a dict of results keyed by currency
+    is returned instead of a single result.
+    Without `serialize`, index_df and constituent_weights are returned as Polars frames (e.g. to be
+    streamed in chunks) instead of lists of dicts.
+    """
 
     try:
 
         print(f"Starting index creation at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-        # Create the query and get the data
-        df = make_query(
-            max_constituents=index_size,
-            selected_countries=countries,
-            selected_sectors=sectors,
-            selected_industries=industries,
-            selected_stocks=stocks,
-            kpis=kpis
-        )
-        print(f"Index data loaded at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-
-
-        index_df = make_index(
-            df,
-            index_currency=currency,
+        # KPIs without values don't filter: both data sources and the series key see the same selection
+        kpis = selected_kpis(kpis)
+        currencies = [currency] if isinstance(currency, str) else list(dict.fromkeys(currency))
+        # Only the window (plus the rebalance/risk lookback) is fetched instead of the full history,
+        # unless the risk/return of the window comes from the full history
+        fetch_start, fetch_end = data_window(start_date, end_date)
+        risk_window = (None, None) if risk_on_full_history(start_date, end_date) else (start_date, end_date)
+        # Select the data from the in-memory market panel, or query the database if it isn't loaded
+        # (a batch passes its own source, shared by all of its variants)
+        if data_source is None:
+            panel = get_market_panel()
+            data_source = panel.select if panel is not None else make_query
+        source_name = "database" if data_source is make_query else "market panel"
+
+        def load_rows(start_date, end_date):
+            with timed_stage("select") as stage:
+                df = data_source(
+                    max_constituents=index_size,
+                    selected_countries=countries,
+                    selected_sectors=sectors,
+                    selected_industries=industries,
+                    selected_stocks=stocks,
+                    kpis=kpis,
+                    start_date=start_date,
+                    end_date=end_date
+                )
+                stage.rows = df.height
+            print(f"Index data loaded from {source_name} at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+            logger.info("Rows loaded: %s for %s symbols, window %s to %s",
+                        f"{df.height:,}", f"{df.get_column('symbol').n_unique():,}", start_date, end_date)
+            return df
+
+        # A series computed before for the same configuration is only extended with the new days
+        series_keys = {
+            c: index_series_key(index_size, c, weight, countries, sectors, industries, stocks, kpis, fetch_start)
+            for c in currencies
+        }
+        series = make_index_series(
+            load_rows,
+            series_keys,
+            fetch_start,
+            fetch_end,
             weight=weight
             )
         print(f"Index values calculated at {time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-        risk_return = calculate_risk_return(index_df)
-        print("risk_return")
-        print(risk_return)
-
-        index_df = trim_index(
-            index_df,
-            index_start_amount=start_amount,
-            index_start_date=start_date,
-            index_end_date=end_date
-        )
-        
-
-        constituent_weights = make_constituent_weights(df, currency, weight)
-        print("constituent_weights")
-        print(constituent_weights)
-
-        print("index_df_to dict")
-        index_data = index_df.to_dicts()
+        results = {}
+        for index_currency, (index_df, constituent_weights) in series.items():
+            with timed_stage("risk"):
+                risk_return = calculate_risk_return(index_df, index_start_date=risk_window[0], index_end_date=risk_window[1])
+            logger.info("Risk/return %s: %s", index_currency, risk_return)
+
+            with timed_stage("trim") as stage:
+                index_df = trim_index(
+                    index_df,
+                    index_start_amount=start_amount,
+                    index_start_date=start_date,
+                    index_end_date=end_date
+                )
+                stage.rows = index_df.height
+
+            debug_dump("constituent_weights", constituent_weights)
+
+            if serialize:
+                with timed_stage("serialize") as stage:
+                    index_data = index_df.to_dicts()
+                    weights_data = constituent_weights.to_dicts()
+                    stage.rows = len(index_data) + len(weights_data)
+            else:
+                index_data, weights_data = index_df, constituent_weights
+
+            results[index_currency] = {
+                "index_df": index_data,
+                "constituent_weights": weights_data,
+                "risk_return": risk_return,
+            }
         
         # Print the final index result for debugging/monitoring
         print(f"\n🎯 FINAL INDEX RESULT:")
-        print(f"   • Total data points: {len(index_data)}")
+        print(f"   • Total data points: {len(results[currencies[0]]['index_df'])}")
         print(f"   • Date range: {start_date} to {end_date}")
-        print(f"   • Currency: {currency}")
+        print(f"   • Currency: {', '.join(currencies)}")
         print(f"   • Start amount: {start_amount}")
         print(f"   • Index size: {index_size} stocks")
         print(f"   • Countries: {len(countries)}")
         print(f"   • Sectors: {len(sectors)}")
         print(f"   • Industries: {len(industries)}")
-        print(f"   • KPIs: {len([k for k, v in kpis.items() if v])}")
+        print(f"   • KPIs: {len(kpis)}")
         print(f"   • Selected stocks: {len(stocks)}")
         
 
         print(f"\n✅ Index creation completed successfully!")
         
-        return {
-            "index_df": index_df.to_dicts(), 
-            "constituent_weights": constituent_weights.to_dicts(),
-            "risk_return": risk_return,
-        }
+        return results[currency] if isinstance(currency, str) else results
     except Exception as e:
         print(f"❌ Error creating index: {e}")
         raise e
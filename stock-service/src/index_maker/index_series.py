@@ -0,0 +1,144 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+import polars as pl
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+INDEX_SERIES_DIR = os.getenv("INDEX_SERIES_DIR")  # persisted index series (disabled when unset)
+
+logger = logging.getLogger(__name__)
+
+
+def index_series_key(index_size: int,
+                     currency: str,
+                     weight: str,
+                     countries: List[str],
+                     sectors: List[str],
+                     industries: List[str],
+                     stocks: List[str],
+                     kpis: Dict[str, List],
+                     fetch_start: Optional[date]) -> str:
+    """
+    Hash of everything that determines an index series, except its end date.
+    A series built up to some date is the beginning of the same series built up to a later date,
+    so one persisted series serves (and is extended by) every end date.
+    """
+    config = {
+        "index_size": index_size,
+        "currency": currency,
+        "weight": weight,
+        "countries": sorted(set(countries or [])),
+        "sectors": sorted(set(sectors or [])),
+        "industries": sorted(set(industries or [])),
+        "stocks": sorted(set(stocks or [])),
+        "kpis": {kpi: sorted(set(map(str, values))) for kpi, values in (kpis or {}).items() if values},
+        "fetch_start": fetch_start.isoformat() if fetch_start else None,
+    }
+    payload = json.dumps(config, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IndexSeriesStore:
+    """
+    Local Parquet store of computed index series.
+
+    For every key it keeps the daily index values, the constituent weights per quarter and a
+    JSON state file with the last rebalance (date and shares per symbol) and the last computed
+    day. The state file is written last and names the Parquet files it belongs to, so readers
+    never see a series and a state from different computations. Writes hold a file lock, as the
+    index worker processes (and uvicorn workers) share the directory.
+
+    Series are kept across ETL runs: whoever extends a series checks its stored days against the
+    current data first, and a series is only replaced when they no longer match (see
+    make_index_series).
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the write lock (across threads and processes) for as long as the block runs"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self._path(".lock"), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self, key: str) -> Optional[Tuple[pl.DataFrame, pl.DataFrame, Dict[str, Any]]]:
+        """Persisted (index series, constituent weights, state) for the key, or None"""
+        if not self.enabled:
+            return None
+        state_path = self._path(f"{key}.json")
+        if not os.path.exists(state_path):
+            return None
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+            series = pl.read_parquet(self._path(state["series_file"]))
+            weights = pl.read_parquet(self._path(state["weights_file"]))
+        except Exception as e:
+            logger.warning("Could not read index series %s: %s", key, e)
+            return None
+        state["rebalance_date"] = date.fromisoformat(state["rebalance_date"])
+        state["last_date"] = date.fromisoformat(state["last_date"])
+        return series, weights, state
+
+    def save(self, key: str, series: pl.DataFrame, weights: pl.DataFrame, state: Dict[str, Any]):
+        """Persist a series, replacing the one stored under the key"""
+        if not self.enabled:
+            return
+        generation = uuid.uuid4().hex[:12]
+        series_file = f"{key}_{generation}_series.parquet"
+        weights_file = f"{key}_{generation}_weights.parquet"
+        state_path = self._path(f"{key}.json")
+        payload = {
+            **state,
+            "rebalance_date": state["rebalance_date"].isoformat(),
+            "last_date": state["last_date"].isoformat(),
+            "series_file": series_file,
+            "weights_file": weights_file,
+        }
+        try:
+            # The files are written under the lock too: a concurrent save of the key removes the other files
+            with self.exclusive():
+                series.write_parquet(self._path(series_file))
+                weights.write_parquet(self._path(weights_file))
+                with open(f"{state_path}.tmp", "w") as f:
+                    json.dump(payload, f)
+                os.replace(f"{state_path}.tmp", state_path)
+                # Files of earlier computations of this key are no longer referenced
+                for name in os.listdir(self.directory):
+                    if name.startswith(f"{key}_") and name.endswith(".parquet") and generation not in name:
+                        os.remove(self._path(name))
+        except Exception as e:
+            logger.warning("Could not write index series %s: %s", key, e)
+
+
+index_series_store = IndexSeriesStore(INDEX_SERIES_DIR)
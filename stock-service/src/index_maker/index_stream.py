@@ -0,0 +1,106 @@
+import os
+import json
+import asyncio
+import logging
+import polars as pl
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+from src.index_maker.index_cache import index_cache, data_etl_version
+from src.index_maker.index_executor import index_executor
+from src.utils.stage_timing import stages_summary
+
+
+INDEX_STREAM_CHUNK_ROWS = int(os.getenv("INDEX_STREAM_CHUNK_ROWS", "500"))
+
+logger = logging.getLogger(__name__)
+
+
+def _json(data: Any) -> str:
+    # Same encoding as the index cache payloads
+    return json.dumps(data, separators=(",", ":"), default=str)
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    """One Server-Sent Event with a JSON data line"""
+    return f"event: {event}\ndata: {_json(data)}\n\n".encode("utf-8")
+
+
+def row_chunks(rows: Union[pl.DataFrame, List[Dict]], chunk_rows: int) -> Iterator[List[Dict]]:
+    """Rows as lists of dicts of at most chunk_rows; a frame is converted one chunk at a time"""
+    for offset in range(0, len(rows), chunk_rows):
+        if isinstance(rows, pl.DataFrame):
+            yield rows.slice(offset, chunk_rows).to_dicts()
+        else:
+            yield rows[offset:offset + chunk_rows]
+
+
+def result_events(result: Dict,
+                  cached: bool,
+                  encoded: Optional[Dict[str, List[str]]] = None,
+                  chunk_rows: int = INDEX_STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    Events of a built (or cached) index: `index_data` and `constituent_weights` in chunks of rows
+    with their offset, then `risk_return` and `done`.
+    With `encoded` (an empty dict) the JSON of the streamed chunks is collected in it per field,
+    to build the cache payload afterwards (see cache_payload).
+    """
+    for field, event in (("index_df", "index_data"), ("constituent_weights", "constituent_weights")):
+        offset = 0
+        for chunk in row_chunks(result[field], chunk_rows):
+            rows = _json(chunk)
+            if encoded is not None:
+                encoded.setdefault(field, []).append(rows[1:-1])
+            yield f'event: {event}\ndata: {{"offset":{offset},"rows":{rows}}}\n\n'.encode("utf-8")
+            offset += len(chunk)
+
+    yield sse_event("risk_return", result.get("risk_return"))
+    yield sse_event("done", {"total_data_points": len(result["index_df"]), "cached": cached})
+
+
+def cache_payload(encoded: Dict[str, List[str]], risk_return: Any) -> bytes:
+    """
+    Index cache payload joined from the JSON of the streamed chunks: the same as index_cache.put's,
+    without the full lists of dicts ever being built
+    """
+    return (
+        f'{{"index_df":[{",".join(encoded.get("index_df", []))}],'
+        f'"constituent_weights":[{",".join(encoded.get("constituent_weights", []))}],'
+        f'"risk_return":{_json(risk_return)}}}'
+    ).encode("utf-8")
+
+
+async def stream_index(cache_key: str, build: Callable[..., Dict], *args, **kwargs) -> AsyncIterator[bytes]:
+    """
+    Server-Sent Events of an index build. A cached result is streamed right away; otherwise
+    `build(*args, **kwargs)` runs on an index worker process while its `stage` and `progress` events are streamed,
+    followed by the result events (see result_events). A failed build ends with an `error` event.
+    The result is put into the index cache once the last event is out. Cache reads and writes run
+    on a worker thread, off the event loop.
+    """
+    cached = await asyncio.to_thread(index_cache.get, cache_key)
+    if cached is not None:
+        for event in result_events(cached, cached=True):
+            yield event
+        return
+
+    etl_version = data_etl_version()
+    # The listener runs on the executor's event relay thread: events are handed over to the event loop
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    listener = lambda event: loop.call_soon_threadsafe(events.put_nowait, event)
+    build_task = asyncio.ensure_future(index_executor.submit(build, *args, listener=listener, **kwargs))
+    build_task.add_done_callback(lambda _: events.put_nowait(None))
+
+    while (event := await events.get()) is not None:
+        yield sse_event(event.pop("event"), event)
+
+    try:
+        result, stages = build_task.result()
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+        return
+
+    logger.info("Index build stages:\n%s", stages_summary(stages))
+    encoded: Dict[str, List[str]] = {}
+    for event in result_events(result, cached=False, encoded=encoded):
+        yield event
+    await asyncio.to_thread(index_cache.put_payload, cache_key, cache_payload(encoded, result.get("risk_return")), etl_version)
@@ -0,0 +1,528 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import shutil
+import logging
+import tempfile
+import threading
+import numpy as np
+import polars as pl
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Dict, List, Optional
+from src.utils.utils import run_query, run_query_to_polars, get_etl_version
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MARKET_PANEL_ENABLED = os.getenv("MARKET_PANEL_ENABLED", "true").lower() == "true"
+MARKET_PANEL_REFRESH_MINUTES = int(os.getenv("MARKET_PANEL_REFRESH_MINUTES", "15"))
+MARKET_PANEL_DIR = os.getenv("MARKET_PANEL_DIR")  # panel files shared by the uvicorn workers (a private temporary directory when unset)
+
+# If no KPIs are provided, select everything basically
+DEFAULT_KPIS = {
+    'asset_turnover_perc': ['1', '20', '30', '40', '50', '60', '70', '80', '90', '99', '100']
+}
+
+MIN_VOLUME_EUR = 100000
+
+
+def selected_kpis(kpis: Optional[Dict[str, List[str]]]) -> Dict[str, List[str]]:
+    """The KPIs a selection filters on: those with at least one value (an empty dict means none)"""
+    return {kpi: values for kpi, values in (kpis or {}).items() if values}
+
+
+########################################################
+########################################################
+########################################################
+
+EPOCH = date(1970, 1, 1)
+DAY_KEY_SPAN = 2 ** 16  # dates up to 2149 fit in the day part of a price key
+
+
+def _price_key(symbol_ids, days):
+    """Sort key of a (symbol_id, days since epoch) pair"""
+    return np.asarray(symbol_ids, dtype=np.int64) * DAY_KEY_SPAN + np.asarray(days, dtype=np.int64)
+
+
+def _encode_quarter(col: str) -> pl.Expr:
+    """'Q1'..'Q4' -> 1..4 (anything else becomes null)"""
+    return pl.col(col).str.strip_prefix("Q").cast(pl.Int8, strict=False)
+
+
+class MarketPanel:
+    """
+    Columnar, in-memory copy of the tables make_query reads from Postgres.
+
+    Symbols are dictionary-encoded to UInt32 ids (position in `symbols`) and quarters
+    to Int8, so every frame joins on small integer keys. Prices are sorted by
+    (symbol_id, date) and `price_keys` holds symbol_id * 2**16 + days since epoch for
+    every row, so the rows of a symbol inside a date window are found by binary search
+    and a selection only touches the history it needs.
+
+    A panel can be saved as uncompressed Arrow IPC files and opened memory-mapped (see
+    SharedMarketPanel): its frames are then read-only views of the files, not copies.
+    """
+
+    FRAMES = ["stock_info", "kpis", "market_caps", "prices"]
+
+    def __init__(self,
+                 stock_info: pl.DataFrame,
+                 kpis: pl.DataFrame,
+                 market_caps: pl.DataFrame,
+                 prices: pl.DataFrame,
+                 etl_version=None,
+                 price_keys: Optional[np.ndarray] = None):
+        self.stock_info = stock_info
+        self.symbols = stock_info.get_column("symbol")
+        self.symbol_ids = dict(zip(self.symbols.to_list(), stock_info.get_column("symbol_id").to_list()))
+        self.kpis = kpis
+        self.kpi_columns = [c for c in kpis.columns if c.endswith("_perc")]
+        self.market_caps = market_caps
+        if price_keys is None:
+            self.prices = prices.sort(["symbol_id", "date"])
+            self.price_keys = _price_key(
+                self.prices.get_column("symbol_id").to_numpy(),
+                self.prices.get_column("date").to_physical().to_numpy(),
+            )
+        else:
+            # Saved panels are stored sorted, next to their keys
+            self.prices = prices
+            self.price_keys = price_keys
+        self.etl_version = etl_version
+        self.loaded_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        # Directory of the files the panel is mapped from (None for a panel loaded into memory)
+        self.path: Optional[str] = None
+
+    @classmethod
+    def load(cls,
+             etl_version=None,
+             start_date: Optional[date] = None,
+             end_date: Optional[date] = None,
+             kpi_columns: Optional[List[str]] = None) -> "MarketPanel":
+        """
+        Load the panel from Postgres (one scan per source table).
+        With start_date/end_date only the prices inside that window, and the quarter-end snapshots
+        and KPIs of the years select ranks for it, are loaded. With kpi_columns only those KPIs
+        are loaded (selections filtering on other KPIs fail as unknown KPIs).
+        """
+
+        start = time.time()
+
+        stock_info = run_query_to_polars(
+            "SELECT symbol, country, sector, industry FROM raw.stock_info ORDER BY symbol"
+        )
+        stock_info = stock_info.with_columns(
+            pl.int_range(pl.len(), dtype=pl.UInt32).alias("symbol_id")
+        ).select(["symbol_id", "symbol", "country", "sector", "industry"])
+        dictionary = stock_info.select(["symbol", "symbol_id"])
+
+        all_kpi_columns = run_query("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_schema = 'clean'
+            AND table_name = 'financial_metrics_perc'
+            AND RIGHT(column_name, 5) = '_perc'
+            ORDER BY ordinal_position
+        """)["column_name"].tolist()
+        if kpi_columns is not None:
+            kpi_columns = [c for c in all_kpi_columns if c in kpi_columns]
+        else:
+            kpi_columns = all_kpi_columns
+
+        def where_years(column: str) -> str:
+            """Only the years whose quarter-ends select ranks for the window"""
+            conditions = []
+            if start_date:
+                conditions.append(f"{column} >= {start_date.year - 1}")
+            if end_date:
+                conditions.append(f"{column} <= {end_date.year}")
+            return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        kpis = run_query_to_polars(f"""
+            SELECT {", ".join(["symbol", "fiscal_year", "period", *kpi_columns])}
+            FROM clean.financial_metrics_perc
+            {where_years("fiscal_year")}
+        """)
+        kpis = (
+            kpis.join(dictionary, on="symbol", how="inner")
+                .select([
+                    "symbol_id",
+                    pl.col("fiscal_year").cast(pl.Int16),
+                    _encode_quarter("period").alias("period"),
+                    *[pl.col(c).cast(pl.Int8) for c in kpi_columns],
+                ])
+                .filter(pl.col("period").is_not_null())
+        )
+
+        market_caps = run_query_to_polars(f"""
+            SELECT
+                symbol, year, quarter, next_year, next_quarter,
+                CAST(market_cap AS FLOAT8) AS market_cap,
+                CAST(market_cap_eur AS FLOAT8) AS market_cap_eur,
+                CAST(market_cap_usd AS FLOAT8) AS market_cap_usd
+            FROM clean.quarterly_mcap_snapshot
+            {where_years("year")}
+        """)
+        market_caps = (
+            market_caps.join(dictionary, on="symbol", how="inner")
+                .select([
+                    "symbol_id",
+                    pl.col("year").cast(pl.Int16),
+                    _encode_quarter("quarter").alias("quarter"),
+                    "market_cap", "market_cap_eur", "market_cap_usd",
+                    pl.col("next_year").cast(pl.Int16),
+                    _encode_quarter("next_quarter").alias("next_quarter"),
+                ])
+        )
+
+        prices = run_query_to_polars(f"""
+            SELECT
+                symbol, date, currency, year, quarter,
+                CAST(last_quarter_date AS BOOLEAN) AS last_quarter_date,
+                CAST(close AS FLOAT8) AS close,
+                CAST(close_eur AS FLOAT8) AS close_eur,
+                CAST(close_usd AS FLOAT8) AS close_usd
+            FROM raw.historical_price_volume
+            WHERE volume_eur > {MIN_VOLUME_EUR}
+            {f"AND date >= '{start_date.isoformat()}'" if start_date else ""}
+            {f"AND date <= '{end_date.isoformat()}'" if end_date else ""}
+        """)
+        # An Enum opens from a memory-mapped panel file with one-byte codes (a Categorical is rebuilt)
+        currencies = pl.Enum(prices.get_column("currency").drop_nulls().unique().sort())
+        prices = (
+            prices.join(dictionary, on="symbol", how="inner")
+                .select([
+                    "symbol_id",
+                    pl.col("date").cast(pl.Date),
+                    pl.col("currency").cast(currencies),
+                    pl.col("year").cast(pl.Int16),
+                    _encode_quarter("quarter").alias("quarter"),
+                    "last_quarter_date", "close", "close_eur", "close_usd",
+                ])
+        )
+
+        panel = cls(stock_info, kpis, market_caps, prices, etl_version=etl_version)
+        print(f"✅ Market panel loaded in {round(time.time() - start, 2)} seconds: "
+              f"{len(panel.symbols):,} symbols, {panel.kpis.height:,} KPI rows, "
+              f"{panel.market_caps.height:,} quarter-end market caps, {panel.prices.height:,} price rows")
+        return panel
+
+    def save(self, directory: str):
+        """Write the frames as uncompressed Arrow IPC files and the price keys as a .npy file"""
+        os.makedirs(directory)
+        for name in self.FRAMES:
+            getattr(self, name).rechunk().write_ipc(os.path.join(directory, f"{name}.arrow"), compression="uncompressed")
+        np.save(os.path.join(directory, "price_keys.npy"), self.price_keys)
+
+    @classmethod
+    def open(cls, directory: str, etl_version=None) -> "MarketPanel":
+        """
+        Open a saved panel memory-mapped and read-only. Processes that open the same files share
+        one copy of them in the page cache.
+        """
+        frames = {
+            name: pl.read_ipc(os.path.join(directory, f"{name}.arrow"), memory_map=True, rechunk=False)
+            for name in cls.FRAMES
+        }
+        price_keys = np.load(os.path.join(directory, "price_keys.npy"), mmap_mode="r")
+        panel = cls(**frames, etl_version=etl_version, price_keys=price_keys)
+        panel.path = directory
+        return panel
+
+    def encode_symbols(self, symbols: List[str]) -> List[int]:
+        """Map symbols to their ids, dropping symbols the panel doesn't know"""
+        return [self.symbol_ids[s] for s in symbols if s in self.symbol_ids]
+
+    def _price_rows(self,
+                    symbol_ids: np.ndarray,
+                    start_date: Optional[date] = None,
+                    end_date: Optional[date] = None) -> pl.DataFrame:
+        """Gather the price history of the given symbol ids between start_date and end_date (inclusive)"""
+        first_day = (start_date - EPOCH).days if start_date else 0
+        last_day = (end_date - EPOCH).days if end_date else DAY_KEY_SPAN - 1
+        starts = np.searchsorted(self.price_keys, _price_key(symbol_ids, first_day), side="left")
+        ends = np.searchsorted(self.price_keys, _price_key(symbol_ids, last_day), side="right")
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return self.prices.clear()
+        # Row index of every position in the concatenated [start, end) ranges
+        shift = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return self.prices[shift + np.arange(total)]
+
+    def select(self,
+               max_constituents: int,
+               selected_countries: List[str],
+               selected_sectors: List[str],
+               selected_industries: List[str],
+               selected_stocks: List[str],
+               kpis: Dict[str, List[str]],
+               start_date: Optional[date] = None,
+               end_date: Optional[date] = None) -> pl.DataFrame:
+        """
+        In-memory equivalent of make_query: returns the same columns, with one row per
+        (date, constituent) for the quarter following each quarter-end selection,
+        restricted to the dates between start_date and end_date.
+        """
+
+        kpis = selected_kpis(kpis)
+        has_filters = len(selected_industries) > 0 or len(selected_sectors) > 0 or len(selected_countries) > 0 or len(kpis) > 0
+        if not kpis:
+            kpis = DEFAULT_KPIS
+
+        unknown_kpis = [kpi for kpi in kpis if kpi not in self.kpi_columns]
+        if unknown_kpis:
+            raise ValueError(f"Unknown KPI(s): {', '.join(unknown_kpis)}")
+        active_kpis = list(kpis.keys())
+
+        # Selected stocks are added to the filtered universe when other filters exist, otherwise they are the universe
+        def with_stocks(condition: pl.Expr) -> pl.Expr:
+            if len(selected_stocks) == 0:
+                return condition
+            stocks_condition = pl.col("symbol_id").is_in(self.encode_symbols(selected_stocks))
+            return (condition | stocks_condition) if has_filters else (condition & stocks_condition)
+
+        ########### STOCK INFO FILTERS (prep1)
+        info = self.stock_info
+        if len(selected_countries) > 0:
+            info = info.filter(pl.col("country").is_in(selected_countries))
+        if len(selected_industries) > 0:
+            info = info.filter(pl.col("industry").is_in(selected_industries))
+        if len(selected_sectors) > 0:
+            info = info.filter(pl.col("sector").is_in(selected_sectors))
+
+        ########### KPI FILTERS (prep2, prep3)
+        kpi_condition = pl.lit(True)
+        for kpi, values in kpis.items():
+            kpi_condition = kpi_condition & pl.col(kpi).is_in([int(v) for v in values])
+
+        kpi_rows = (
+            self.kpis
+            .select(["symbol_id", "fiscal_year", "period"] + active_kpis)
+            .filter(with_stocks(kpi_condition))
+            .join(info.select("symbol_id"), on="symbol_id", how="semi")
+        )
+
+        ########### QUARTER-END RANKING (prep4, prep5, prep6)
+        # Only rank the quarters whose constituents are held inside the date window
+        market_caps = self.market_caps
+        if start_date:
+            market_caps = market_caps.filter(pl.col("year") >= start_date.year - 1)
+        if end_date:
+            market_caps = market_caps.filter(pl.col("year") <= end_date.year)
+
+        # Postgres sorts NULL market caps first in a DESC ranking
+        constituents = (
+            market_caps
+            .join(
+                kpi_rows,
+                left_on=["symbol_id", "year", "quarter"],
+                right_on=["symbol_id", "fiscal_year", "period"],
+                how="inner",
+            )
+            .with_columns(
+                pl.col("market_cap_eur").fill_null(float("inf"))
+                  .rank(method="min", descending=True)
+                  .over(["year", "quarter"])
+                  .cast(pl.Int32)
+                  .alias("mcap_rank")
+            )
+            .filter(with_stocks(pl.col("mcap_rank") <= max_constituents))
+            .select(["symbol_id", "next_year", "next_quarter", "market_cap", "market_cap_eur", "market_cap_usd"]
+                    + active_kpis + ["mcap_rank"])
+        )
+
+        ########### DAILY PRICES (prep8)
+        symbol_ids = constituents.get_column("symbol_id").unique().to_numpy().astype(np.int64)
+        df = (
+            self._price_rows(symbol_ids, start_date, end_date)
+            .join(
+                constituents,
+                left_on=["symbol_id", "year", "quarter"],
+                right_on=["symbol_id", "next_year", "next_quarter"],
+                how="inner",
+            )
+            .join(self.stock_info.select(["symbol_id", "symbol"]), on="symbol_id", how="left")
+            .select([
+                "date",
+                "symbol",
+                pl.col("currency").cast(pl.Utf8),
+                pl.col("year").cast(pl.Int64),
+                pl.format("Q{}", pl.col("quarter")).alias("quarter"),
+                "last_quarter_date",
+                "close",
+                "close_eur",
+                "close_usd",
+                "market_cap",
+                "market_cap_eur",
+                "market_cap_usd",
+                *[pl.col(kpi).cast(pl.Float64) for kpi in active_kpis],
+                "mcap_rank",
+            ])
+        )
+        logger.debug("Market panel selection: %s constituent quarters, %s rows", f"{constituents.height:,}", f"{df.height:,}")
+        return df
+
+
+########################################################
+########################################################
+########################################################
+
+class SharedMarketPanel:
+    """
+    Market panel files shared by the uvicorn workers of a host and their index worker processes.
+
+    Every published panel is a generation directory of Arrow IPC files (MarketPanel.save).
+    `current.json` names the current generation and its ETL version, and is replaced by an atomic
+    rename once the generation is complete, so a worker never opens a half-written panel. Workers
+    open the current generation memory-mapped, so N workers share one physical copy of the panel
+    through the page cache. An exclusive file lock lets one worker load a new ETL version from
+    Postgres while the others wait and then open its files.
+
+    Without a directory, the files go to a temporary directory of this process (created on first
+    use and removed at exit), which its index worker processes open.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self._directory = directory
+        if self._directory:
+            os.makedirs(self._directory, exist_ok=True)
+
+    @property
+    def directory(self) -> str:
+        if not self._directory:
+            self._directory = tempfile.mkdtemp(prefix="market-panel-")
+            atexit.register(shutil.rmtree, self._directory, ignore_errors=True)
+        return self._directory
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def exclusive(self):
+        """Hold the publishing lock (across processes) for as long as the block runs"""
+        if fcntl is None:
+            yield
+            return
+        with open(self._path(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """Generation and ETL version of the published panel, or None"""
+        try:
+            with open(self._path("current.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def publish(self, panel: MarketPanel) -> Dict[str, Any]:
+        """Save the panel as a new generation and make it the current one"""
+        previous = self.current()
+        generation = uuid.uuid4().hex[:12]
+        panel.save(self._path(generation))
+        current = {"generation": generation, "etl_version": _version_tag(panel.etl_version)}
+        with open(self._path("current.json.tmp"), "w") as f:
+            json.dump(current, f)
+        os.replace(self._path("current.json.tmp"), self._path("current.json"))
+
+        # Older generations go; the one just replaced stays for workers that are still opening it.
+        # Workers keep the files they have mapped until they open the new generation.
+        keep = {generation, previous["generation"] if previous else None}
+        for name in os.listdir(self.directory):
+            if name not in keep and os.path.isdir(self._path(name)):
+                shutil.rmtree(self._path(name), ignore_errors=True)
+        return current
+
+    def open(self, etl_version, force: bool = False) -> MarketPanel:
+        """
+        Open the published panel of the ETL version, first loading and publishing it if no worker
+        has yet (or if forced).
+        """
+        with self.exclusive():
+            current = self.current()
+            if force or current is None or current["etl_version"] != _version_tag(etl_version):
+                print(f"⏳ Loading shared market panel for ETL version {etl_version} at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+                current = self.publish(MarketPanel.load(etl_version=etl_version))
+        panel = MarketPanel.open(self._path(current["generation"]), etl_version=etl_version)
+        print(f"✅ Opened shared market panel {current['generation']} for ETL version {etl_version}")
+        return panel
+
+
+def _version_tag(etl_version) -> str:
+    return str(etl_version)
+
+
+shared_market_panel = SharedMarketPanel(MARKET_PANEL_DIR)
+
+_market_panel: Optional[MarketPanel] = None
+_market_panel_lock = threading.Lock()
+
+
+def get_market_panel() -> Optional[MarketPanel]:
+    """Current market panel, or None if it hasn't been loaded (yet)"""
+    return _market_panel
+
+
+def refresh_market_panel(force: bool = False) -> Optional[MarketPanel]:
+    """
+    (Re)load the market panel when the ETL has produced a new version of the data.
+    The new panel is fully built before it replaces the old one, so requests always
+    see a complete panel. The panel is saved as files and opened memory-mapped, so the index
+    worker processes (and, with MARKET_PANEL_DIR set, the other uvicorn workers) share it
+    (see SharedMarketPanel).
+    """
+    global _market_panel
+
+    if not _market_panel_lock.acquire(blocking=False):
+        return _market_panel  # a reload is already running
+    try:
+        etl_version = get_etl_version()
+        if not force and _market_panel is not None and _market_panel.etl_version == etl_version:
+            return _market_panel
+
+        _market_panel = shared_market_panel.open(etl_version, force=force)
+        return _market_panel
+    except Exception as e:
+        print(f"❌ Error loading market panel: {e}")
+        return _market_panel
+    finally:
+        _market_panel_lock.release()
+
+
+def market_panel_files() -> Optional[Dict[str, Any]]:
+    """Files and ETL version of the current market panel, for an index worker process to open, or None"""
+    panel = _market_panel
+    if panel is None or panel.path is None:
+        return None
+    return {"path": panel.path, "etl_version": panel.etl_version}
+
+
+def use_market_panel(files: Optional[Dict[str, Any]]):
+    """
+    Make the panel files a build was submitted with the market panel of this (index worker) process.
+    They are opened memory-mapped once per panel generation. Without files, or if they can't be
+    opened (e.g. a generation removed by two reloads in a row), builds query the database.
+    """
+    global _market_panel
+
+    if files is None:
+        _market_panel = None
+        return
+    if _market_panel is not None and _market_panel.path == files["path"]:
+        return
+    try:
+        _market_panel = MarketPanel.open(files["path"], etl_version=files["etl_version"])
+    except Exception as e:
+        logger.warning("Could not open market panel %s: %s", files["path"], e)
+        _market_panel = None
@@ -0,0 +1,132 @@
+import numpy as np
+from typing import Callable, Optional, Tuple
+
+
+class IndexPanel:
+    """
+    Long-format inputs of the rebalance engine: the non-null prices as (symbol_id, day, price)
+    and the target weights as (day, symbol_id, weight) on the rebalance days only.
+
+    Days are row positions in the sorted dates of the index rows and symbol ids are positions in
+    its symbol list. Prices are sorted by (symbol_id, day) and keyed by symbol_id * n_dates + day,
+    so the last price of a set of symbols at or before a day is one binary search. Nothing of size
+    dates x symbols is ever built: a rebalance period only materialises its active positions.
+    """
+
+    def __init__(self,
+                 n_dates: int,
+                 n_symbols: int,
+                 price_symbols: np.ndarray,
+                 price_days: np.ndarray,
+                 price_values: np.ndarray,
+                 weight_days: np.ndarray,
+                 weight_symbols: np.ndarray,
+                 weight_values: np.ndarray):
+        self.n_dates = n_dates
+        self.n_symbols = n_symbols
+        self.price_keys = self._keys(price_symbols, price_days)
+        order = np.argsort(self.price_keys, kind="stable")
+        self.price_keys = self.price_keys[order]
+        self.price_values = np.asarray(price_values, dtype=np.float64)[order]
+
+        order = np.lexsort((weight_symbols, weight_days))
+        self.weight_days = np.asarray(weight_days, dtype=np.int64)[order]
+        self.weight_symbols = np.asarray(weight_symbols, dtype=np.int64)[order]
+        self.weight_values = np.asarray(weight_values, dtype=np.float64)[order]
+
+    def _keys(self, symbols, days) -> np.ndarray:
+        return np.asarray(symbols, dtype=np.int64) * self.n_dates + np.asarray(days, dtype=np.int64)
+
+    def weights_at(self, day: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Symbol ids and target weights of a rebalance day"""
+        lo, hi = np.searchsorted(self.weight_days, [day, day + 1])
+        return self.weight_symbols[lo:hi], self.weight_values[lo:hi]
+
+    def price_block(self, symbols: np.ndarray, start: int, end: int) -> np.ndarray:
+        """
+        Forward-filled (end - start) x len(symbols) prices of the given symbols, 0.0 before a
+        symbol's first price. Row 0 carries the last price at or before `start`.
+        """
+        block = np.full((end - start, len(symbols)), np.nan)
+        if len(symbols) == 0 or end <= start:
+            return np.zeros_like(block)
+
+        # Last price at or before the start day
+        seed = np.searchsorted(self.price_keys, self._keys(symbols, np.full(len(symbols), start)), side="right") - 1
+        has_seed = (seed >= 0) & (self.price_keys[np.maximum(seed, 0)] // self.n_dates == symbols)
+        block[0, has_seed] = self.price_values[seed[has_seed]]
+
+        # Prices inside the period (the start day's own price is already the seed)
+        lo = seed + 1
+        hi = np.searchsorted(self.price_keys, self._keys(symbols, np.full(len(symbols), end)), side="left")
+        counts = np.maximum(hi - lo, 0)
+        if counts.sum() > 0:
+            positions = np.repeat(lo - np.cumsum(np.r_[0, counts[:-1]]), counts) + np.arange(counts.sum())
+            columns = np.repeat(np.arange(len(symbols)), counts)
+            block[self.price_keys[positions] % self.n_dates - start, columns] = self.price_values[positions]
+
+        # Forward fill down the rows
+        filled_rows = np.where(np.isnan(block), 0, np.arange(len(block))[:, None])
+        np.maximum.accumulate(filled_rows, axis=0, out=filled_rows)
+        block = block[filled_rows, np.arange(len(symbols))]
+        return np.where(np.isnan(block), 0.0, block)
+
+
+def rebalance_index_with_state(panel: IndexPanel,
+                               rebalance_idx: np.ndarray,
+                               start_value: float = 1000,
+                               start_shares: Optional[np.ndarray] = None,
+                               progress: Optional[Callable[[int, int], None]] = None
+                               ) -> Tuple[np.ndarray, int, np.ndarray]:
+    """
+    Compute the daily index value series from a long-format panel.
+
+    rebalance_idx: sorted row positions of the rebalance dates
+    start_shares:  shares held (per symbol id) before the first rebalance row, to continue an
+                   existing series; without it the first rebalance row must be row 0
+    progress:      called with (periods done, periods) after every rebalance period
+
+    At every rebalance row the current index value is spread over the symbols according to
+    their weights; the resulting share counts are held until the next rebalance row. Missing
+    prices are forward-filled, and a symbol without a price contributes nothing. Returns the
+    index value for every date, the last rebalance row (-1 if there was none) and the shares
+    held after it (per symbol id).
+    """
+    n_dates = panel.n_dates
+    index_values = np.zeros(n_dates, dtype=np.float64)
+    shares = np.zeros(panel.n_symbols, dtype=np.float64) if start_shares is None else np.asarray(start_shares, dtype=np.float64)
+    if n_dates == 0:
+        return index_values, -1, shares
+
+    first_rebalance = rebalance_idx[0] if len(rebalance_idx) else n_dates
+
+    # Rows before the first rebalance keep the shares carried over from the previous series
+    held = np.flatnonzero(shares)
+    index_values[:first_rebalance] = panel.price_block(held, 0, first_rebalance) @ shares[held]
+    current_index_value = index_values[first_rebalance - 1] if first_rebalance > 0 else float(start_value)
+
+    bounds = np.append(rebalance_idx, n_dates)
+    for period, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]), start=1):
+        symbols, weights = panel.weights_at(start)
+        block = panel.price_block(symbols, start, end)
+        start_prices = block[0]
+        # Only positions with a weight and a price are held
+        active = (weights != 0.0) & (start_prices != 0.0)
+        shares = np.zeros(panel.n_symbols, dtype=np.float64)
+        shares[symbols[active]] = weights[active] * current_index_value / start_prices[active]
+        index_values[start:end] = block[:, active] @ shares[symbols[active]]
+        current_index_value = index_values[end - 1]
+        if progress is not None:
+            progress(period, len(rebalance_idx))
+
+    last_rebalance = int(rebalance_idx[-1]) if len(rebalance_idx) else -1
+    return index_values, last_rebalance, shares
+
+
+def rebalance_index(panel: IndexPanel,
+                    rebalance_idx: np.ndarray,
+                    start_value: float = 1000
+                    ) -> np.ndarray:
+    """Daily index values for a series that starts with a rebalance at row 0 (see rebalance_index_with_state)"""
+    index_values, _, _ = rebalance_index_with_state(panel, rebalance_idx, start_value)
+    return index_values
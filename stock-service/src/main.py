@@ -1,20 +1,83 @@
-import os
+import asyncio
+import logging
 import pandas as pd
-from typing import List, Dict, Optional, Union
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Dict, Optional, Tuple, Union
+from apscheduler.schedulers.background import BackgroundScheduler
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from src.index_maker.index_maker import create_custom_index
-from src.utils.csv_reader import read_index_fields_from_csv
+from src.index_maker.market_panel import refresh_market_panel, MARKET_PANEL_ENABLED, MARKET_PANEL_REFRESH_MINUTES
+from src.index_maker.index_cache import index_cache, index_request_key, refresh_index_cache, data_etl_version, INDEX_CACHE_ETL_CHECK_MINUTES
+from src.index_maker.index_executor import index_executor, IndexQueueFullError
+from src.index_maker.index_batch import create_custom_indexes, INDEX_BATCH_MAX_SIZE
+from src.index_maker.index_stream import stream_index
+from src.utils.fields_payload import fields_payloads, Payload
+from src.utils.stage_timing import RequestTimings, Stage, timed_stage, stage_histograms, stages_summary
 from src.utils.benchmark_utils import get_benchmark_historical_data
-from src.utils.utils import run_query
+from src.utils.benchmark_store import refresh_benchmark_store, BENCHMARK_STORE_ENABLED, BENCHMARK_STORE_REFRESH_MINUTES
+from src.utils.utils import run_query, get_pool_status
+
+
+# Index build diagnostics go through logging (see INDEX_LOG_LEVEL)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+scheduler = BackgroundScheduler()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the market panel and benchmark store in the background and reload them (and reset the index cache) whenever the ETL publishes new data"""
+    scheduler.add_job(
+        refresh_index_cache,
+        "interval",
+        minutes=INDEX_CACHE_ETL_CHECK_MINUTES,
+        next_run_time=datetime.now(),
+        id="index_cache_refresh",
+        max_instances=1,
+        coalesce=True,
+    )
+    if MARKET_PANEL_ENABLED:
+        scheduler.add_job(
+            refresh_market_panel,
+            "interval",
+            minutes=MARKET_PANEL_REFRESH_MINUTES,
+            next_run_time=datetime.now(),
+            id="market_panel_refresh",
+            max_instances=1,
+            coalesce=True,
+        )
+    if BENCHMARK_STORE_ENABLED:
+        scheduler.add_job(
+            refresh_benchmark_store,
+            "interval",
+            minutes=BENCHMARK_STORE_REFRESH_MINUTES,
+            next_run_time=datetime.now(),
+            id="benchmark_store_refresh",
+            max_instances=1,
+            coalesce=True,
+        )
+    scheduler.start()
+    try:
+        fields_payloads.refresh()
+    except Exception as e:
+        print(f"❌ Error building index field payloads: {e}")
+    yield
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    index_executor.shutdown()
 
 
 app = FastAPI(
     title="Stock Service API",
     description="API for creating custom stock indices and fetching market data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware to allow frontend requests
@@ -31,6 +94,7 @@ app.add_middleware(
 class IndexCreationRequest(BaseModel):
     indexSize: int
     indexCurrency: str
+    indexCurrencies: List[str] = []  # further currencies built from the same data load
     indexStartAmount: int
     indexStartDate: str
     indexEndDate: str
@@ -49,6 +113,17 @@ class IndexCreationResponse(BaseModel):
     error: Optional[str] = None
 
 
+class IndexBatchRequest(BaseModel):
+    indexes: List[IndexCreationRequest]
+
+
+class IndexBatchResponse(BaseModel):
+    success: bool
+    message: str
+    results: List[IndexCreationResponse] = []
+    error: Optional[str] = None
+
+
 @app.get("/")
 async def root():
     """Root endpoint to check if API is running"""
@@ -58,20 +133,53 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "stock-index-advisor"}
+    return {
+        "status": "healthy",
+        "service": "stock-index-advisor",
+        "database_pool": get_pool_status(),
+        "index_queue": index_executor.stats(),
+    }
+
+
+def payload_response(request: Request, payload: Payload) -> Response:
+    """Prebuilt JSON payload, gzipped if the client accepts it, or 304 if the client's copy is current"""
+    if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if payload.etag in if_none_match or payload.gzip_etag in if_none_match:
+        return Response(status_code=304, headers={"ETag": payload.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"})
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(
+            payload.gzip_body,
+            media_type="application/json",
+            headers={"ETag": payload.gzip_etag, "Content-Encoding": "gzip", "Cache-Control": "no-cache", "Vary": "Accept-Encoding"},
+        )
+    return Response(
+        payload.body,
+        media_type="application/json",
+        headers={"ETag": payload.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"},
+    )
 
 
 @app.get("/api/index-fields")
-async def get_index_fields():
+async def get_index_fields(request: Request, companies: bool = True):
     """Get all available index fields (countries, sectors, industries, KPIs, companies) from CSV files"""
     try:
-        # Read fields from CSV files generated by field_maker.py
-        fields_data = read_index_fields_from_csv()
-        return fields_data
+        # Payloads are built from the CSV files generated by field_maker.py, and rebuilt when they change
+        payloads = fields_payloads.refresh()
+        payload = payloads.index_fields if companies else payloads.index_fields_without_companies
+        return payload_response(request, payload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch index fields: {str(e)}")
 
 
+@app.get("/api/companies")
+async def search_companies(prefix: str, limit: int = Query(50, ge=1, le=500)):
+    """Companies whose symbol or name starts with the prefix (case-insensitive)"""
+    try:
+        return {"companies": fields_payloads.refresh().companies.search(prefix, limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to search companies: {str(e)}")
+
+
 @app.get("/api/etl-summary")
 async def get_etl_summary():
     """Get ETL summary data from database"""
@@ -145,88 +253,212 @@ async def get_benchmark_data(
 
 
 @app.get("/api/benchmark-risk-return")
-async def get_benchmark_risk_return():
+async def get_benchmark_risk_return(request: Request):
     """Return risk/return metrics from benchmarks.csv for scatter plot."""
     try:
-        # Path to benchmarks.csv under src/utils/fields (root src level)
-        fields_dir = os.path.join(os.path.dirname(__file__), 'utils', 'fields')
-        csv_path = os.path.join(fields_dir, 'benchmarks.csv')
-
-        if not os.path.exists(csv_path):
+        payload = fields_payloads.refresh().benchmark_risk_return
+        if payload is None:
             raise HTTPException(status_code=404, detail="benchmarks.csv not found")
-
-        df = pd.read_csv(csv_path, dtype=str, keep_default_na=False, na_filter=False)
-
-        # Safely coerce numeric columns; missing become None
-        def to_float_safe(x):
-            try:
-                xv = float(x)
-                if pd.isna(xv):
-                    return None
-                return xv
-            except Exception:
-                return None
-
-        result = []
-        for _, row in df.iterrows():
-            item = {
-                "name": row.get("name"),
-                "symbol": row.get("symbol"),
-                "type": row.get("type"),
-                "date": row.get("date"),
-                "data_points": to_float_safe(row.get("data_points")),
-                "return_eur": to_float_safe(row.get("return_eur")),
-                "return_usd": to_float_safe(row.get("return_usd")),
-                "risk_eur": to_float_safe(row.get("risk_eur")),
-                "risk_usd": to_float_safe(row.get("risk_usd")),
-            }
-            result.append(item)
-
-        return {"benchmarks": result}
+        return payload_response(request, payload)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load benchmark risk/return: {str(e)}")
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Index build stage histograms in the Prometheus text format"""
+    return Response(stage_histograms.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/cache-stats")
+async def get_cache_stats():
+    """Hit/miss counters and size of the create-index result cache"""
+    return index_cache.stats()
+
+
+def index_arguments(request: IndexCreationRequest) -> Dict:
+    """create_custom_index keyword arguments of a request"""
+    return dict(
+        index_size=request.indexSize,
+        currency=request.indexCurrency,
+        start_amount=request.indexStartAmount,
+        start_date=request.indexStartDate,
+        end_date=request.indexEndDate,
+        countries=request.selectedCountries,
+        sectors=request.selectedSectors,
+        industries=request.selectedIndustries,
+        kpis=request.selectedKPIs,
+        stocks=request.selectedStocks,
+        weight=request.weight,
+    )
+
+
+def request_currencies(request: IndexCreationRequest) -> List[str]:
+    """indexCurrency followed by the further currencies of a request, without duplicates"""
+    return list(dict.fromkeys([request.indexCurrency, *request.indexCurrencies]))
+
+
+def request_cache_key(request: IndexCreationRequest, currency: Optional[str] = None) -> str:
+    """Result cache key of a request in one currency: the key of the same request for that currency alone"""
+    config = request.model_dump(exclude={"indexCurrencies"})
+    if currency is not None:
+        config["indexCurrency"] = currency
+    return index_request_key(config)
+
+
+def index_result_data(result: Dict) -> Dict:
+    """JSON-serializable result of a built (or cached) index"""
+    index_data = result["index_df"]
+    return {
+        "index_data": index_data,
+        "total_data_points": len(index_data),
+        "constituent_weights": result["constituent_weights"],
+        "risk_return": result.get("risk_return"),
+    }
+
+
+def index_response(result: Dict, other_currencies: Optional[Dict[str, Dict]] = None) -> IndexCreationResponse:
+    """Response of a successfully built (or cached) index, with the results of further currencies under `currencies`"""
+    data = index_result_data(result)
+    if other_currencies:
+        data["currencies"] = {currency: index_result_data(r) for currency, r in other_currencies.items()}
+
+    return IndexCreationResponse(
+        success=True,
+        message=f"Index created successfully with {data['total_data_points']} data points",
+        result=data,
+    )
+
+
+def cache_results(results: Dict[str, Dict], etl_version):
+    """Put built results into the index cache, by cache key"""
+    for cache_key, result in results.items():
+        index_cache.put(cache_key, result, etl_version)
+
+
+async def build_index(request: IndexCreationRequest,
+                      currencies: List[str],
+                      cache_keys: Dict[str, str]) -> Tuple[Dict[str, Dict], List[Stage]]:
+    """
+    Build the index in the given currencies from one data load on an index worker process and
+    cache each result. The build's stages are returned with the results, so every request sharing
+    the build reports them.
+    """
+    etl_version = data_etl_version()
+    results, stages = await index_executor.submit(create_custom_index, **{**index_arguments(request), "currency": currencies})
+    logger.info("Index build stages:\n%s", stages_summary(stages))
+    await asyncio.to_thread(cache_results, {cache_keys[currency]: result for currency, result in results.items()}, etl_version)
+    return results, stages
+
+
+async def build_index_batch(requests: List[IndexCreationRequest], cache_keys: List[str]) -> List[Dict]:
+    """Build the variants of a batch from one data load on an index worker process and cache the successful ones"""
+    etl_version = data_etl_version()
+    outcomes, _ = await index_executor.submit(create_custom_indexes, [index_arguments(request) for request in requests])
+    built = {cache_key: outcome["result"] for cache_key, outcome in zip(cache_keys, outcomes) if outcome["success"]}
+    await asyncio.to_thread(cache_results, built, etl_version)
+    return outcomes
+
+
+@app.get("/api/index-queue")
+async def get_index_queue():
+    """Running and waiting index builds"""
+    return index_executor.stats()
+
+
 @app.post("/api/create-index", response_model=IndexCreationResponse)
-async def create_index(request: IndexCreationRequest):
+async def create_index(request: IndexCreationRequest, response: Response):
     """Create a custom stock index based on provided parameters"""
+    # Stage durations are returned in the Server-Timing header
+    timings = RequestTimings()
     try:
-        # Call the existing create_custom_index function
-        result = create_custom_index(
-            index_size=request.indexSize,
-            currency=request.indexCurrency,
-            start_amount=request.indexStartAmount,
-            start_date=request.indexStartDate,
-            end_date=request.indexEndDate,
-            countries=request.selectedCountries,
-            sectors=request.selectedSectors,
-            industries=request.selectedIndustries,
-            kpis=request.selectedKPIs,
-            stocks=request.selectedStocks,
-            weight=request.weight,
+        currencies = request_currencies(request)
+        with timings.activate():
+            # Identical configurations are served from the result cache (each currency on its own)
+            with timed_stage("cache"):
+                cache_keys = {currency: request_cache_key(request, currency) for currency in currencies}
+                results = await index_cache.get_many(cache_keys)
+
+        missing = [currency for currency in currencies if results[currency] is None]
+        if missing:
+            # Index builds run on the worker pool so the event loop stays responsive; identical
+            # requests arriving while the build runs await it instead of building again
+            build_key = "index:" + ",".join(cache_keys[currency] for currency in missing)
+            built, build_stages = await index_executor.submit_shared(build_key, lambda: build_index(request, missing, cache_keys))
+            results.update(built)
+            timings.extend(build_stages)
+
+        with timings.activate(), timed_stage("response"):
+            index_result = index_response(results[currencies[0]], {c: results[c] for c in currencies[1:]})
+        response.headers["Server-Timing"] = timings.server_timing()
+        return index_result
+    except IndexQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        return IndexCreationResponse(
+            success=False,
+            message="Failed to create index",
+            error=str(e),
         )
 
-        # Convert dataframes to JSON-serializable format
-        index_data = result["index_df"]
-        constituent_weights = result["constituent_weights"]
-        risk_return = result.get("risk_return")
 
-        return IndexCreationResponse(
-            success=True,
-            message=f"Index created successfully with {len(index_data)} data points",
-            result={
-                "index_data": index_data,
-                "total_data_points": len(index_data),
-                "constituent_weights": constituent_weights,
-                "risk_return": risk_return,
-            },
+@app.post("/api/create-index-stream")
+async def create_index_stream(request: IndexCreationRequest):
+    """Create a custom stock index (in indexCurrency only), streamed as Server-Sent Events"""
+    return StreamingResponse(
+        stream_index(request_cache_key(request), create_custom_index, **index_arguments(request), serialize=False),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/create-index-batch", response_model=IndexBatchResponse)
+async def create_index_batch(batch: IndexBatchRequest):
+    """Create several index variants that share one data load"""
+    if not batch.indexes:
+        raise HTTPException(status_code=400, detail="No indexes provided")
+    if len(batch.indexes) > INDEX_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {INDEX_BATCH_MAX_SIZE} indexes")
+
+    try:
+        cache_keys = [request_cache_key(request) for request in batch.indexes]
+        cached = await index_cache.get_many({key: key for key in set(cache_keys)})
+
+        # Variants that aren't cached are built together (identical ones only once)
+        missing = {key: request for key, request in zip(cache_keys, batch.indexes) if cached[key] is None}
+        outcomes = {}
+        if missing:
+            build_key = "batch:" + ",".join(missing.keys())
+            built = await index_executor.submit_shared(build_key, lambda: build_index_batch(list(missing.values()), list(missing.keys())))
+            outcomes = dict(zip(missing.keys(), built))
+
+        results = []
+        for key in cache_keys:
+            if cached[key] is not None:
+                results.append(index_response(cached[key]))
+            elif outcomes[key]["success"]:
+                results.append(index_response(outcomes[key]["result"]))
+            else:
+                results.append(IndexCreationResponse(
+                    success=False,
+                    message="Failed to create index",
+                    error=outcomes[key]["error"],
+                ))
+
+        created = sum(result.success for result in results)
+        return IndexBatchResponse(
+            success=created == len(results),
+            message=f"Created {created} of {len(results)} indexes",
+            results=results,
         )
+    except IndexQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
-        return IndexCreationResponse(
+        return IndexBatchResponse(
             success=False,
-            message="Failed to create index",
+            message="Failed to create index batch",
             error=str(e),
         )
 
@@ -0,0 +1,77 @@
+import numpy as np
+import polars as pl
+from datetime import datetime, date
+from typing import Optional, Tuple, Union
+
+
+RETURN_LAG_DAYS = 250  # trading days between the two values of a yearly return
+
+
+def to_date(value: Union[date, str, None]) -> Optional[date]:
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+    return value
+
+
+def rebase_series(df: pl.DataFrame,
+                  value_col: str,
+                  start_amount: float = 1000,
+                  start_date: Union[date, str, None] = None,
+                  end_date: Union[date, str, None] = None
+                  ) -> pl.DataFrame:
+    """
+    Cut a (date, value) series to the given dates and rebase it to start at start_amount.
+
+    Every value is start_amount times the cumulative product of the day-over-day ratios, so a
+    day following a zero value keeps the previous value instead of dividing by zero.
+    """
+    start_date = to_date(start_date)
+    end_date = to_date(end_date)
+    if start_date:
+        df = df.filter(pl.col("date") >= start_date)
+    if end_date:
+        df = df.filter(pl.col("date") <= end_date)
+    df = df.sort("date")
+
+    previous = pl.col(value_col).shift(1)
+    ratio = (
+        pl.when(previous.is_null()).then(pl.lit(float(start_amount)))
+          .when(previous == 0).then(pl.lit(1.0))
+          .otherwise(pl.col(value_col) / previous)
+    )
+    return df.select([
+        pl.col("date"),
+        ratio.cast(pl.Float64).cum_prod().alias(value_col),
+    ])
+
+
+def rebase_values(values: np.ndarray, start_amount: float = 1000) -> np.ndarray:
+    """NumPy equivalent of rebase_series for the values of a series already cut and sorted by date"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return values
+    previous = values[:-1]
+    ratios = np.empty(len(values), dtype=np.float64)
+    ratios[0] = float(start_amount)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios[1:] = np.where(previous == 0, 1.0, values[1:] / previous)
+    return np.cumprod(ratios)
+
+
+def trailing_returns(values: np.ndarray, lag: int = RETURN_LAG_DAYS) -> np.ndarray:
+    """Return of every value over the value `lag` rows later (values sorted newest first)"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) <= lag:
+        return np.empty(0, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return values[:-lag] / values[lag:] - 1
+
+
+def return_and_downside_risk(returns: np.ndarray) -> Tuple[float, float]:
+    """Average return and the (population) standard deviation of the negative returns"""
+    if len(returns) == 0:
+        return 0.0, 0.0
+    avg_return = float(np.mean(returns))
+    neg_returns = returns[returns < 0]
+    risk = float(np.sqrt(np.mean((neg_returns - neg_returns.mean()) ** 2))) if len(neg_returns) else 0.0
+    return avg_return, risk
@@ -0,0 +1,191 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+import polars as pl
+from src.index_maker.index_maker import calculate_risk_return
+from src.utils.analytics import rebase_series
+from src.utils.benchmark_utils import normalize_benchmark_data, calculate_benchmark_risk_return, calculate_benchmark_risk_returns
+
+
+TRADING_DAYS = 12 * 252  # 12-year series
+BENCHMARK_SYMBOLS = 40
+
+
+def synthetic_series(n_days: int = TRADING_DAYS, seed: int = 7) -> pl.DataFrame:
+    """Business-day random walk ending today (so the benchmark freshness checks pass)"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=n_days).date
+    values = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.012, n_days)))
+    return pl.DataFrame({"date": pl.Series(list(dates), dtype=pl.Date), "value": values})
+
+
+########################################################
+# Previous list based implementations, kept as reference
+########################################################
+
+def legacy_normalize(df, start_amount=1000, start_date=None, end_date=None, value_col="value"):
+    if start_date:
+        df = df.filter(pl.col("date") >= start_date)
+    if end_date:
+        df = df.filter(pl.col("date") <= end_date)
+    df = df.sort("date")
+    values = df.get_column(value_col).to_list()
+    returns = [1.0]
+    for i in range(1, len(values)):
+        if values[i - 1] != 0:
+            returns.append(values[i] / values[i - 1])
+        else:
+            returns.append(1.0)
+    new_values = [float(start_amount)]
+    for r in returns[1:]:
+        new_values.append(new_values[-1] * r)
+    return df.with_columns([
+        pl.Series(name=value_col, values=new_values, dtype=pl.Float64)
+    ]).select(["date", value_col])
+
+
+def _legacy_returns_risk(returns):
+    avg_return = sum(returns) / len(returns) if returns else 0.0
+    neg_returns = [r for r in returns if r < 0]
+    risk = 0.0
+    if neg_returns:
+        mean = sum(neg_returns) / len(neg_returns)
+        squared_diff = [(r - mean) ** 2 for r in neg_returns]
+        risk = (sum(squared_diff) / len(neg_returns)) ** 0.5
+    return round(float(avg_return), 4), round(float(risk), 4)
+
+
+def legacy_calculate_risk_return(df, index_start_date=None):
+    df = df.sort("date", descending=True)
+    values = df.get_column("index_value").to_list()
+    dates = df.get_column("date").to_list()
+    if (dates[0] - dates[-1]).days < 5 * 250:
+        return {"return": 0.0, "risk": 0.0}
+    returns = []
+    for i in range(len(values)):
+        if i + 250 >= len(values):
+            break
+        if index_start_date and dates[i] < index_start_date:
+            break
+        returns.append((values[i] / values[i + 250]) - 1)
+    avg_return, risk = _legacy_returns_risk(returns)
+    return {"return": avg_return, "risk": risk}
+
+
+def legacy_calculate_benchmark_risk_return(df):
+    default_result = {"data_points": 0, "return_eur": 0.0, "return_usd": 0.0, "risk_eur": 0.0, "risk_usd": 0.0}
+    df = df.sort_values('date', ascending=False)
+    df["gap"] = df["date"].diff(periods=-1)
+    if (df["gap"] > pd.Timedelta(days=30)).any():
+        return default_result
+    today = pd.Timestamp.today().normalize().date()
+    first_date = df['date'].min()
+    last_date = df['date'].max()
+    if (last_date - first_date).days < 5 * 365 or (today - last_date).days > 30:
+        return default_result
+    results = {}
+    for currency in ['eur', 'usd']:
+        col = f'close_{currency}'
+        ratio = df[col] / df[col].shift(-1)
+        if ((ratio >= 10) | (ratio <= 0.1)).any():
+            return default_result
+        returns = []
+        values = df[col].values
+        for i in range(len(values)):
+            if i + 250 >= len(values):
+                break
+            t0_val = values[i]
+            t250_val = values[i + 250]
+            if t0_val >= 0 and t250_val >= 0:
+                ret = (t0_val / t250_val) - 1
+                if abs(ret) < 1000:
+                    returns.append(ret)
+        results[f'return_{currency}'], results[f'risk_{currency}'] = _legacy_returns_risk(returns)
+        results["data_points"] = len(returns)
+    return results
+
+
+def per_symbol_benchmark_risk_returns(df):
+    """field_maker's previous loop: one filter and one calculate_benchmark_risk_return per symbol"""
+    results = []
+    for symbol in df["symbol"].unique():
+        risk_return = calculate_benchmark_risk_return(df[df["symbol"] == symbol])
+        results.extend(v for k, v in sorted(risk_return.items()))
+    return results
+
+
+def _best_of(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def run_benchmark(n_days: int = TRADING_DAYS, repeats: int = 5) -> pl.DataFrame:
+    """Time the columnar analytics against the previous loops and report the largest difference"""
+    series = synthetic_series(n_days)
+    index_df = series.rename({"value": "index_value"})
+    start_date = series.get_column("date")[n_days // 3]
+    benchmark_pd = series.select(
+        "date", pl.col("value").alias("close_eur"), (pl.col("value") * 1.1).alias("close_usd")
+    ).to_pandas()
+    benchmark_pd["date"] = benchmark_pd["date"].dt.date
+    benchmarks_pd = pd.concat(
+        [benchmark_pd.assign(symbol=f"^B{i:02d}", close_eur=benchmark_pd["close_eur"] * (1 + i / 100))
+         for i in range(BENCHMARK_SYMBOLS)],
+        ignore_index=True,
+    )
+    risk_return_columns = ["data_points", "return_eur", "return_usd", "risk_eur", "risk_usd"]
+
+    cases = [
+        (
+            # trim_index without its debug print
+            "trim_index",
+            lambda: legacy_normalize(index_df, 1000, start_date, value_col="index_value").get_column("index_value"),
+            lambda: rebase_series(index_df, "index_value", 1000, start_date).get_column("index_value"),
+        ),
+        (
+            "normalize_benchmark_data",
+            lambda: legacy_normalize(series, 1000).get_column("value"),
+            lambda: normalize_benchmark_data(series, 1000).get_column("value"),
+        ),
+        (
+            "calculate_risk_return",
+            lambda: list(legacy_calculate_risk_return(index_df, start_date).values()),
+            lambda: list(calculate_risk_return(index_df, start_date).values()),
+        ),
+        (
+            "calculate_benchmark_risk_return",
+            lambda: [v for k, v in sorted(legacy_calculate_benchmark_risk_return(benchmark_pd).items())],
+            lambda: [v for k, v in sorted(calculate_benchmark_risk_return(benchmark_pd).items())],
+        ),
+        (
+            # field_maker.get_benchmarks over BENCHMARK_SYMBOLS symbols
+            "calculate_benchmark_risk_returns",
+            lambda: per_symbol_benchmark_risk_returns(benchmarks_pd),
+            lambda: calculate_benchmark_risk_returns(benchmarks_pd)[risk_return_columns].to_numpy().ravel(),
+        ),
+    ]
+
+    rows = []
+    for name, legacy, columnar in cases:
+        legacy_result, legacy_seconds = _best_of(legacy, repeats)
+        columnar_result, columnar_seconds = _best_of(columnar, repeats)
+        rows.append({
+            "function": name,
+            "rows": n_days,
+            "legacy_ms": round(legacy_seconds * 1000, 3),
+            "columnar_ms": round(columnar_seconds * 1000, 3),
+            "speedup": round(legacy_seconds / columnar_seconds, 1),
+            "max_abs_diff": float(np.max(np.abs(np.array(legacy_result) - np.array(columnar_result)))),
+        })
+    return pl.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    n_days = int(sys.argv[1]) if len(sys.argv) > 1 else TRADING_DAYS
+    with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=200):
+        print(run_benchmark(n_days))
@@ -0,0 +1,113 @@
+import os
+import time
+import threading
+import numpy as np
+import polars as pl
+from datetime import date
+from typing import Dict, List, Optional, Tuple, Union
+from .utils import run_query_to_polars, get_etl_version
+from .analytics import to_date, rebase_values
+
+
+BENCHMARK_STORE_ENABLED = os.getenv("BENCHMARK_STORE_ENABLED", "true").lower() == "true"
+BENCHMARK_STORE_REFRESH_MINUTES = int(os.getenv("BENCHMARK_STORE_REFRESH_MINUTES", "15"))
+
+CURRENCY_COLUMNS = {"EUR": "close_eur", "USD": "close_usd"}
+
+
+class BenchmarkStore:
+    """
+    In-memory copy of raw.benchmarks: for every (symbol, currency) the dates with a close in that
+    currency, sorted, as datetime64 days, next to the closes and the dates preformatted the way
+    the API returns them. A date range is two binary searches and rebasing is one cumulative
+    product, so a request doesn't touch the database.
+    """
+
+    def __init__(self, df: pl.DataFrame, etl_version=None):
+        self.etl_version = etl_version
+        self.series: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        for currency, column in CURRENCY_COLUMNS.items():
+            rows = df.select(["symbol", "date", column]).drop_nulls(column).sort(["symbol", "date"])
+            for (symbol,), group in rows.group_by(["symbol"], maintain_order=True):
+                days = group.get_column("date").to_numpy().astype("datetime64[D]")
+                labels = np.char.add(days.astype(str), "T00:00:00")
+                self.series[(symbol, currency)] = (days, group.get_column(column).to_numpy(), labels)
+
+    @property
+    def symbols(self) -> List[str]:
+        return sorted({symbol for symbol, _ in self.series})
+
+    @classmethod
+    def load(cls, etl_version=None) -> "BenchmarkStore":
+        start = time.time()
+        df = run_query_to_polars("""
+            SELECT
+                symbol, date,
+                CAST(close_eur AS FLOAT8) AS close_eur,
+                CAST(close_usd AS FLOAT8) AS close_usd
+            FROM raw.benchmarks
+        """).with_columns(pl.col("date").cast(pl.Date))
+        store = cls(df, etl_version=etl_version)
+        print(f"✅ Benchmark store loaded in {round(time.time() - start, 2)} seconds: "
+              f"{len(store.symbols)} symbols, {df.height:,} rows")
+        return store
+
+    def rebased(self,
+                symbol: str,
+                currency: str = "USD",
+                start_amount: float = 1000,
+                start_date: Union[date, str, None] = None,
+                end_date: Union[date, str, None] = None) -> List[Dict]:
+        """Same records as normalize_benchmark_data on the symbol's rows: one {"date", "value"} per day"""
+        series = self.series.get((symbol, currency.upper()))
+        if series is None:
+            return []
+        days, values, labels = series
+        start_date = to_date(start_date)
+        end_date = to_date(end_date)
+        first = np.searchsorted(days, np.datetime64(start_date, "D"), side="left") if start_date else 0
+        last = np.searchsorted(days, np.datetime64(end_date, "D"), side="right") if end_date else len(days)
+        rebased = rebase_values(values[first:last], start_amount)
+        return [{"date": label, "value": value} for label, value in zip(labels[first:last].tolist(), rebased.tolist())]
+
+    def historical_data(self,
+                        symbols: List[str],
+                        start_date: Union[date, str, None] = None,
+                        end_date: Union[date, str, None] = None,
+                        start_amount: float = 1000,
+                        currency: str = "USD") -> Dict[str, List[Dict]]:
+        return {symbol: self.rebased(symbol, currency, start_amount, start_date, end_date) for symbol in symbols}
+
+
+########################################################
+########################################################
+########################################################
+
+_benchmark_store: Optional[BenchmarkStore] = None
+_benchmark_store_lock = threading.Lock()
+
+
+def get_benchmark_store() -> Optional[BenchmarkStore]:
+    """Current benchmark store, or None if it hasn't been loaded (yet)"""
+    return _benchmark_store
+
+
+def refresh_benchmark_store(force: bool = False) -> Optional[BenchmarkStore]:
+    """(Re)load the benchmark store when the ETL has produced a new version of the data"""
+    global _benchmark_store
+
+    if not _benchmark_store_lock.acquire(blocking=False):
+        return _benchmark_store  # a reload is already running
+    try:
+        etl_version = get_etl_version()
+        if not force and _benchmark_store is not None and _benchmark_store.etl_version == etl_version:
+            return _benchmark_store
+
+        print(f"⏳ Loading benchmark store for ETL version {etl_version} at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        _benchmark_store = BenchmarkStore.load(etl_version=etl_version)
+        return _benchmark_store
+    except Exception as e:
+        print(f"❌ Error loading benchmark store: {e}")
+        return _benchmark_store
+    finally:
+        _benchmark_store_lock.release()
@@ -1,8 +1,12 @@
+import numpy as np
 import pandas as pd
 import polars as pl
 from typing import List, Dict, Any, Union
-from datetime import datetime, date
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
 from .utils import run_query
+from .analytics import rebase_series, trailing_returns, return_and_downside_risk, RETURN_LAG_DAYS
+from .benchmark_store import get_benchmark_store
 
 def normalize_benchmark_data(
     df: pl.DataFrame,
@@ -15,44 +19,8 @@ def normalize_benchmark_data(
     """
     if df.is_empty():
         return df
-    
-    # Convert string dates to date objects
-    if isinstance(start_date, str):
-        start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-    if isinstance(end_date, str):
-        end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-    
-    # Filter by date range if provided
-    if start_date:
-        df = df.filter(pl.col("date") >= start_date)
-    if end_date:
-        df = df.filter(pl.col("date") <= end_date)
-    
-    df = df.sort("date")
-    
-    if df.is_empty():
-        return df
-    
-    # Get the values and calculate returns
-    values = df.get_column("value").to_list()
-    returns = [1.0]
-    for i in range(1, len(values)):
-        if values[i - 1] != 0:  # Avoid division by zero
-            returns.append(values[i] / values[i - 1])
-        else:
-            returns.append(1.0)
-    
-    # Rebuild normalized values starting from start_amount
-    new_values = [float(start_amount)]
-    for r in returns[1:]:
-        new_values.append(new_values[-1] * r)
-    
-    # Replace value column with normalized values
-    df = df.with_columns([
-        pl.Series(name="value", values=new_values, dtype=pl.Float64)
-    ]).select(["date", "value"])
-    
-    return df
+
+    return rebase_series(df, "value", start_amount, start_date, end_date)
 
 def get_benchmark_historical_data(symbols: List[str], 
                                     start_date: str = None, 
@@ -63,6 +31,15 @@ def get_benchmark_historical_data(symbols: List[str],
 
     if not symbols:
         return {}
+
+    # Served from memory once the benchmark store is loaded, the query below is the fallback
+    store = get_benchmark_store()
+    if store is not None:
+        try:
+            return store.historical_data(symbols, start_date, end_date, start_amount, currency)
+        except Exception as e:
+            print(f"Error reading benchmark data: {e}")
+            return {symbol: [] for symbol in symbols}
     
     # Create the IN clause with quoted symbols
     symbols_str = "', '".join(symbols)
@@ -118,31 +95,57 @@ def get_benchmark_historical_data(symbols: List[str],
 
 
 
+BENCHMARK_RISK_RETURN_DEFAULT = {
+    "data_points": 0,
+    "return_eur": 0.0,
+    "return_usd": 0.0,
+    "risk_eur": 0.0,
+    "risk_usd": 0.0
+}
+
+MAX_GAP = np.timedelta64(30, "D")
+
+
+def _returns_risk(values: np.ndarray):
+    """Rounded average 250-day return and downside risk of closes sorted newest first, and the number of returns"""
+    # Returns between t0 and t-250, skipping negative prices and absurd returns
+    returns = trailing_returns(values)
+    t0_vals = values[:len(returns)]
+    t250_vals = values[RETURN_LAG_DAYS:]
+    with np.errstate(invalid="ignore"):
+        valid = (t0_vals >= 0) & (t250_vals >= 0) & (np.abs(returns) < 1000)
+    returns = returns[valid]
+    avg_return, risk = return_and_downside_risk(returns)
+    return round(avg_return, 4), round(risk, 4), len(returns)
+
+
+def _has_outlier_jump(values: np.ndarray, same_symbol: np.ndarray) -> np.ndarray:
+    """Per row: the close is at least 10x (or at most 1/10) of the previous day's close of the same symbol"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = values[:-1] / values[1:]
+        return same_symbol & ((ratio >= 10) | (ratio <= 0.1))
+
+
 def calculate_benchmark_risk_return(df: pd.DataFrame) -> Dict[str, float]:
 
-    default_result = {
-        "data_points": 0,
-        "return_eur": 0.0,
-        "return_usd": 0.0,
-        "risk_eur": 0.0,
-        "risk_usd": 0.0
-        }
+    default_result = dict(BENCHMARK_RISK_RETURN_DEFAULT)
 
     if df.empty:
         return default_result
     
     # if data has gap > 30 days, return default result
     df = df.sort_values('date', ascending=False)
-    df["gap"] = df["date"].diff(periods=-1) 
-    has_gap = (df["gap"] > pd.Timedelta(days=30)).any()
+    # datetime64 instead of date objects, so the gap check runs vectorized
+    dates = pd.to_datetime(df["date"])
+    has_gap = (dates.diff(periods=-1) > pd.Timedelta(days=30)).any()
 
     if has_gap:
         return default_result
     
     # Check if we have at least 5 years of data
     today = pd.Timestamp.today().normalize().date()
-    first_date = df['date'].min()
-    last_date = df['date'].max()
+    first_date = dates.min().date()
+    last_date = dates.max().date()
     days_between_min_max = (last_date - first_date).days
     days_between_today_max = (today - last_date).days
     
@@ -163,31 +166,61 @@ def calculate_benchmark_risk_return(df: pd.DataFrame) -> Dict[str, float]:
         if has_outlier_jump:
             return default_result
         
-        # Calculate returns between t0 and t-250
-        returns = []
-        values = df[col].values
-        for i in range(len(values)):
-            if i + 250 >= len(values):
-                break
-            t0_val = values[i]
-            t250_val = values[i + 250]
-            if t0_val>=0 and t250_val>=0:
-                ret = (t0_val / t250_val) - 1
-                if abs(ret) < 1000 :
-                    returns.append(ret)
-        
-        # Calculate average return
-        avg_return = sum(returns) / len(returns) if returns else 0.0
-        
-        # Calculate risk (std dev of negative returns)
-        neg_returns = [r for r in returns if r < 0]
-        risk = 0.0
-        if neg_returns:
-            mean = sum(neg_returns) / len(neg_returns)
-            squared_diff = [(r - mean) ** 2 for r in neg_returns]
-            risk = (sum(squared_diff) / len(neg_returns)) ** 0.5
-            
-        results[f'return_{currency}'] = round(float(avg_return), 4)
-        results[f'risk_{currency}'] = round(float(risk), 4)
-        results["data_points"] = len(returns)
-    return results
\ No newline at end of file
+        values = df[col].to_numpy(dtype="float64")
+        results[f'return_{currency}'], results[f'risk_{currency}'], results["data_points"] = _returns_risk(values)
+    return results
+
+
+def _benchmark_risk_returns(df: pd.DataFrame) -> pd.DataFrame:
+    """calculate_benchmark_risk_return of every symbol of df, sorted and checked in one pass"""
+    columns = ["symbol", "date", "data_points", "return_eur", "return_usd", "risk_eur", "risk_usd"]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    # One sort for all symbols: rows of a symbol are contiguous, newest first
+    df = df.sort_values(["symbol", "date"], ascending=[True, False], kind="mergesort")
+    symbols = df["symbol"].to_numpy()
+    dates = pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]")
+    starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+    ends = np.r_[starts[1:], len(df)]
+    same_symbol = symbols[1:] == symbols[:-1]
+
+    # Row-level checks, reduced per symbol: the flag of a row pair counts for the symbol of its first row
+    def per_symbol_any(flags: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(np.r_[flags, False].astype(np.int64), starts) > 0
+
+    has_gap = per_symbol_any(same_symbol & (dates[:-1] - dates[1:] > MAX_GAP))
+    has_jump = {c: per_symbol_any(_has_outlier_jump(df[f"close_{c}"].to_numpy(dtype="float64"), same_symbol)) for c in ["eur", "usd"]}
+
+    today = np.datetime64(pd.Timestamp.today().normalize().date(), "D")
+    last_dates = dates[starts]
+    first_dates = dates[ends - 1]
+    too_short = (last_dates - first_dates).astype(np.int64) < 5 * 365
+    too_old = (today - last_dates).astype(np.int64) > 30
+    excluded = has_gap | too_short | too_old | has_jump["eur"] | has_jump["usd"]
+
+    values = {c: df[f"close_{c}"].to_numpy(dtype="float64") for c in ["eur", "usd"]}
+    min_dates = df["date"].to_numpy()[ends - 1]
+    rows = []
+    for k, (start, end) in enumerate(zip(starts, ends)):
+        result = dict(BENCHMARK_RISK_RETURN_DEFAULT)
+        if not excluded[k]:
+            for currency in ["eur", "usd"]:
+                result[f"return_{currency}"], result[f"risk_{currency}"], result["data_points"] = _returns_risk(values[currency][start:end])
+        rows.append({"symbol": symbols[start], "date": min_dates[k], **result})
+    return pd.DataFrame(rows, columns=columns)
+
+
+def calculate_benchmark_risk_returns(df: pd.DataFrame, processes: int = 1) -> pd.DataFrame:
+    """
+    calculate_benchmark_risk_return for all symbols of a (symbol, date, close_eur, close_usd) frame,
+    plus the first date of each symbol, as one row per symbol. With processes > 1 the symbols are
+    split over a process pool.
+    """
+    symbols = df["symbol"].unique()
+    if processes <= 1 or len(symbols) < 2:
+        return _benchmark_risk_returns(df)
+
+    chunks = [df[df["symbol"].isin(chunk)] for chunk in np.array_split(symbols, min(processes, len(symbols)))]
+    with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+        return pd.concat(list(pool.map(_benchmark_risk_returns, chunks)), ignore_index=True)
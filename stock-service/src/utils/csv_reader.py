@@ -1,14 +1,18 @@
 import pandas as pd
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-def read_index_fields_from_csv() -> Dict[str, Any]:
+# The fields directory is at src/utils/fields
+FIELDS_DIR = os.path.join(os.path.dirname(__file__), 'fields')
+FIELDS_FILES = ['countries.csv', 'sectors.csv', 'industries.csv', 'kpis.csv', 'companies.csv', 'benchmarks.csv']
+
+def read_index_fields_from_csv(companies: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
     """
     Read index fields from CSV files generated by field_maker.py
     Returns the same structure as the original get_index_fields() function
+    (companies already read from companies.csv can be passed in instead of reading it again)
     """
-    # The fields directory is at src/utils/fields
-    fields_dir = os.path.join(os.path.dirname(__file__), 'fields')
+    fields_dir = FIELDS_DIR
     
     # Initialize result structure
     result = {
@@ -25,10 +29,7 @@ def read_index_fields_from_csv() -> Dict[str, Any]:
         countries_path = os.path.join(fields_dir, 'countries.csv')
         if os.path.exists(countries_path):
             countries_df = pd.read_csv(countries_path, dtype=str, keep_default_na=False, na_filter=False )
-            result["countries"] = [
-                {"country_code": row["country_code"], "country_name": row["country_name"]}
-                for _, row in countries_df.iterrows()
-            ]
+            result["countries"] = countries_df[["country_code", "country_name"]].to_dict("records")
     except Exception as e:
         print(f"Warning: Could not read countries.csv: {e}")
     
@@ -46,12 +47,8 @@ def read_index_fields_from_csv() -> Dict[str, Any]:
         industries_path = os.path.join(fields_dir, 'industries.csv')
         if os.path.exists(industries_path):
             industries_df = pd.read_csv(industries_path, dtype=str, keep_default_na=False, na_filter=False)
-            for _, row in industries_df.iterrows():
-                sector = row["sector"]
-                industry = row["industry"]
-                if sector not in result["industries"]:
-                    result["industries"][sector] = []
-                result["industries"][sector].append(industry)
+            for sector, industry in zip(industries_df["sector"], industries_df["industry"]):
+                result["industries"].setdefault(sector, []).append(industry)
     except Exception as e:
         print(f"Warning: Could not read industries.csv: {e}")
     
@@ -79,27 +76,44 @@ def read_index_fields_from_csv() -> Dict[str, Any]:
         print(f"Warning: Could not read kpis.csv: {e}")
     
     # Read companies from CSV
-    try:
-        companies_path = os.path.join(fields_dir, 'companies.csv')
-        if os.path.exists(companies_path):
-            companies_df = pd.read_csv(companies_path, dtype=str, keep_default_na=False, na_filter=False)
-            result["companies"] = [
-                {"company_name": row["company_name"], "symbol": row["symbol"]}
-                for _, row in companies_df.iterrows()
-            ]
-    except Exception as e:
-        print(f"Warning: Could not read companies.csv: {e}")
+    if companies is not None:
+        result["companies"] = companies
+    else:
+        try:
+            companies_path = os.path.join(fields_dir, 'companies.csv')
+            if os.path.exists(companies_path):
+                companies_df = pd.read_csv(companies_path, dtype=str, keep_default_na=False, na_filter=False)
+                result["companies"] = companies_df[["company_name", "symbol"]].to_dict("records")
+        except Exception as e:
+            print(f"Warning: Could not read companies.csv: {e}")
     
     # Read benchmarks from CSV
     try:
         benchmarks_path = os.path.join(fields_dir, 'benchmarks.csv')
         if os.path.exists(benchmarks_path):
             benchmarks_df = pd.read_csv(benchmarks_path, dtype=str, keep_default_na=False, na_filter=False)
-            result["benchmarks"] = [
-                {"name": row["name"], "symbol": row["symbol"], "type": row["type"], "date": row["date"]}
-                for _, row in benchmarks_df.iterrows()
-            ]
+            result["benchmarks"] = benchmarks_df[["name", "symbol", "type", "date"]].to_dict("records")
     except Exception as e:
         print(f"Warning: Could not read benchmarks.csv: {e}")
     
     return result
+
+
+def read_benchmark_risk_return_from_csv() -> Optional[Dict[str, Any]]:
+    """
+    Risk/return metrics of the benchmarks in benchmarks.csv for the scatter plot,
+    or None if the file doesn't exist. Missing or non-numeric metrics become None.
+    """
+    csv_path = os.path.join(FIELDS_DIR, 'benchmarks.csv')
+    if not os.path.exists(csv_path):
+        return None
+
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=False, na_filter=False)
+    for col in ["name", "symbol", "type", "date"]:
+        if col not in df.columns:
+            df[col] = None
+    numeric_cols = ["data_points", "return_eur", "return_usd", "risk_eur", "risk_usd"]
+    for col in numeric_cols:
+        values = pd.to_numeric(df[col], errors="coerce").astype("float64") if col in df.columns else pd.Series(float("nan"), index=df.index)
+        df[col] = values.astype(object).where(values.notna(), None)
+    return {"benchmarks": df[["name", "symbol", "type", "date"] + numeric_cols].to_dict("records")}
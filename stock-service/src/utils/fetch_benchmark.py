@@ -0,0 +1,94 @@
+import io
+import sys
+import time
+import polars as pl
+from src.utils.utils import pooled_connection, run_query_to_polars
+
+
+# Same shape as the price part of the index query: one row per symbol and trading day
+DEFAULT_QUERY = """
+    SELECT date, symbol, currency, year, quarter, last_quarter_date, close, close_eur, close_usd
+    FROM raw.historical_price_volume
+    WHERE volume_eur > 100000
+"""
+
+
+def fetch_rows_batched(query: str) -> pl.DataFrame:
+    """Previous default: fetchall() into tuples, DataFrames built in 10,000 row slices"""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(query)
+        columns = [desc[0] for desc in cur.description]
+        rows = cur.fetchall()
+        cur.close()
+    batch_size = 10000
+    dfs = [
+        pl.DataFrame(rows[i:i + batch_size], schema=columns, orient="row")
+        for i in range(0, len(rows), batch_size)
+    ]
+    return pl.concat(dfs) if dfs else pl.DataFrame()
+
+
+def fetch_copy_csv(query: str) -> pl.DataFrame:
+    """COPY ... TO STDOUT as CSV text, parsed by Polars"""
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        buffer = io.StringIO()
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", buffer)
+        cur.close()
+    buffer.seek(0)
+    return pl.read_csv(buffer)
+
+
+def fetch_server_cursor(query: str) -> pl.DataFrame:
+    """Named (server-side) cursor read in 50,000 row chunks"""
+    with pooled_connection() as conn:
+        cur = conn.cursor(name="fetch_benchmark")
+        cur.itersize = 50_000
+        cur.execute(query)
+        rows = []
+        while True:
+            batch = cur.fetchmany(50_000)
+            if not batch:
+                break
+            rows.extend(batch)
+        columns = [desc[0] for desc in cur.description]
+        cur.close()
+    return pl.DataFrame(rows, schema=columns, orient="row")
+
+
+STRATEGIES = {
+    "rows_batched": fetch_rows_batched,
+    "copy_csv": fetch_copy_csv,
+    "server_cursor": fetch_server_cursor,
+    "arrow_binary": run_query_to_polars,
+}
+
+
+def run_benchmark(query: str = DEFAULT_QUERY, repeats: int = 3) -> pl.DataFrame:
+    """Time every fetch strategy on the same query (best of `repeats`)"""
+    results = []
+    for name, fetch in STRATEGIES.items():
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            df = fetch(query)
+            fetched_dtypes = f"date: {df.schema.get('date')}, close: {df.schema.get('close')}"
+            # make_index works on floats, so include the cast the row based paths still need
+            df = df.with_columns(pl.col(c).cast(pl.Float64) for c in ["close", "close_eur", "close_usd"] if c in df.columns)
+            timings.append(time.perf_counter() - start)
+        results.append({
+            "strategy": name,
+            "rows": df.height,
+            "best_seconds": round(min(timings), 3),
+            "mean_seconds": round(sum(timings) / len(timings), 3),
+            "rows_per_second": int(df.height / min(timings)) if min(timings) > 0 else None,
+            "fetched_dtypes": fetched_dtypes,
+        })
+    return pl.DataFrame(results).sort("best_seconds")
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    with pl.Config(tbl_rows=-1, tbl_cols=-1, tbl_width_chars=200):
+        print(run_benchmark(repeats=repeats))
@@ -3,9 +3,11 @@ import os
 import pandas as pd
 import sys
 
-from src.utils.fields_utils import kpi_query, country_codes
+from src.utils.fields_utils import kpi_query, kpi_buckets_query, country_codes
 from src.utils.utils import run_query
-from src.utils.benchmark_utils import calculate_benchmark_risk_return
+from src.utils.benchmark_utils import calculate_benchmark_risk_returns
+
+FIELD_MAKER_PROCESSES = int(os.getenv("FIELD_MAKER_PROCESSES", "1"))
 
 def get_countries():
     
@@ -48,8 +50,9 @@ def get_industries():
     return industry_df
 
 def get_kpis():
-    # Import the query from the existing file
-    kpi_df = run_query(kpi_query)
+    # Bucket catalogue maintained by the ETL, or one unpivoting scan of the percentile table before it exists
+    has_kpi_buckets = run_query("SELECT to_regclass('clean.kpi_buckets') IS NOT NULL AS exists")['exists'].iloc[0]
+    kpi_df = run_query(kpi_buckets_query if has_kpi_buckets else kpi_query)
     kpi_df['kpi_name_clean'] = (kpi_df['kpi_name']
         .astype(str)
         .str.replace('_', ' ', regex=False)
@@ -58,7 +61,7 @@ def get_kpis():
     return kpi_df
 
 def get_companies():
-    company_query = "select distinct company_name, symbol, country from raw.stock_info WHERE relevant = true"
+    company_query = "select distinct company_name, symbol, country, sector, industry from raw.stock_info WHERE relevant = true"
     company_df = run_query(company_query)
     
     # Clean up company names by removing quotes and commas
@@ -83,30 +86,13 @@ def get_benchmarks():
     benchmark_df = run_query(benchmark_query)
 
     unique_benchmarks = benchmark_df[['name', 'symbol', 'type']].drop_duplicates()
-    processed_benchmarks = []
-    
-    # Process each unique benchmark
-    for _, row in unique_benchmarks.iterrows():
-        symbol = row['symbol']
-        
-        symbol_data = benchmark_df[benchmark_df['symbol'] == symbol]
-        risk_return = calculate_benchmark_risk_return(symbol_data)
-        min_date = symbol_data['date'].min()
-        
-        benchmark_record = {
-            'name': row['name'],
-            'symbol': symbol,
-            'type': row['type'],
-            'date': min_date,
-            'data_points': risk_return['data_points'],
-            'return_eur': risk_return['return_eur'],
-            'return_usd': risk_return['return_usd'],
-            'risk_eur': risk_return['risk_eur'],
-            'risk_usd': risk_return['risk_usd']
-        }
-        processed_benchmarks.append(benchmark_record)
-    
-    result_df = pd.DataFrame(processed_benchmarks)
+
+    # Risk/return of all benchmarks from one sort of the frame instead of one filter per symbol
+    risk_returns = calculate_benchmark_risk_returns(
+        benchmark_df[['symbol', 'date', 'close_eur', 'close_usd']],
+        processes=FIELD_MAKER_PROCESSES
+    )
+    result_df = unique_benchmarks.merge(risk_returns, on='symbol', how='left').reset_index(drop=True)
     result_df = result_df[result_df['data_points'] != 0]
     return result_df
 
@@ -0,0 +1,146 @@
+import os
+import json
+import gzip
+import bisect
+import hashlib
+import threading
+import polars as pl
+from typing import Any, Dict, List, Optional, Tuple
+from .csv_reader import read_index_fields_from_csv, read_benchmark_risk_return_from_csv, FIELDS_DIR, FIELDS_FILES
+
+
+class Payload:
+    """A JSON response serialized once: the body, its gzipped form and their strong ETags"""
+
+    def __init__(self, content: Any):
+        # Same serialization as FastAPI's JSONResponse
+        self.body = json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+        self.gzip_body = gzip.compress(self.body, compresslevel=6, mtime=0)
+        # Strong validators differ per content encoding
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gzip"'
+
+
+class CompanyIndex:
+    """Sorted, lower-cased symbols and company names of companies.csv for prefix search"""
+
+    def __init__(self, companies: List[Dict[str, str]]):
+        self.companies = companies
+        self.by_symbol = sorted((c["symbol"].lower(), i) for i, c in enumerate(companies))
+        self.by_name = sorted((c["company_name"].lower(), i) for i, c in enumerate(companies))
+
+    @staticmethod
+    def _prefix_range(keys: List[Tuple[str, int]], prefix: str) -> List[Tuple[str, int]]:
+        start = bisect.bisect_left(keys, (prefix,))
+        end = bisect.bisect_left(keys, (prefix + "\uffff",))
+        return keys[start:end]
+
+    def search(self, prefix: str, limit: int = 50) -> List[Dict[str, str]]:
+        """Companies whose symbol or name starts with the prefix (case-insensitive), symbol matches first"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        seen = set()
+        result = []
+        for keys in (self.by_symbol, self.by_name):
+            for _, i in self._prefix_range(keys, prefix):
+                if i not in seen:
+                    seen.add(i)
+                    result.append(self.companies[i])
+                    if len(result) >= limit:
+                        return result
+        return result
+
+
+class CompanyDimension:
+    """
+    companies.csv dictionary-encoded: symbol ids (UInt32) are positions in the sorted symbols and
+    the attributes are categoricals, so weight tables attach names and countries with an integer join.
+    """
+
+    ATTRIBUTES = ["company_name", "country", "sector", "industry"]
+
+    def __init__(self, companies: pl.DataFrame):
+        # The /api/index-fields list keeps the file's rows and order (empty fields as "")
+        self.records = companies.select([pl.col(c).fill_null("") for c in ("company_name", "symbol")]).to_dicts()
+
+        companies = companies.with_columns([
+            pl.lit(None, dtype=pl.Utf8).alias(c) for c in self.ATTRIBUTES if c not in companies.columns
+        ])
+        companies = companies.unique(subset="symbol", keep="first", maintain_order=True).sort("symbol")
+        self.symbol_dtype = pl.Enum(companies.get_column("symbol"))
+        self.table = companies.select([
+            pl.int_range(pl.len(), dtype=pl.UInt32).alias("symbol_id"),
+            "symbol",
+            *[pl.col(c).cast(pl.Categorical) for c in self.ATTRIBUTES],
+        ])
+
+    @classmethod
+    def empty(cls) -> "CompanyDimension":
+        return cls(pl.DataFrame(schema={"company_name": pl.Utf8, "symbol": pl.Utf8}))
+
+    @classmethod
+    def from_csv(cls, path: str = os.path.join(FIELDS_DIR, "companies.csv")) -> "CompanyDimension":
+        """Load companies.csv (all columns as text); a missing file gives an empty dimension"""
+        if not os.path.exists(path):
+            return cls.empty()
+        return cls(pl.read_csv(path, infer_schema=False))
+
+    def __len__(self) -> int:
+        return self.table.height
+
+    def encode(self, symbol: pl.Expr) -> pl.Expr:
+        """Symbol ids of a symbol column (null for symbols not in companies.csv)"""
+        return symbol.cast(self.symbol_dtype, strict=False).to_physical().cast(pl.UInt32)
+
+
+class FieldsPayloads:
+    """
+    /api/index-fields and /api/benchmark-risk-return payloads and the company dimension built from
+    the field CSV files. They are rebuilt when field_maker rewrites the files (checked with one stat
+    per file), so every other request is served from the prebuilt bytes and tables.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self.index_fields: Optional[Payload] = None
+        self.index_fields_without_companies: Optional[Payload] = None
+        self.benchmark_risk_return: Optional[Payload] = None
+        self.companies: CompanyIndex = CompanyIndex([])
+        self.dimension: CompanyDimension = CompanyDimension.empty()
+
+    def _current_fingerprint(self) -> Tuple:
+        fingerprint = []
+        for name in FIELDS_FILES:
+            try:
+                stat = os.stat(os.path.join(FIELDS_DIR, name))
+                fingerprint.append((name, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                fingerprint.append((name, None, None))
+        return tuple(fingerprint)
+
+    def refresh(self, force: bool = False) -> "FieldsPayloads":
+        fingerprint = self._current_fingerprint()
+        if not force and fingerprint == self._fingerprint:
+            return self
+        with self._lock:
+            if not force and fingerprint == self._fingerprint:
+                return self
+            # companies.csv is read once for the field list, the prefix search and the weight tables
+            dimension = CompanyDimension.from_csv()
+            fields = read_index_fields_from_csv(companies=dimension.records)
+            benchmark_risk_return = read_benchmark_risk_return_from_csv()
+            self.index_fields = Payload(fields)
+            self.index_fields_without_companies = Payload({**fields, "companies": []})
+            self.benchmark_risk_return = Payload(benchmark_risk_return) if benchmark_risk_return is not None else None
+            self.companies = CompanyIndex(fields["companies"])
+            self.dimension = dimension
+            self._fingerprint = fingerprint
+            print(f"✅ Index field payloads built: {len(fields['companies']):,} companies, "
+                  f"{len(self.index_fields.body) / 1e6:.2f} MB JSON, {len(self.index_fields.gzip_body) / 1e6:.2f} MB gzipped")
+        return self
+
+
+fields_payloads = FieldsPayloads()
@@ -1,124 +1,81 @@
-kpi_query ="""SELECT DISTINCT * FROM ( 
-        SELECT regexp_replace('gross_profit_margin_bound', '_bound$', '') AS kpi_name, gross_profit_margin_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE gross_profit_margin_bound IS NOT NULL UNION ALL SELECT regexp_replace('ebit_margin_bound', '_bound$', '') AS kpi_name, ebit_margin_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE ebit_margin_bound IS NOT NULL UNION ALL SELECT regexp_replace('ebitda_margin_bound', '_bound$', '') AS kpi_name, ebitda_margin_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE ebitda_margin_bound IS NOT NULL UNION ALL SELECT regexp_replace('operating_profit_margin_bound', '_bound$', '') AS kpi_name, operating_profit_margin_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE operating_profit_margin_bound IS NOT NULL UNION ALL SELECT regexp_replace('pretax_profit_margin_bound', '_bound$', '') AS kpi_name, pretax_profit_margin_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE pretax_profit_margin_bound IS NOT NULL UNION ALL SELECT regexp_replace('continuous_operations_profit_margin_bound', '_bound$', '') AS kpi_name, continuous_operations_profit_margin_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE continuous_operations_profit_margin_bound IS NOT NULL UNION ALL SELECT regexp_replace('net_profit_margin_bound', '_bound$', '') AS kpi_name, net_profit_margin_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE net_profit_margin_bound IS NOT NULL UNION ALL SELECT regexp_replace('bottom_line_profit_margin_bound', '_bound$', '') AS kpi_name, bottom_line_profit_margin_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE bottom_line_profit_margin_bound IS NOT NULL UNION ALL SELECT regexp_replace('current_ratio_bound', '_bound$', '') AS kpi_name, current_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE current_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('quick_ratio_bound', '_bound$', '') AS kpi_name, quick_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE quick_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('solvency_ratio_bound', '_bound$', '') AS kpi_name, solvency_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE solvency_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('cash_ratio_bound', '_bound$', '') AS kpi_name, cash_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE cash_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('receivables_turnover_bound', '_bound$', '') AS kpi_name, receivables_turnover_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE receivables_turnover_bound IS NOT NULL UNION ALL SELECT regexp_replace('payables_turnover_bound', '_bound$', '') AS kpi_name, payables_turnover_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE payables_turnover_bound IS NOT NULL UNION ALL SELECT regexp_replace('inventory_turnover_bound', '_bound$', '') AS kpi_name, inventory_turnover_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE inventory_turnover_bound IS NOT NULL UNION ALL SELECT regexp_replace('fixed_asset_turnover_bound', '_bound$', '') AS kpi_name, fixed_asset_turnover_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE fixed_asset_turnover_bound IS NOT NULL UNION ALL SELECT regexp_replace('asset_turnover_bound', '_bound$', '') AS kpi_name, asset_turnover_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE asset_turnover_bound IS NOT NULL UNION ALL SELECT regexp_replace('working_capital_turnover_ratio_bound', '_bound$', '') AS kpi_name, working_capital_turnover_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE working_capital_turnover_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('price_to_earnings_ratio_bound', '_bound$', '') AS kpi_name, price_to_earnings_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE price_to_earnings_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('price_to_earnings_growth_ratio_bound', '_bound$', '') AS kpi_name, price_to_earnings_growth_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE price_to_earnings_growth_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('forward_price_to_earnings_growth_ratio_bound', '_bound$', '') AS kpi_name, forward_price_to_earnings_growth_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE forward_price_to_earnings_growth_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('price_to_book_ratio_bound', '_bound$', '') AS kpi_name, price_to_book_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE price_to_book_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('price_to_sales_ratio_bound', '_bound$', '') AS kpi_name, price_to_sales_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE price_to_sales_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('price_to_free_cash_flow_ratio_bound', '_bound$', '') AS kpi_name, price_to_free_cash_flow_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE price_to_free_cash_flow_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('price_to_operating_cash_flow_ratio_bound', '_bound$', '') AS kpi_name, price_to_operating_cash_flow_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE price_to_operating_cash_flow_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('price_to_fair_value_bound', '_bound$', '') AS kpi_name, price_to_fair_value_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE price_to_fair_value_bound IS NOT NULL UNION ALL SELECT regexp_replace('debt_to_assets_ratio_bound', '_bound$', '') AS kpi_name, debt_to_assets_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE debt_to_assets_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('debt_to_equity_ratio_bound', '_bound$', '') AS kpi_name, debt_to_equity_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE debt_to_equity_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('debt_to_capital_ratio_bound', '_bound$', '') AS kpi_name, debt_to_capital_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE debt_to_capital_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('long_term_debt_to_capital_ratio_bound', '_bound$', '') AS kpi_name, long_term_debt_to_capital_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE long_term_debt_to_capital_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('financial_leverage_ratio_bound', '_bound$', '') AS kpi_name, financial_leverage_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE financial_leverage_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('debt_to_market_cap_bound', '_bound$', '') AS kpi_name, debt_to_market_cap_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE debt_to_market_cap_bound IS NOT NULL UNION ALL SELECT regexp_replace('operating_cash_flow_ratio_bound', '_bound$', '') AS kpi_name, operating_cash_flow_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE operating_cash_flow_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('operating_cash_flow_sales_ratio_bound', '_bound$', '') AS kpi_name, operating_cash_flow_sales_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE operating_cash_flow_sales_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('free_cash_flow_operating_cash_flow_ratio_bound', '_bound$', '') AS kpi_name, free_cash_flow_operating_cash_flow_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE free_cash_flow_operating_cash_flow_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('debt_service_coverage_ratio_bound', '_bound$', '') AS kpi_name, debt_service_coverage_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE debt_service_coverage_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('interest_coverage_ratio_bound', '_bound$', '') AS kpi_name, interest_coverage_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE interest_coverage_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('short_term_operating_cash_flow_coverage_ratio_bound', '_bound$', '') AS kpi_name, short_term_operating_cash_flow_coverage_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE short_term_operating_cash_flow_coverage_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('operating_cash_flow_coverage_ratio_bound', '_bound$', '') AS kpi_name, operating_cash_flow_coverage_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE operating_cash_flow_coverage_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('capital_expenditure_coverage_ratio_bound', '_bound$', '') AS kpi_name, capital_expenditure_coverage_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE capital_expenditure_coverage_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('dividend_paid_and_capex_coverage_ratio_bound', '_bound$', '') AS kpi_name, dividend_paid_and_capex_coverage_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE dividend_paid_and_capex_coverage_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('dividend_payout_ratio_bound', '_bound$', '') AS kpi_name, dividend_payout_ratio_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE dividend_payout_ratio_bound IS NOT NULL UNION ALL SELECT regexp_replace('dividend_yield_bound', '_bound$', '') AS kpi_name, dividend_yield_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE dividend_yield_bound IS NOT NULL UNION ALL SELECT regexp_replace('dividend_yield_percentage_bound', '_bound$', '') AS kpi_name, dividend_yield_percentage_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE dividend_yield_percentage_bound IS NOT NULL UNION ALL SELECT regexp_replace('dividend_per_share_bound', '_bound$', '') AS kpi_name, dividend_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE dividend_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('revenue_per_share_bound', '_bound$', '') AS kpi_name, revenue_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE revenue_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('net_income_per_share_bound', '_bound$', '') AS kpi_name, net_income_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE net_income_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('interest_debt_per_share_bound', '_bound$', '') AS kpi_name, interest_debt_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE interest_debt_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('cash_per_share_bound', '_bound$', '') AS kpi_name, cash_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE cash_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('book_value_per_share_bound', '_bound$', '') AS kpi_name, book_value_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE book_value_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('tangible_book_value_per_share_bound', '_bound$', '') AS kpi_name, tangible_book_value_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE tangible_book_value_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('shareholders_equity_per_share_bound', '_bound$', '') AS kpi_name, shareholders_equity_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE shareholders_equity_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('operating_cash_flow_per_share_bound', '_bound$', '') AS kpi_name, operating_cash_flow_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE operating_cash_flow_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('capex_per_share_bound', '_bound$', '') AS kpi_name, capex_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE capex_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('free_cash_flow_per_share_bound', '_bound$', '') AS kpi_name, free_cash_flow_per_share_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE free_cash_flow_per_share_bound IS NOT NULL UNION ALL SELECT regexp_replace('net_income_per_ebt_bound', '_bound$', '') AS kpi_name, net_income_per_ebt_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE net_income_per_ebt_bound IS NOT NULL UNION ALL SELECT regexp_replace('ebt_per_ebit_bound', '_bound$', '') AS kpi_name, ebt_per_ebit_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE ebt_per_ebit_bound IS NOT NULL UNION ALL SELECT regexp_replace('effective_tax_rate_bound', '_bound$', '') AS kpi_name, effective_tax_rate_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE effective_tax_rate_bound IS NOT NULL UNION ALL SELECT regexp_replace('enterprise_value_multiple_bound', '_bound$', '') AS kpi_name, enterprise_value_multiple_bound AS kpi_value 
-        FROM clean.financial_metrics_perc 
-        WHERE enterprise_value_multiple_bound IS NOT NULL
-        ) t
+# KPIs with percentile buckets in clean.financial_metrics_perc (one <kpi>_bound column each)
+kpi_names = [
+    "gross_profit_margin",
+    "ebit_margin",
+    "ebitda_margin",
+    "operating_profit_margin",
+    "pretax_profit_margin",
+    "continuous_operations_profit_margin",
+    "net_profit_margin",
+    "bottom_line_profit_margin",
+    "current_ratio",
+    "quick_ratio",
+    "solvency_ratio",
+    "cash_ratio",
+    "receivables_turnover",
+    "payables_turnover",
+    "inventory_turnover",
+    "fixed_asset_turnover",
+    "asset_turnover",
+    "working_capital_turnover_ratio",
+    "price_to_earnings_ratio",
+    "price_to_earnings_growth_ratio",
+    "forward_price_to_earnings_growth_ratio",
+    "price_to_book_ratio",
+    "price_to_sales_ratio",
+    "price_to_free_cash_flow_ratio",
+    "price_to_operating_cash_flow_ratio",
+    "price_to_fair_value",
+    "debt_to_assets_ratio",
+    "debt_to_equity_ratio",
+    "debt_to_capital_ratio",
+    "long_term_debt_to_capital_ratio",
+    "financial_leverage_ratio",
+    "debt_to_market_cap",
+    "operating_cash_flow_ratio",
+    "operating_cash_flow_sales_ratio",
+    "free_cash_flow_operating_cash_flow_ratio",
+    "debt_service_coverage_ratio",
+    "interest_coverage_ratio",
+    "short_term_operating_cash_flow_coverage_ratio",
+    "operating_cash_flow_coverage_ratio",
+    "capital_expenditure_coverage_ratio",
+    "dividend_paid_and_capex_coverage_ratio",
+    "dividend_payout_ratio",
+    "dividend_yield",
+    "dividend_yield_percentage",
+    "dividend_per_share",
+    "revenue_per_share",
+    "net_income_per_share",
+    "interest_debt_per_share",
+    "cash_per_share",
+    "book_value_per_share",
+    "tangible_book_value_per_share",
+    "shareholders_equity_per_share",
+    "operating_cash_flow_per_share",
+    "capex_per_share",
+    "free_cash_flow_per_share",
+    "net_income_per_ebt",
+    "ebt_per_ebit",
+    "effective_tax_rate",
+    "enterprise_value_multiple",
+]
+
+# Bucket catalogue written by the ETL's PercentileCalculator
+kpi_buckets_query = """
+        SELECT kpi_name, kpi_value
+        FROM clean.kpi_buckets
+        ORDER BY kpi_name, kpi_value;
+        """
+
+# Same catalogue unpivoted from clean.financial_metrics_perc in one scan, for databases without clean.kpi_buckets
+kpi_query = """
+        SELECT DISTINCT v.kpi_name, v.kpi_value
+        FROM clean.financial_metrics_perc fmp
+        CROSS JOIN LATERAL (VALUES
+            """ + ",\n            ".join(f"('{kpi}', fmp.{kpi}_bound)" for kpi in kpi_names) + """
+        ) AS v(kpi_name, kpi_value)
+        WHERE v.kpi_value IS NOT NULL
         ORDER BY kpi_name, kpi_value;
         """
 
@@ -0,0 +1,242 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+STAGE_TIMING_BUCKETS = [
+    float(b) for b in os.getenv(
+        "STAGE_TIMING_BUCKETS", "0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30"
+    ).split(",")
+]
+
+
+# Interval (seconds) at which the resident memory is sampled while stages run
+STAGE_RSS_SAMPLE_SECONDS = float(os.getenv("STAGE_RSS_SAMPLE_SECONDS", "0.01"))
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Highest resident memory of the process since it started (its high-water mark), in MB"""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident memory of the process right now, in MB (Linux only)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * PAGE_SIZE / 1024 / 1024, 1)
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class Stage:
+    """
+    One timed stage: duration, rows it produced (if set) and the highest resident memory of the
+    process while it ran (sampled, so it includes stages running on other threads at the time)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.rows: Optional[int] = None
+        self.peak_rss_mb: Optional[float] = None
+
+    def observe_rss(self, rss_mb: Optional[float]):
+        if rss_mb is not None and (self.peak_rss_mb is None or rss_mb > self.peak_rss_mb):
+            self.peak_rss_mb = rss_mb
+
+    def __str__(self) -> str:
+        rows = f", {self.rows:,} rows" if self.rows is not None else ""
+        peak = f", RSS peak {self.peak_rss_mb} MB" if self.peak_rss_mb is not None else ""
+        return f"{self.name} {self.seconds * 1000:.1f} ms{rows}{peak}"
+
+
+class RssSampler:
+    """
+    Samples the resident memory on a background thread while any stage is open and records the
+    highest value on each open stage. The thread only runs while stages are open.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stages: List[Stage] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def open(self, stage: Stage):
+        stage.observe_rss(current_rss_mb())
+        with self._lock:
+            self._stages.append(stage)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+                self._thread.start()
+
+    def close(self, stage: Stage):
+        stage.observe_rss(current_rss_mb())
+        with self._lock:
+            self._stages.remove(stage)
+
+    def _run(self):
+        while True:
+            rss = current_rss_mb()
+            with self._lock:
+                if not self._stages:
+                    self._thread = None
+                    return
+                for stage in self._stages:
+                    stage.observe_rss(rss)
+            time.sleep(self.interval)
+
+
+rss_sampler = RssSampler(STAGE_RSS_SAMPLE_SECONDS)
+
+
+class RequestTimings:
+    """
+    Stages of one request, in the order they ran.
+    A listener (e.g. a streaming response) is called with an event for every finished stage and
+    every progress report, on the thread that ran the stage.
+    """
+
+    def __init__(self, listener: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.stages: List[Stage] = []
+        self.listener = listener
+        self._lock = threading.Lock()
+
+    def add(self, stage: Stage):
+        with self._lock:
+            self.stages.append(stage)
+        if self.listener is not None:
+            self.listener({"event": "stage", "stage": stage.name, "ms": round(stage.seconds * 1000, 1), "rows": stage.rows})
+
+    def extend(self, stages: List[Stage]):
+        """Add stages recorded by other timings, e.g. those of a build shared with other requests"""
+        with self._lock:
+            self.stages.extend(stages)
+
+    @contextmanager
+    def activate(self):
+        """Record the stages run by this thread (e.g. an index worker) into these timings"""
+        token = _current_timings.set(self)
+        try:
+            yield self
+        finally:
+            _current_timings.reset(token)
+
+    def totals(self) -> Dict[str, float]:
+        """Seconds per stage name (a stage that ran several times is summed), in first-run order"""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for stage in self.stages:
+                totals[stage.name] = totals.get(stage.name, 0.0) + stage.seconds
+        return totals
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. `sql;dur=812.4, panel;dur=95.1`"""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.totals().items())
+
+    def summary(self) -> str:
+        """Summary of the stages (see stages_summary)"""
+        with self._lock:
+            return stages_summary(self.stages)
+
+
+def stages_summary(stages: List[Stage]) -> str:
+    """One line per stage with its duration, row count and the resident memory peak while it ran"""
+    return "\n".join(f"   • {stage}" for stage in stages)
+
+
+_current_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("request_timings", default=None)
+
+
+class StageHistograms:
+    """Cumulative duration histograms and row counters per stage, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = sorted(buckets)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, List[int]] = {}
+        self._sums: Dict[str, float] = {}
+        self._rows: Dict[str, int] = {}
+
+    def observe(self, stage: Stage):
+        with self._lock:
+            counts = self._counts.setdefault(stage.name, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if stage.seconds <= bound:
+                    counts[i] += 1
+            counts[-1] += 1  # +Inf
+            self._sums[stage.name] = self._sums.get(stage.name, 0.0) + stage.seconds
+            if stage.rows is not None:
+                self._rows[stage.name] = self._rows.get(stage.name, 0) + stage.rows
+
+    def render(self) -> str:
+        lines = [
+            "# HELP stock_service_stage_seconds Duration of the index build stages",
+            "# TYPE stock_service_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name in sorted(self._counts):
+                counts = self._counts[name]
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'stock_service_stage_seconds_bucket{{stage="{name}",le="{bound:g}"}} {count}')
+                lines.append(f'stock_service_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {counts[-1]}')
+                lines.append(f'stock_service_stage_seconds_sum{{stage="{name}"}} {self._sums[name]:.6f}')
+                lines.append(f'stock_service_stage_seconds_count{{stage="{name}"}} {counts[-1]}')
+            lines += [
+                "# HELP stock_service_stage_rows_total Rows produced by the index build stages",
+                "# TYPE stock_service_stage_rows_total counter",
+            ]
+            for name in sorted(self._rows):
+                lines.append(f'stock_service_stage_rows_total{{stage="{name}"}} {self._rows[name]}')
+        peak = peak_rss_mb()
+        if peak is not None:
+            lines += [
+                "# HELP stock_service_peak_rss_bytes Peak resident memory of the process since it started",
+                "# TYPE stock_service_peak_rss_bytes gauge",
+                f"stock_service_peak_rss_bytes {int(peak * 1024 * 1024)}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+stage_histograms = StageHistograms(STAGE_TIMING_BUCKETS)
+
+
+@contextmanager
+def timed_stage(name: str):
+    """
+    Time a stage of the index build. Set `.rows` on the yielded stage to record its row count.
+    Every stage feeds the /metrics histograms; stages run while a RequestTimings is active
+    are also reported in that request's Server-Timing header.
+    """
+    stage = Stage(name)
+    rss_sampler.open(stage)
+    start = time.perf_counter()
+    try:
+        yield stage
+    finally:
+        stage.seconds = time.perf_counter() - start
+        rss_sampler.close(stage)
+        stage_histograms.observe(stage)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(stage)
+
+
+def report_progress(stage: str, done: int, total: int, **details):
+    """Report the progress of a running stage to the listener of the active request timings, if any"""
+    timings = _current_timings.get()
+    if timings is not None and timings.listener is not None:
+        timings.listener({"event": "progress", "stage": stage, "done": done, "total": total, **details})
@@ -1,12 +1,23 @@
 import os
-import io
 import time
-import psycopg2
 import polars as pl
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import logging
-from sqlalchemy import create_engine
+import threading
+import adbc_driver_postgresql.dbapi as adbc_postgresql
+from contextlib import contextmanager
+from typing import Dict, Optional
+from urllib.parse import quote_plus
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
+from .stage_timing import timed_stage
+
+# Connection checkouts and queries are logged at debug level (the SQL text included)
+logger = logging.getLogger(__name__)
 
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
 # Try production env first, fall back to local if it doesn't exist
@@ -25,179 +36,206 @@ POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
 POSTGRES_HOST = os.getenv("POSTGRES_HOST")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT")
 
-def get_remote_postgres_connection():
-    """Get a direct PostgreSQL connection to the remote database"""
-    return psycopg2.connect(
-        dbname=POSTGRES_DB,
-        user=POSTGRES_USER,
-        password=POSTGRES_PASSWORD,
-        host=POSTGRES_HOST,
-        port=POSTGRES_PORT
-    )
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
 
-def get_sqlalchemy_engine():
-    """SQLAlchemy engine (recommended for Pandas queries)"""
-    db_url = (
-        f"postgresql+psycopg2://{POSTGRES_USER}:"
-        f"{POSTGRES_PASSWORD}@{POSTGRES_HOST}:"
-        f"{POSTGRES_PORT}/{POSTGRES_DB}"
-    )
-    logging.info(db_url)
-    return create_engine(db_url)
+_engine = None
+_engine_lock = threading.Lock()
 
 
-def run_query(query: str) -> pd.DataFrame:
-    """Execute a SQL query and return a Pandas DataFrame using SQLAlchemy"""
-    engine = get_sqlalchemy_engine()
-
+def get_sqlalchemy_engine():
+    """
+    Process-wide SQLAlchemy engine (recommended for Pandas queries).
+    Its connection pool is shared by all query helpers: at most DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW
+    connections are opened, and connections are pinged before use so dropped ones are replaced.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                db_url = (
+                    f"postgresql+psycopg2://{POSTGRES_USER}:"
+                    f"{POSTGRES_PASSWORD}@{POSTGRES_HOST}:"
+                    f"{POSTGRES_PORT}/{POSTGRES_DB}"
+                )
+                _engine = create_engine(
+                    db_url,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_POOL_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=True,
+                )
+                logging.info(f"Created database pool for {POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}")
+    return _engine
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Check out a raw psycopg2 connection from the shared pool and return it when done.
+    The pool rolls the connection back on return, so session settings made inside the
+    transaction (e.g. SET enable_mergejoin) don't leak into later requests.
+    """
     start = time.time()
-    df = pd.read_sql_query(query, engine)
-    duration = round(time.time() - start, 2)
-    print(f"✅ Query + fetch duration: {duration} seconds")
-    return df
-
-
-########################################################
-########################################################
-########################################################
+    conn = get_sqlalchemy_engine().raw_connection()
+    logger.debug("DB connection checked out in %.1f ms", (time.time() - start) * 1000)
+    try:
+        yield conn
+    finally:
+        conn.close()
 
 
-def run_query_to_polars_simple(query):
-    print(f"QUERY: {query}")
+_arrow_pool = None
+_arrow_pool_lock = threading.Lock()
 
-    print(f"STARTING QUERY at {time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-    conn = get_remote_postgres_connection()
-    cur = conn.cursor()  # ❌ no server-side name
-    cur.execute(query)
+def _connect_arrow():
+    uri = (
+        f"postgresql://{quote_plus(POSTGRES_USER or '')}:"
+        f"{quote_plus(POSTGRES_PASSWORD or '')}@{POSTGRES_HOST}:"
+        f"{POSTGRES_PORT}/{POSTGRES_DB}"
+    )
+    return adbc_postgresql.connect(uri)
+
+
+def _ping_arrow_connection(dbapi_connection, connection_record, connection_proxy):
+    """Health check on checkout: a connection that no longer answers is replaced by a new one"""
+    cur = dbapi_connection.cursor()
+    try:
+        cur.execute("SELECT 1")
+        cur.fetchall()
+    except Exception as e:
+        raise DisconnectionError() from e
+    finally:
+        cur.close()
 
-    print(f"QUERY EXECUTED at {time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-    if cur.description is None:
-        print("⚠️ Query ran, but returned no result set.")
-        cur.close()
+def get_arrow_pool() -> QueuePool:
+    """
+    Process-wide pool of ADBC (Arrow-native) connections used by run_query_to_polars.
+    Sized like the SQLAlchemy pool; connections are rolled back when returned.
+    """
+    global _arrow_pool
+    if _arrow_pool is None:
+        with _arrow_pool_lock:
+            if _arrow_pool is None:
+                _arrow_pool = QueuePool(
+                    _connect_arrow,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_POOL_MAX_OVERFLOW,
+                    timeout=DB_POOL_TIMEOUT,
+                    recycle=DB_POOL_RECYCLE,
+                )
+                event.listen(_arrow_pool, "checkout", _ping_arrow_connection)
+    return _arrow_pool
+
+
+@contextmanager
+def pooled_arrow_connection():
+    """Check out an ADBC connection from the shared Arrow pool and return it when done"""
+    start = time.time()
+    conn = get_arrow_pool().connect()
+    logger.debug("Arrow DB connection checked out in %.1f ms", (time.time() - start) * 1000)
+    try:
+        yield conn
+    finally:
         conn.close()
-        return pl.DataFrame()
-
-    columns = [desc[0] for desc in cur.description]
-    rows = cur.fetchall()
-
-    cur.close()
-    conn.close()
-
-    if rows:
-        # Process rows in batches of 50000
-        batch_size = 10000
-        dfs = []
-
-        for i in range(0, len(rows), batch_size):
-            batch = rows[i:i + batch_size]
-            df_batch = pl.DataFrame(batch, schema=columns, orient="row")
-            dfs.append(df_batch)
-            print(f"✅ Loaded batch {i//batch_size + 1} with {len(batch):,} rows")
-            
-        if dfs:
-            df = pl.concat(dfs)
-            print(f"✅ Total rows loaded into Polars: {df.shape[0]:,}")
-            return df
-        else:
-            print("⚠️ Query returned zero rows.")
-            return pl.DataFrame()
-    
-########################################################
-########################################################
-########################################################
-
-def run_query_to_polars_simple1(query: str) -> pl.DataFrame:
-    print(f"⏳ Running query via COPY TO STDOUT {time.strftime('%Y-%m-%d %H:%M:%S')}")
 
-    conn = get_remote_postgres_connection()
-    cur = conn.cursor()
 
-    csv_buffer = io.StringIO()
-    copy_query = f"COPY ({query}) TO STDOUT WITH CSV HEADER"
-    cur.copy_expert(copy_query, csv_buffer)
+def _pool_status(pool) -> dict:
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_connections": DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW,
+    }
 
-    cur.close()
-    conn.close()
 
-    csv_buffer.seek(0)
-    df = pl.read_csv(csv_buffer)
-    print(f"✅ Loaded {df.shape[0]:,} rows into Polars via COPY {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    return df
+def get_pool_status() -> dict:
+    """Current usage of the shared connection pools"""
+    return {
+        "sqlalchemy": _pool_status(get_sqlalchemy_engine().pool),
+        "arrow": _pool_status(get_arrow_pool()),
+    }
 
-    
 
-########################################################
-########################################################
-########################################################
+def run_query(query: str) -> pd.DataFrame:
+    """Execute a SQL query and return a Pandas DataFrame using SQLAlchemy"""
+    engine = get_sqlalchemy_engine()
 
-def run_query_to_polars_simple2(query: str) -> pl.DataFrame:
-    print(f"QUERY: {query}")
-    print(f"⏳ STARTING QUERY at {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    start = time.time()
+    with engine.connect() as conn:
+        logger.debug("DB connection checked out in %.1f ms", (time.time() - start) * 1000)
+        df = pd.read_sql_query(query, conn)
+    logger.debug("Query + fetch duration: %.2f seconds", time.time() - start)
+    return df
 
-    conn = get_remote_postgres_connection()
-    cur = conn.cursor(name='my_cursor')  # server-side streaming
-    cur.itersize = 50_000
-    cur.execute(query)
 
-    batch = cur.fetchmany(50_000)
-    if not batch:
-        cur.close()
-        conn.close()
-        print("⚠️ Query returned zero rows.")
-        return pl.DataFrame()
-
-    columns = [desc[0] for desc in cur.description]
-    all_rows = list(batch)
-    total_rows = len(batch)
-    batch_num = 1
-    print(f"✅ Loaded batch {batch_num} with {len(batch):,} rows")
-
-    while True:
-        batch = cur.fetchmany(50_000)
-        if not batch:
-            break
-        all_rows.extend(batch)
-        total_rows += len(batch)
-        batch_num += 1
-        print(f"✅ Loaded batch {batch_num} with {len(batch):,} rows")
-
-    cur.close()
-    conn.close()
-
-    print("📦 Converting to Polars...")
-    df = pl.DataFrame(all_rows, schema=columns, orient="row")
-    print(f"✅ Done: {df.shape[0]:,} rows loaded into Polars")
-    return df
+def get_etl_version():
+    """Timestamp of the last completed ETL run (raw.etl_summary is written as its final step)"""
+    df = run_query("SELECT MAX(created_at) AS created_at FROM raw.etl_summary")
+    if df.empty or pd.isna(df["created_at"].iloc[0]):
+        return None
+    return df["created_at"].iloc[0].to_pydatetime()
 
 
 ########################################################
 ########################################################
 ########################################################
 
-def run_query_debug(query: str):
-    print("🔌 Connecting to DB...")
-    t0 = time.time()
-    conn = get_remote_postgres_connection()
-    cur = conn.cursor()
-    print(f"✅ Connection established in {time.time() - t0:.2f}s")
-
-    print("📤 Running COPY TO STDOUT...")
-    t1 = time.time()
-    buffer = io.StringIO()
-    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", buffer)
-    t2 = time.time()
-    print(f"✅ COPY to buffer done in {t2 - t1:.2f}s")
-
-    print("📥 Loading into Polars...")
-    buffer.seek(0)
-    df = pl.read_csv(buffer)
-    print(f"Number of rows: {df.shape[0]:,}")
-    t3 = time.time()
-    print(f"✅ Polars parsing done in {t3 - t2:.2f}s")
-    print(f"🏁 Total: {t3 - t0:.2f}s")
-
-    cur.close()
-    conn.close()
-    return df
\ No newline at end of file
+POSTGRES_TYPNAME = b"ADBC:postgresql:typname"
+
+
+def _decode_postgres_types(table: pa.Table) -> pa.Table:
+    """
+    Make an Arrow table from the ADBC driver loadable by Polars.
+    NUMERIC columns arrive as opaque strings and are decoded to float64 with one vectorized
+    cast per column; other opaque (unknown to Arrow) types are kept as strings.
+    """
+    columns = []
+    for field, column in zip(table.schema, table.columns):
+        if isinstance(field.type, pa.BaseExtensionType):
+            column = pa.chunked_array([chunk.storage for chunk in column.chunks], type=field.type.storage_type)
+        typname = (field.metadata or {}).get(POSTGRES_TYPNAME)
+        if typname == b"numeric" or pa.types.is_decimal(column.type):
+            column = pc.cast(column, pa.float64())
+        columns.append(column)
+    return pa.table(columns, names=table.column_names)
+
+
+def run_query_to_polars(query: str, settings: Optional[Dict[str, str]] = None) -> pl.DataFrame:
+    """
+    Execute a SELECT and return a Polars DataFrame.
+
+    The ADBC PostgreSQL driver streams the result with binary COPY straight into Arrow
+    columns, so no Python object is created per cell and Polars takes the columns over
+    without copying. NUMERIC columns are decoded to Float64. `settings` are applied
+    with SET for this query only (the connection is rolled back when returned to the pool).
+    """
+    logger.debug("Query: %s", query)
+    start = time.time()
+
+    with pooled_arrow_connection() as conn:
+        cur = conn.cursor()
+        try:
+            for name, value in (settings or {}).items():
+                cur.execute(f"SET {name} = {value}")
+            with timed_stage("sql"):
+                cur.execute(query)
+            with timed_stage("fetch") as stage:
+                table = cur.fetch_arrow_table()
+                stage.rows = table.num_rows
+        finally:
+            cur.close()
+    fetched = time.time()
+
+    with timed_stage("dataframe") as stage:
+        df = pl.from_arrow(_decode_postgres_types(table))
+        stage.rows = df.height
+    logger.debug("Loaded %s rows into Polars: query + fetch %.2fs, conversion %.2fs",
+                 f"{df.height:,}", fetched - start, time.time() - fetched)
+    return df
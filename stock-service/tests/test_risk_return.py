@@ -0,0 +1,78 @@
+import unittest
+import polars as pl
+from datetime import date
+from src.index_maker.engine_benchmark import synthetic_index_rows
+from src.index_maker.index_maker import create_custom_index, make_index, trim_index, data_window
+
+
+def baseline_risk_return(df: pl.DataFrame):
+    """calculate_risk_return as it was before the date window was pushed into the data load"""
+    if df.is_empty():
+        return {"return": 0.0, "risk": 0.0}
+    df = df.sort("date", descending=True)
+    values = df.get_column("index_value").to_list()
+    dates = df.get_column("date").to_list()
+    if (dates[0] - dates[-1]).days < 5 * 250:
+        return {"return": 0.0, "risk": 0.0}
+
+    returns = [values[i] / values[i + 250] - 1 for i in range(len(values) - 250)]
+    avg_return = sum(returns) / len(returns) if returns else 0.0
+    neg_returns = [r for r in returns if r < 0]
+    risk = 0.0
+    if neg_returns:
+        mean = sum(neg_returns) / len(neg_returns)
+        risk = (sum((r - mean) ** 2 for r in neg_returns) / len(neg_returns)) ** 0.5
+    return {"return": round(float(avg_return), 4), "risk": round(float(risk), 4)}
+
+
+class ShortWindowRiskReturnTest(unittest.TestCase):
+    """Windows shorter than 5 * 250 days report the risk/return of the full history, as before"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rows = synthetic_index_rows(symbols=30, years=8)
+        cls.windows = []
+
+    def select(self, start_date=None, end_date=None, **_):
+        """Rows of the window, like make_query and the market panel return them"""
+        self.windows.append((start_date, end_date))
+        rows = self.rows
+        if start_date is not None:
+            rows = rows.filter(pl.col("date") >= start_date)
+        if end_date is not None:
+            rows = rows.filter(pl.col("date") <= end_date)
+        return rows
+
+    def build(self, start_date, end_date):
+        return create_custom_index(
+            index_size=30, currency="EUR", start_amount=1000, start_date=start_date, end_date=end_date,
+            countries=[], sectors=[], industries=[], kpis={}, stocks=[], weight="cap", data_source=self.select,
+        )
+
+    def test_short_window_matches_baseline(self):
+        full_index = make_index(self.rows, "EUR", "cap")
+        expected = baseline_risk_return(full_index)
+        self.assertNotEqual(expected, {"return": 0.0, "risk": 0.0})
+
+        for start_date, end_date in [("2019-01-01", "2020-06-30"), ("2016-03-15", "2017-03-15"), ("2020-01-01", "2021-09-30")]:
+            with self.subTest(window=(start_date, end_date)):
+                result = self.build(start_date, end_date)
+                self.assertEqual(result["risk_return"], expected)
+                self.assertEqual(data_window(start_date, end_date), (None, None))
+
+                # The index values of the window are unchanged too
+                expected_index = trim_index(full_index, 1000, start_date, end_date)
+                index_df = pl.DataFrame(result["index_df"]).with_columns(pl.col("date").cast(pl.Date))
+                self.assertEqual(index_df.get_column("date").to_list(), expected_index.get_column("date").to_list())
+                for value, expected_value in zip(index_df.get_column("index_value"), expected_index.get_column("index_value")):
+                    self.assertAlmostEqual(value, expected_value, places=6)
+
+    def test_long_window_is_fetched_narrowed(self):
+        self.windows.clear()
+        result = self.build("2015-06-01", "2021-06-30")
+        self.assertEqual(self.windows, [(date(2014, 1, 1), date(2021, 6, 30))])
+        self.assertNotEqual(result["risk_return"], {"return": 0.0, "risk": 0.0})
+
+
+if __name__ == "__main__":
+    unittest.main()